@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -108,6 +109,16 @@ if DB_ENGINE == 'django.db.backends.sqlite3':
         'default': {
             'ENGINE': DB_ENGINE,
             'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Toma el lock de escritura al iniciar la transacción para que
+                # las escrituras concurrentes esperen en lugar de fallar
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            'TEST': {
+                # Base de pruebas en archivo: permite pruebas con varios hilos
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
         }
     }
 else:
@@ -165,6 +176,58 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Las subidas de más de 256KB van a un archivo temporal en vez de a memoria
+# (por defecto Django guarda hasta 2.5MB por archivo en RAM)
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# Procesos del pool compartido de segundo plano (PDF de facturas, miniaturas
+# de comprobantes y campañas de puntos). Cada uno es un intérprete con Django
+# completo por cada proceso del servidor web (0 = en el mismo proceso)
+SEGUNDO_PLANO_WORKERS = int(os.environ.get('SEGUNDO_PLANO_WORKERS', 2))
+
+# ============================================
+# Caché
+# ============================================
+
+# Con varios procesos de servidor la caché debe ser compartida para que la
+# versión del catálogo se invalide en todos a la vez: se activa indicando
+# CACHE_DIR (o Redis, abajo). Sin él cada proceso usa su propia memoria.
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'streampoint',
+        }
+    }
+
+# Los tests usan su propia caché en memoria: nada se comparte con el
+# servidor de desarrollo ni entre corridas
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'streampoint-tests',
+        }
+    }
+
+# Para producción, usar Redis:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379'),
+#     }
+# }
+
+# Segundos que vive una página o fragmento del catálogo (los cambios lo invalidan antes)
+CATALOGO_CACHE_TIMEOUT = 60 * 60 * 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -191,6 +254,9 @@ SESSION_SAVE_EVERY_REQUEST = False
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'StreamPoint <noreply@streampoint.com>'
 
+# URL pública del sitio, usada en los enlaces de los correos enviados por comandos
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
 # Para producción, usar SMTP real:
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 # EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
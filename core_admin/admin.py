@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CorreoVerificado
+from .models import CorreoVerificado, CampanaPuntos
 from core_user.models import Suscripcion, PerfilUsuario, Factura
 
 # Registrar modelos en el admin de Django
@@ -19,3 +19,10 @@ class FacturaAdmin(admin.ModelAdmin):
     readonly_fields = ['numero_factura', 'fecha_creacion']
     ordering = ['-fecha_creacion']
 
+
+@admin.register(CampanaPuntos)
+class CampanaPuntosAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'puntos', 'estado', 'perfiles_procesados', 'fecha_creacion', 'fecha_fin']
+    list_filter = ['estado', 'servicio']
+    search_fields = ['nombre']
+    readonly_fields = ['estado', 'ultimo_perfil_id', 'perfiles_procesados', 'fecha_creacion', 'fecha_inicio', 'fecha_fin']
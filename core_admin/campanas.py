@@ -0,0 +1,113 @@
+# ============================================
+# core_admin/campanas.py
+# Motor de campañas masivas de puntos
+# ============================================
+"""
+Ejecuta una CampanaPuntos por lotes de perfiles ordenados por ID.
+
+Cada lote se aplica en una sola transacción: un UPDATE sobre los perfiles,
+un bulk_create de sus transacciones y el avance de `ultimo_perfil_id`.
+Si el proceso se interrumpe, al reanudar se continúa desde el último lote
+confirmado sin acreditar dos veces a nadie.
+
+Desde el panel la campaña se encola en un pool de procesos
+(`programar_campana`) y la página solo muestra su avance; el comando
+`ejecutar_campana` la corre o reanuda desde la consola.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from core_user import segundo_plano
+from core_user.models import PerfilUsuario, Suscripcion
+from core_user.puntos import acreditar_puntos_lote
+from .models import CampanaPuntos
+
+logger = logging.getLogger(__name__)
+
+
+class CampanaEnCurso(Exception):
+    """Otro proceso avanzó la misma campaña mientras se procesaba un lote"""
+
+
+def perfiles_objetivo(campana):
+    """Perfiles que cumplen los filtros de la campaña"""
+    perfiles = PerfilUsuario.objects.all()
+
+    if campana.registrados_desde:
+        perfiles = perfiles.filter(fecha_registro__date__gte=campana.registrados_desde)
+
+    if campana.servicio_id or campana.solo_suscripcion_activa:
+        activas = Suscripcion.objects.filter(usuario_id=OuterRef('user_id'), estado='activa')
+        if campana.servicio_id:
+            activas = activas.filter(plan__servicio_id=campana.servicio_id)
+        perfiles = perfiles.filter(Exists(activas))
+
+    return perfiles
+
+
+def ejecutar_campana(campana, tamano_lote=1000, progreso=None):
+    """
+    Procesa la campaña desde su último lote confirmado hasta el final.
+    `progreso(campana)` se invoca tras cada lote. Retorna perfiles acreditados.
+    """
+    if campana.estado == 'completada':
+        return 0
+
+    if campana.estado == 'pendiente':
+        CampanaPuntos.objects.filter(pk=campana.pk).update(
+            estado='en_proceso',
+            fecha_inicio=timezone.now()
+        )
+        campana.estado = 'en_proceso'
+
+    objetivo = perfiles_objetivo(campana).order_by('id').values_list('id', flat=True)
+    descripcion = f'Campaña: {campana.nombre}'
+    acreditados = 0
+
+    while True:
+        perfil_ids = list(objetivo.filter(id__gt=campana.ultimo_perfil_id)[:tamano_lote])
+        if not perfil_ids:
+            break
+
+        with transaction.atomic():
+            # Avance condicional: si otro proceso ya tomó este lote, no se acredita
+            avanzada = CampanaPuntos.objects.filter(
+                pk=campana.pk,
+                ultimo_perfil_id=campana.ultimo_perfil_id
+            ).update(
+                ultimo_perfil_id=perfil_ids[-1],
+                perfiles_procesados=F('perfiles_procesados') + len(perfil_ids)
+            )
+            if not avanzada:
+                raise CampanaEnCurso(f'La campaña {campana.pk} está siendo procesada por otro proceso')
+
+            acreditar_puntos_lote(perfil_ids, campana.puntos, descripcion)
+
+        campana.ultimo_perfil_id = perfil_ids[-1]
+        campana.perfiles_procesados += len(perfil_ids)
+        acreditados += len(perfil_ids)
+        if progreso:
+            progreso(campana)
+
+    campana.estado = 'completada'
+    campana.fecha_fin = timezone.now()
+    campana.save(update_fields=['estado', 'fecha_fin'])
+    return acreditados
+
+
+def procesar_campana(campana_id):
+    """Trabajo de un worker: ejecuta (o reanuda) la campaña indicada"""
+    campana = CampanaPuntos.objects.get(pk=campana_id)
+    try:
+        return ejecutar_campana(campana)
+    except CampanaEnCurso:
+        # Otro worker (o el comando) ya la está procesando
+        logger.info('La campaña %s ya se está ejecutando en otro proceso', campana_id)
+        return 0
+
+
+def programar_campana(campana):
+    """Encarga la campaña al pool de procesos cuando la transacción actual confirme"""
+    segundo_plano.encolar('ejecutando una campaña de puntos', procesar_campana, campana.pk)
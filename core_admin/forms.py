@@ -0,0 +1,33 @@
+from django import forms
+from core_public.models import ServicioStreaming
+from .models import CampanaPuntos
+
+
+class CampanaPuntosForm(forms.ModelForm):
+    """
+    Formulario para crear campañas masivas de puntos desde el panel.
+    """
+    puntos = forms.IntegerField(min_value=1, label='Puntos por usuario')
+
+    class Meta:
+        model = CampanaPuntos
+        fields = ['nombre', 'puntos', 'servicio', 'solo_suscripcion_activa', 'registrados_desde']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['servicio'].queryset = ServicioStreaming.objects.filter(activo=True)
+
+    def clean_nombre(self):
+        nombre = self.cleaned_data['nombre'].strip()
+        if not nombre:
+            raise forms.ValidationError('Debes indicar un nombre para la campaña.')
+        return nombre
+
+
+class AjustePuntosForm(forms.Form):
+    """
+    Ajuste manual del saldo de un usuario desde el panel.
+    """
+    accion = forms.ChoiceField(choices=[('agregar', 'Agregar'), ('quitar', 'Quitar')], label='Acción')
+    cantidad = forms.IntegerField(min_value=1, label='Cantidad de puntos')
+    descripcion = forms.CharField(required=False, max_length=200, label='Descripción')
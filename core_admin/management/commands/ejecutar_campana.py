@@ -0,0 +1,46 @@
+# ============================================
+# core_admin/management/commands/ejecutar_campana.py
+# Comando para ejecutar (o reanudar) una campaña masiva de puntos
+# ============================================
+from django.core.management.base import BaseCommand, CommandError
+from core_admin.models import CampanaPuntos
+from core_admin.campanas import ejecutar_campana, perfiles_objetivo, CampanaEnCurso
+
+
+class Command(BaseCommand):
+    help = 'Otorga los puntos de una campaña a todos sus usuarios objetivo, por lotes y de forma reanudable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_id', type=int, help='ID de la campaña a ejecutar')
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Perfiles acreditados por transacción (por defecto 1000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            campana = CampanaPuntos.objects.get(pk=options['campana_id'])
+        except CampanaPuntos.DoesNotExist:
+            raise CommandError(f'No existe la campaña {options["campana_id"]}')
+
+        if campana.estado == 'completada':
+            self.stdout.write(self.style.WARNING(f'La campaña "{campana.nombre}" ya fue completada.'))
+            return
+
+        total = perfiles_objetivo(campana).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ejecutando campaña "{campana.nombre}" ({campana.puntos} pts) '
+            f'- {campana.perfiles_procesados}/{total} perfiles ya procesados'
+        ))
+
+        def progreso(c):
+            self.stdout.write(f'  Perfiles procesados: {c.perfiles_procesados}/{total}')
+
+        try:
+            acreditados = ejecutar_campana(campana, tamano_lote=options['lote'], progreso=progreso)
+        except CampanaEnCurso as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Campaña completada!'))
+        self.stdout.write(self.style.SUCCESS(f'Perfiles acreditados en esta ejecución: {acreditados}'))
+        self.stdout.write(self.style.SUCCESS(f'Total de perfiles acreditados: {campana.perfiles_procesados}'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_admin', '0001_initial'),
+        ('core_public', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampanaPuntos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Nombre de la campaña (aparece en el historial de puntos)', max_length=200)),
+                ('puntos', models.PositiveIntegerField(help_text='Puntos a otorgar a cada usuario')),
+                ('solo_suscripcion_activa', models.BooleanField(default=False, help_text='Solo usuarios con al menos una suscripción activa')),
+                ('registrados_desde', models.DateField(blank=True, help_text='Solo usuarios registrados a partir de esta fecha', null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completada', 'Completada')], default='pendiente', max_length=20)),
+                ('ultimo_perfil_id', models.BigIntegerField(default=0, help_text='Último perfil acreditado')),
+                ('perfiles_procesados', models.IntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('creada_por', models.ForeignKey(blank=True, help_text='Administrador que creó la campaña', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('servicio', models.ForeignKey(blank=True, help_text='Solo usuarios con una suscripción activa a este servicio', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campanas_puntos', to='core_public.serviciostreaming')),
+            ],
+            options={
+                'verbose_name': 'Campaña de Puntos',
+                'verbose_name_plural': 'Campañas de Puntos',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
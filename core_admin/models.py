@@ -34,3 +34,62 @@ class CorreoVerificado(models.Model):
     
     def __str__(self):
         return f"{self.correo} - {self.servicio.nombre}"
+
+
+class CampanaPuntos(models.Model):
+    """
+    Campaña promocional que otorga la misma cantidad de puntos a todos los
+    usuarios que cumplan sus filtros. Se procesa por lotes y guarda el último
+    perfil acreditado para poder reanudarse tras una interrupción.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+    ]
+    
+    nombre = models.CharField(max_length=200, help_text="Nombre de la campaña (aparece en el historial de puntos)")
+    puntos = models.PositiveIntegerField(help_text="Puntos a otorgar a cada usuario")
+    
+    # Filtros de usuarios objetivo
+    servicio = models.ForeignKey(
+        ServicioStreaming,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='campanas_puntos',
+        help_text="Solo usuarios con una suscripción activa a este servicio"
+    )
+    solo_suscripcion_activa = models.BooleanField(
+        default=False,
+        help_text="Solo usuarios con al menos una suscripción activa"
+    )
+    registrados_desde = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Solo usuarios registrados a partir de esta fecha"
+    )
+    
+    # Progreso
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    ultimo_perfil_id = models.BigIntegerField(default=0, help_text="Último perfil acreditado")
+    perfiles_procesados = models.IntegerField(default=0)
+    
+    creada_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Administrador que creó la campaña"
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Campaña de Puntos"
+        verbose_name_plural = "Campañas de Puntos"
+        ordering = ['-fecha_creacion']
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.puntos} pts) - {self.get_estado_display()}"
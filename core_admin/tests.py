@@ -1,3 +1,132 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core_public.models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion
+from core_user.models import PerfilUsuario, Suscripcion, TransaccionPuntos
+from .campanas import ejecutar_campana, perfiles_objetivo
+from .models import CampanaPuntos
+
+
+class CampanaPuntosTests(TestCase):
+    """Motor de campañas masivas de puntos"""
+
+    def setUp(self):
+        categoria = CategoriaStreaming.objects.create(nombre='Música')
+        self.servicio = ServicioStreaming.objects.create(
+            nombre='Spotify', categoria=categoria, descripcion='Música', sitio_web='https://spotify.com'
+        )
+        self.plan = PlanSuscripcion.objects.create(servicio=self.servicio, nombre='Individual', precio=16900)
+        self.usuarios = [User.objects.create_user(f'user{i}', password='x') for i in range(5)]
+
+    def _suscribir(self, usuario):
+        Suscripcion.objects.create(
+            usuario=usuario, plan=self.plan, fecha_inicio=timezone.now().date(),
+            estado='activa', metodo_pago='tarjeta', monto_pagado=16900, email_servicio='a@b.co'
+        )
+
+    def test_acredita_a_todos_por_lotes(self):
+        campana = CampanaPuntos.objects.create(nombre='Bono', puntos=25)
+        self.assertEqual(ejecutar_campana(campana, tamano_lote=2), 5)
+
+        campana.refresh_from_db()
+        self.assertEqual(campana.estado, 'completada')
+        self.assertEqual(campana.perfiles_procesados, 5)
+        self.assertEqual(PerfilUsuario.objects.filter(puntos_disponibles=25).count(), 5)
+        self.assertEqual(TransaccionPuntos.objects.filter(descripcion='Campaña: Bono').count(), 5)
+
+    def test_filtra_por_servicio(self):
+        self._suscribir(self.usuarios[0])
+        self._suscribir(self.usuarios[0])
+        campana = CampanaPuntos.objects.create(nombre='Spotify', puntos=10, servicio=self.servicio)
+        self.assertEqual(list(perfiles_objetivo(campana)), [self.usuarios[0].perfil])
+
+    def test_reanuda_sin_acreditar_dos_veces(self):
+        campana = CampanaPuntos.objects.create(nombre='Bono', puntos=10)
+
+        class Interrupcion(Exception):
+            pass
+
+        def interrumpir(c):
+            raise Interrupcion
+
+        with self.assertRaises(Interrupcion):
+            ejecutar_campana(campana, tamano_lote=2, progreso=interrumpir)
+
+        campana = CampanaPuntos.objects.get(pk=campana.pk)
+        self.assertEqual((campana.estado, campana.perfiles_procesados), ('en_proceso', 2))
+
+        call_command('ejecutar_campana', campana.pk, lote=2, stdout=StringIO())
+        self.assertEqual(PerfilUsuario.objects.filter(puntos_disponibles=10).count(), 5)
+        self.assertEqual(TransaccionPuntos.objects.count(), 5)
+
+
+@override_settings(SEGUNDO_PLANO_WORKERS=0)
+class CampanasPuntosVistaTests(TestCase):
+    """Panel de campañas: creación validada y ejecución en segundo plano"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.usuarios = [User.objects.create_user(f'user{i}', password='x') for i in range(3)]
+        self.client.force_login(self.admin)
+        self.url = reverse('admin_custom:campanas_puntos')
+
+    def test_crear_con_datos_invalidos_muestra_el_error(self):
+        for datos in ({'puntos': 'abc'}, {'puntos': '-5'}, {'puntos': '10', 'registrados_desde': '2024-99-01'}):
+            with self.subTest(datos):
+                respuesta = self.client.post(self.url, {'accion': 'crear', 'nombre': 'Bono', **datos}, follow=True)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual(len([m for m in respuesta.context['messages'] if m.level_tag == 'error']), 1)
+        self.assertFalse(CampanaPuntos.objects.exists())
+
+    def test_crear_y_ejecutar_al_confirmar_la_transaccion(self):
+        self.client.post(self.url, {'accion': 'crear', 'nombre': 'Bono', 'puntos': '15'})
+        campana = CampanaPuntos.objects.get()
+        self.assertEqual(campana.creada_por, self.admin)
+
+        with mock.patch('core_admin.campanas.ejecutar_campana') as ejecutar:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post(self.url, {'accion': 'ejecutar', 'campana_id': campana.pk})
+            # La petición solo encola la campaña
+            ejecutar.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        campana.refresh_from_db()
+        self.assertEqual((campana.estado, campana.perfiles_procesados), ('completada', 4))
+        self.assertEqual(PerfilUsuario.objects.filter(puntos_disponibles=15).count(), 4)
+
+
+class GestionarPuntosVistaTests(TestCase):
+    """Ajustes manuales de puntos desde el panel"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.perfil = User.objects.create_user('ana', password='x').perfil
+        self.url = reverse('admin_custom:gestionar_puntos')
+
+    def _ajustar(self, accion, cantidad):
+        return self.client.post(self.url, {
+            'perfil_id': self.perfil.pk, 'accion': accion, 'cantidad': cantidad, 'descripcion': 'Soporte'
+        }, follow=True)
+
+    def test_cantidad_invalida_muestra_el_error(self):
+        for accion, cantidad in (('agregar', '-10'), ('quitar', '-10'), ('agregar', '0'), ('agregar', 'diez')):
+            with self.subTest(accion=accion, cantidad=cantidad):
+                respuesta = self._ajustar(accion, cantidad)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertIn('Cantidad de puntos', [str(m) for m in respuesta.context['messages']][0])
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_disponibles, 0)
+        self.assertFalse(TransaccionPuntos.objects.exists())
+
+    def test_agregar_y_quitar(self):
+        self._ajustar('agregar', '40')
+        self._ajustar('quitar', '15')
+        self.perfil.refresh_from_db()
+        self.assertEqual((self.perfil.puntos_totales, self.perfil.puntos_disponibles), (40, 25))
@@ -13,6 +13,7 @@ urlpatterns = [
     
     # Gestión de puntos
     path('gestionar-puntos/', views.gestionar_puntos, name='gestionar_puntos'),
+    path('campanas-puntos/', views.campanas_puntos, name='campanas_puntos'),
     
     # Gestión de compras registradas
     path('gestionar-compras/', views.gestionar_compras, name='gestionar_compras'),
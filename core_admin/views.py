@@ -4,8 +4,11 @@ from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Count, Sum
 from core_user.models import Suscripcion, PerfilUsuario, TransaccionPuntos, RegistroCompra
+from core_user import primeras_compras
 from core_public.models import ConfiguracionRecompensa, ServicioStreaming
-from .models import CorreoVerificado
+from .models import CorreoVerificado, CampanaPuntos
+from .campanas import perfiles_objetivo, programar_campana
+from .forms import AjustePuntosForm, CampanaPuntosForm
 
 
 @staff_member_required
@@ -85,11 +88,11 @@ def validar_suscripcion_accion(request, suscripcion_id):
     suscripcion = get_object_or_404(Suscripcion, id=suscripcion_id)
     
     # Detectar si es primera compra
-    es_primera_compra = not Suscripcion.objects.filter(
-        usuario=suscripcion.usuario,
-        plan__servicio=suscripcion.plan.servicio,
-        validada=True
-    ).exclude(id=suscripcion.id).exists()
+    es_primera_compra = primeras_compras.es_primera_compra(
+        suscripcion.usuario_id,
+        suscripcion.plan.servicio_id,
+        suscripcion_id=suscripcion.id
+    )
     
     # Calcular puntos sugeridos
     if es_primera_compra:
@@ -113,6 +116,7 @@ def validar_suscripcion_accion(request, suscripcion_id):
                 suscripcion.notas = notas
             
             suscripcion.save()
+            primeras_compras.registrar_compras(suscripciones=[suscripcion])
             
             # Los puntos ya se otorgan automáticamente en el save del modelo
             # pero podemos forzar la actualización si es necesario
@@ -159,18 +163,22 @@ def gestionar_puntos(request):
     perfiles = PerfilUsuario.objects.select_related('user').order_by('-puntos_disponibles')
     
     if request.method == 'POST':
-        perfil_id = request.POST.get('perfil_id')
-        cantidad = int(request.POST.get('cantidad', 0))
-        descripcion = request.POST.get('descripcion', '')
-        accion = request.POST.get('accion')
+        perfil = get_object_or_404(PerfilUsuario, id=request.POST.get('perfil_id'))
+        form = AjustePuntosForm(request.POST)
         
-        perfil = get_object_or_404(PerfilUsuario, id=perfil_id)
+        if not form.is_valid():
+            for campo, errores in form.errors.items():
+                messages.error(request, f'{form.fields[campo].label}: {errores[0]}')
+            return redirect('admin_custom:gestionar_puntos')
         
-        if accion == 'agregar':
+        cantidad = form.cleaned_data['cantidad']
+        descripcion = form.cleaned_data['descripcion']
+        
+        if form.cleaned_data['accion'] == 'agregar':
             perfil.agregar_puntos(cantidad, f'Ajuste manual: {descripcion}')
             messages.success(request, f'{cantidad} puntos agregados a {perfil.user.username}')
         
-        elif accion == 'quitar':
+        else:
             if perfil.canjear_puntos(cantidad, f'Ajuste manual: {descripcion}'):
                 messages.success(request, f'{cantidad} puntos removidos de {perfil.user.username}')
             else:
@@ -184,6 +192,49 @@ def gestionar_puntos(request):
     return render(request, 'admin_custom/gestionar_puntos.html', context)
 
 
+@staff_member_required
+def campanas_puntos(request):
+    """Campañas masivas de puntos: crear, encolar su ejecución y ver su progreso"""
+    servicios = ServicioStreaming.objects.filter(activo=True)
+    
+    if request.method == 'POST':
+        accion = request.POST.get('accion')
+        
+        if accion == 'crear':
+            form = CampanaPuntosForm(request.POST)
+            if form.is_valid():
+                campana = form.save(commit=False)
+                campana.creada_por = request.user
+                campana.save()
+                messages.success(
+                    request,
+                    f'Campaña "{campana.nombre}" creada para {perfiles_objetivo(campana).count()} usuario(s).'
+                )
+            else:
+                for campo, errores in form.errors.items():
+                    messages.error(request, f'{form.fields[campo].label}: {errores[0]}')
+        
+        elif accion == 'ejecutar':
+            campana = get_object_or_404(CampanaPuntos, id=request.POST.get('campana_id'))
+            if campana.estado == 'completada':
+                messages.warning(request, f'La campaña "{campana.nombre}" ya fue completada.')
+            else:
+                # Se ejecuta en segundo plano; esta página muestra su avance
+                programar_campana(campana)
+                messages.success(
+                    request,
+                    f'Campaña "{campana.nombre}" en ejecución. Actualiza la página para ver su progreso.'
+                )
+        
+        return redirect('admin_custom:campanas_puntos')
+    
+    context = {
+        'campanas': CampanaPuntos.objects.select_related('servicio', 'creada_por'),
+        'servicios': servicios,
+    }
+    return render(request, 'admin_custom/campanas_puntos.html', context)
+
+
 @staff_member_required
 def reportes(request):
     """Reportes y estadísticas del sistema"""
@@ -284,7 +335,9 @@ def gestionar_compras(request):
     else:
         compras = RegistroCompra.objects.filter(estado=estado_filtro)
     
-    compras = compras.select_related('usuario', 'servicio', 'plan', 'revisado_por').order_by('-fecha_registro')
+    compras = compras.select_related(
+        'usuario', 'servicio', 'plan', 'revisado_por', 'comprobante_almacenado'
+    ).order_by('-fecha_registro')
     
     # Estadísticas
     stats = {
@@ -307,7 +360,7 @@ def detalle_compra_admin(request, compra_id):
     """
     Detalle de una compra registrada con opciones de aprobar/rechazar.
     """
-    compra = get_object_or_404(RegistroCompra, id=compra_id)
+    compra = get_object_or_404(RegistroCompra.objects.select_related('comprobante_almacenado'), id=compra_id)
     
     if request.method == 'POST':
         accion = request.POST.get('accion')
@@ -338,5 +391,7 @@ def detalle_compra_admin(request, compra_id):
     
     context = {
         'compra': compra,
+        # Mismo archivo enviado en otras compras (índice por huella del comprobante)
+        'compras_mismo_comprobante': compra.registros_mismo_comprobante(),
     }
     return render(request, 'admin_custom/detalle_compra.html', context)
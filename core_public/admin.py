@@ -2,7 +2,7 @@
 # core_public/admin.py
 # ============================================
 from django.contrib import admin
-from .models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion, ConfiguracionRecompensa
+from .models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion, ConfiguracionRecompensa, LogoServicio
 
 
 @admin.register(CategoriaStreaming)
@@ -34,3 +34,10 @@ class PlanSuscripcionAdmin(admin.ModelAdmin):
 class ConfiguracionRecompensaAdmin(admin.ModelAdmin):
     list_display = ['puntos_por_peso', 'puntos_minimos_canje', 'activo', 'fecha_modificacion']
     list_editable = ['activo']
+
+
+@admin.register(LogoServicio)
+class LogoServicioAdmin(admin.ModelAdmin):
+    list_display = ['servicio', 'huella', 'formatos', 'anchos', 'fecha_actualizacion']
+    search_fields = ['servicio__nombre', 'url_origen']
+    readonly_fields = ['servicio', 'url_origen', 'huella', 'version', 'formatos', 'anchos', 'fecha_actualizacion']
@@ -0,0 +1,208 @@
+# ============================================
+# core_public/api.py
+# API JSON de solo lectura del catálogo
+# ============================================
+"""
+Categorías, servicios y planes activos en JSON para la app móvil y los
+widgets de socios.
+
+Cada respuesta lleva un ETag fuerte derivado de la versión del catálogo
+(ver cache_catalogo.py), la ruta con sus parámetros y la codificación
+negociada. Un `If-None-Match` vigente se responde con 304 sin tocar la base
+de datos, y el cuerpo comprimido se guarda en la caché bajo esa misma
+huella, así que los clientes que sondean el catálogo solo generan consultas
+cuando algo cambió.
+"""
+import hashlib
+import json
+import re
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.text import compress_string
+from django.views.decorators.http import require_safe
+
+from .cache_catalogo import version_catalogo
+from .models import PlanSuscripcion
+from .views import categorias_con_conteo, servicios_con_resumen
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se responde en gzip
+    brotli = None
+
+CONTROL_CACHE = 'public, no-cache'  # el cliente puede guardar, pero revalida con el ETag
+RE_BROTLI = re.compile(r'\bbr\b')
+RE_GZIP = re.compile(r'\bgzip\b')
+
+CAMPOS_CATEGORIA = {
+    'id': lambda c: c.id,
+    'nombre': lambda c: c.nombre,
+    'descripcion': lambda c: c.descripcion,
+    'icono': lambda c: c.icono,
+    'num_servicios': lambda c: c.num_servicios,
+}
+
+CAMPOS_PLAN = {
+    'id': lambda p: p.id,
+    'servicio': lambda p: p.servicio_id,
+    'nombre': lambda p: p.nombre,
+    'precio': lambda p: p.precio,
+    'duracion': lambda p: p.duracion,
+    'caracteristicas': lambda p: p.caracteristicas,
+    'puntos_primera_compra': lambda p: p.puntos_primera_compra,
+    'puntos_renovacion': lambda p: p.puntos_renovacion,
+}
+
+CAMPOS_SERVICIO = {
+    'id': lambda s: s.id,
+    'nombre': lambda s: s.nombre,
+    'descripcion': lambda s: s.descripcion,
+    'sitio_web': lambda s: s.sitio_web,
+    'logo_url': lambda s: s.logo_url,
+    'categoria': lambda s: {'id': s.categoria_id, 'nombre': s.categoria.nombre},
+    'num_planes': lambda s: s.num_planes,
+    'precio_desde': lambda s: s.precio_desde,
+    'planes': lambda s: [serializar(p, CAMPOS_PLAN) for p in s.planes_activos],
+}
+
+
+class CamposInvalidos(Exception):
+    """Parámetros de consulta que la API no reconoce (responde 400)"""
+
+
+def serializar(objeto, campos):
+    return {nombre: obtener(objeto) for nombre, obtener in campos.items()}
+
+
+def elegir_campos(request, disponibles):
+    """
+    Aplica `?campos=a,b,c` sobre los campos disponibles del recurso. Sin el
+    parámetro se devuelven todos.
+    """
+    pedidos = [c.strip() for c in request.GET.get('campos', '').split(',') if c.strip()]
+    if not pedidos:
+        return disponibles
+    desconocidos = [c for c in pedidos if c not in disponibles]
+    if desconocidos:
+        raise CamposInvalidos(f"Campos desconocidos: {', '.join(desconocidos)}")
+    return {c: disponibles[c] for c in pedidos}
+
+
+def negociar_codificacion(request):
+    aceptadas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and RE_BROTLI.search(aceptadas):
+        return 'br'
+    if RE_GZIP.search(aceptadas):
+        return 'gzip'
+    return ''
+
+
+def comprimir(contenido, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(contenido)
+    if codificacion == 'gzip':
+        return compress_string(contenido)  # mtime fijo: mismo cuerpo, mismos bytes
+    return contenido
+
+
+def etag_coincide(request, etag):
+    cabecera = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if cabecera.strip() == '*':
+        return True
+    return etag in (e.strip() for e in cabecera.split(','))
+
+
+def vista_versionada(construir):
+    """
+    Convierte `construir(request, *args, **kwargs)` -> datos en una vista
+    JSON con ETag, 304 y compresión. `construir` puede retornar None para
+    responder 404.
+    """
+    @require_safe
+    @wraps(construir)
+    def envoltura(request, *args, **kwargs):
+        codificacion = negociar_codificacion(request)
+        huella = hashlib.sha256(
+            f'{version_catalogo()}|{request.get_full_path()}'.encode('utf-8')
+        ).hexdigest()[:32]
+        etag = f'"{huella}-{codificacion}"' if codificacion else f'"{huella}"'
+
+        if etag_coincide(request, etag):
+            respuesta = HttpResponseNotModified()
+        else:
+            clave = f'catalogo:api:{huella}:{codificacion}'
+            cuerpo = cache.get(clave)
+            if cuerpo is None:
+                try:
+                    datos = construir(request, *args, **kwargs)
+                except CamposInvalidos as error:
+                    return JsonResponse({'error': str(error)}, status=400)
+                if datos is None:
+                    return JsonResponse({'error': 'No encontrado'}, status=404)
+                cuerpo = comprimir(
+                    json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'),
+                    codificacion
+                )
+                cache.set(clave, cuerpo)
+            respuesta = HttpResponse(cuerpo, content_type='application/json')
+            if codificacion:
+                respuesta['Content-Encoding'] = codificacion
+
+        respuesta['ETag'] = etag
+        respuesta['Cache-Control'] = CONTROL_CACHE
+        respuesta['Vary'] = 'Accept-Encoding'
+        return respuesta
+    return envoltura
+
+
+def servicios_para_api(campos, **filtros):
+    servicios = servicios_con_resumen(**filtros).order_by('nombre')
+    if 'planes' in campos:
+        servicios = servicios.prefetch_related(Prefetch(
+            'planes',
+            queryset=PlanSuscripcion.objects.filter(activo=True).order_by('precio', 'id'),
+            to_attr='planes_activos'
+        ))
+    return servicios
+
+
+@vista_versionada
+def api_categorias(request):
+    """Categorías activas con la cantidad de servicios"""
+    campos = elegir_campos(request, CAMPOS_CATEGORIA)
+    return {'categorias': [serializar(c, campos) for c in categorias_con_conteo()]}
+
+
+@vista_versionada
+def api_servicios(request):
+    """Servicios activos con sus planes activos (`?categoria=<id>` para filtrar)"""
+    campos = elegir_campos(request, CAMPOS_SERVICIO)
+    filtros = {}
+    categoria_id = request.GET.get('categoria')
+    if categoria_id:
+        if not categoria_id.isdigit():
+            raise CamposInvalidos('categoria debe ser un número')
+        filtros['categoria_id'] = categoria_id
+    return {'servicios': [serializar(s, campos) for s in servicios_para_api(campos, **filtros)]}
+
+
+@vista_versionada
+def api_detalle_servicio(request, servicio_id):
+    """Un servicio activo con sus planes activos"""
+    campos = elegir_campos(request, CAMPOS_SERVICIO)
+    servicio = servicios_para_api(campos, id=servicio_id).first()
+    if servicio is None:
+        return None
+    return serializar(servicio, campos)
+
+
+@vista_versionada
+def api_planes(request):
+    """Planes activos de servicios activos"""
+    campos = elegir_campos(request, CAMPOS_PLAN)
+    planes = PlanSuscripcion.objects.filter(activo=True, servicio__activo=True).order_by('servicio_id', 'precio', 'id')
+    return {'planes': [serializar(p, campos) for p in planes]}
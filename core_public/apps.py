@@ -8,3 +8,7 @@ class CorePublicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_public'
     verbose_name = 'Contenido Público'
+    
+    def ready(self):
+        # Importar signals cuando la app esté lista
+        import core_public.signals
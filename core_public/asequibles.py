@@ -0,0 +1,79 @@
+# ============================================
+# core_public/asequibles.py
+# Índice de planes que se pueden pagar con puntos
+# ============================================
+"""
+Todos los planes activos ordenados por los puntos necesarios para pagarlos
+completos (precio × puntos_por_peso). "Qué planes alcanzo con mi saldo" es
+entonces una búsqueda binaria sobre ese arreglo, sin consultas.
+
+Cada proceso arma el índice con una sola consulta y lo reutiliza mientras no
+cambien la versión del catálogo ni la configuración de recompensas.
+"""
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+
+from .cache_catalogo import version_catalogo
+from .configuracion import configuracion_activa
+from .models import PlanSuscripcion
+
+PlanAsequible = namedtuple(
+    'PlanAsequible',
+    'id nombre precio puntos_necesarios servicio_id servicio_nombre'
+)
+
+_local = {'clave': None, 'indice': None}
+_candado = threading.Lock()
+
+
+class IndiceAsequibles:
+    """Planes activos ordenados por puntos necesarios"""
+
+    def __init__(self, planes):
+        self.planes = sorted(planes, key=lambda p: (p.puntos_necesarios, p.id))
+        self.puntos = [p.puntos_necesarios for p in self.planes]
+        self.por_id = {p.id: p for p in self.planes}
+        # Para cada servicio, lo mínimo que hay que tener para pagar alguno de sus planes
+        self.minimo_por_servicio = {}
+        for plan in self.planes:
+            self.minimo_por_servicio.setdefault(plan.servicio_id, plan.puntos_necesarios)
+
+    def asequibles(self, saldo):
+        """Planes con puntos necesarios <= saldo, del más barato al más caro"""
+        return self.planes[:bisect_right(self.puntos, saldo)]
+
+    def servicios_asequibles(self, saldo):
+        """IDs de los servicios con al menos un plan pagable con `saldo`"""
+        return {s for s, minimo in self.minimo_por_servicio.items() if minimo <= saldo}
+
+    def puntos_necesarios(self, plan_id):
+        plan = self.por_id.get(plan_id)
+        return plan.puntos_necesarios if plan else None
+
+
+def construir_indice(puntos_por_peso):
+    planes = PlanSuscripcion.objects.filter(activo=True, servicio__activo=True).values_list(
+        'id', 'nombre', 'precio', 'servicio_id', 'servicio__nombre'
+    )
+    return IndiceAsequibles(
+        PlanAsequible(pk, nombre, precio, int(precio * puntos_por_peso), servicio_id, servicio_nombre)
+        for pk, nombre, precio, servicio_id, servicio_nombre in planes
+    )
+
+
+def indice_asequibles():
+    """
+    Índice vigente para este proceso, o None si no hay configuración de
+    recompensas activa (sin ella los puntos no tienen valor).
+    """
+    config = configuracion_activa()
+    if config is None:
+        return None
+    clave = (version_catalogo(), config.pk, config.puntos_por_peso)
+    if _local['clave'] != clave:
+        with _candado:
+            if _local['clave'] != clave:
+                _local['indice'] = construir_indice(config.puntos_por_peso)
+                _local['clave'] = clave
+    return _local['indice']
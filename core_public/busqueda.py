@@ -0,0 +1,206 @@
+# ============================================
+# core_public/busqueda.py
+# Búsqueda de texto completo del catálogo
+# ============================================
+"""
+Índice de texto completo con una fila por servicio activo: su nombre, su
+descripción y el texto de sus planes activos (nombre y características).
+
+En SQLite es una tabla virtual FTS5 con `remove_diacritics`, así "musica"
+encuentra "Música". En PostgreSQL es una tabla con un tsvector en español
+(sin tildes vía `unaccent`) y un índice GIN. La tabla se crea en la
+migración 0002 y se mantiene al día desde signals.py; los cambios masivos
+con `.update()` no disparan señales y se corrigen con
+`python manage.py reindexar_busqueda`.
+
+Cada palabra de la consulta se busca como prefijo ("famil" encuentra
+"Familiar") y todas deben aparecer. Los resultados vienen ordenados por
+relevancia, pesando más el nombre del servicio que los planes y estos más
+que la descripción.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import ServicioStreaming, PlanSuscripcion
+
+TABLA = 'core_public_busqueda'
+RE_PALABRA = re.compile(r'\w+')
+MAX_PALABRAS = 8
+LIMITE_RESULTADOS = 200
+
+
+def palabras_consulta(texto):
+    """Palabras útiles de la consulta; la puntuación y los operadores se descartan"""
+    return RE_PALABRA.findall(texto or '')[:MAX_PALABRAS]
+
+
+def documentos_servicios(servicio_ids=None, servicios=None, planes=None):
+    """
+    Texto indexable por servicio activo: {servicio_id: (nombre, descripcion, planes)}.
+    Dos consultas, sin importar cuántos servicios se indexen. `servicios` y
+    `planes` reciben querysets de los modelos históricos en las migraciones.
+    """
+    servicios = (ServicioStreaming.objects.all() if servicios is None else servicios).filter(activo=True)
+    planes = (PlanSuscripcion.objects.all() if planes is None else planes).filter(activo=True, servicio__activo=True)
+    if servicio_ids is not None:
+        servicios = servicios.filter(id__in=servicio_ids)
+        planes = planes.filter(servicio_id__in=servicio_ids)
+
+    texto_planes = {}
+    for servicio_id, nombre, caracteristicas in planes.values_list('servicio_id', 'nombre', 'caracteristicas'):
+        partes = texto_planes.setdefault(servicio_id, [])
+        partes.append(nombre)
+        if isinstance(caracteristicas, list):
+            partes.extend(str(c) for c in caracteristicas)
+
+    return {
+        servicio_id: (nombre, descripcion, ' '.join(texto_planes.get(servicio_id, [])))
+        for servicio_id, nombre, descripcion in servicios.values_list('id', 'nombre', 'descripcion')
+    }
+
+
+# ============================================
+# SQLITE (FTS5)
+# ============================================
+
+def _crear_sqlite(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+        "servicio_id UNINDEXED, nombre, descripcion, planes, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def _escribir_sqlite(cursor, servicio_ids, documentos):
+    cursor.executemany(f'DELETE FROM {TABLA} WHERE servicio_id = %s', [(i,) for i in servicio_ids])
+    cursor.executemany(
+        f'INSERT INTO {TABLA} (servicio_id, nombre, descripcion, planes) VALUES (%s, %s, %s, %s)',
+        [(i, *documento) for i, documento in documentos.items()]
+    )
+
+
+def _buscar_sqlite(cursor, palabras, limite):
+    # Cada palabra va entre comillas: FTS5 la toma literal y el * la vuelve prefijo
+    consulta = ' '.join(f'"{p}"*' for p in palabras)
+    cursor.execute(
+        f'SELECT servicio_id FROM {TABLA} WHERE {TABLA} MATCH %s '
+        f'ORDER BY bm25({TABLA}, 0.0, 10.0, 1.0, 4.0) LIMIT %s',
+        [consulta, limite]
+    )
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+# ============================================
+# POSTGRESQL (tsvector + GIN)
+# ============================================
+
+def _crear_postgresql(cursor):
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {TABLA} ('
+        'servicio_id integer PRIMARY KEY, documento tsvector NOT NULL)'
+    )
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {TABLA}_documento ON {TABLA} USING GIN (documento)')
+
+
+def _escribir_postgresql(cursor, servicio_ids, documentos):
+    cursor.execute(f'DELETE FROM {TABLA} WHERE servicio_id = ANY(%s)', [list(servicio_ids)])
+    cursor.executemany(
+        f"INSERT INTO {TABLA} (servicio_id, documento) VALUES (%s, "
+        "setweight(to_tsvector('spanish', unaccent(%s)), 'A') || "
+        "setweight(to_tsvector('spanish', unaccent(%s)), 'C') || "
+        "setweight(to_tsvector('spanish', unaccent(%s)), 'B'))",
+        [(i, *documento) for i, documento in documentos.items()]
+    )
+
+
+def _buscar_postgresql(cursor, palabras, limite):
+    consulta = ' & '.join(f'{p}:*' for p in palabras)
+    cursor.execute(
+        f"SELECT servicio_id FROM {TABLA}, to_tsquery('spanish', unaccent(%s)) consulta "
+        "WHERE documento @@ consulta ORDER BY ts_rank(documento, consulta) DESC, servicio_id LIMIT %s",
+        [consulta, limite]
+    )
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+MOTORES = {
+    'sqlite': (_crear_sqlite, _escribir_sqlite, _buscar_sqlite),
+    'postgresql': (_crear_postgresql, _escribir_postgresql, _buscar_postgresql),
+}
+
+
+def _motor(conexion):
+    return MOTORES.get(conexion.vendor)
+
+
+# ============================================
+# API PÚBLICA
+# ============================================
+
+def crear_indice(conexion=connection):
+    """Crea la tabla del índice si el motor la soporta (usado por la migración)"""
+    motor = _motor(conexion)
+    if motor:
+        with conexion.cursor() as cursor:
+            motor[0](cursor)
+
+
+def indexar_servicios(servicio_ids):
+    """
+    Reescribe las filas del índice de `servicio_ids`. Los servicios inactivos
+    o borrados quedan fuera del índice.
+    """
+    servicio_ids = list(servicio_ids)
+    if not _motor(connection) or not servicio_ids:
+        return
+    escribir_documentos(connection, servicio_ids, documentos_servicios(servicio_ids))
+
+
+def escribir_documentos(conexion, servicio_ids, documentos):
+    """Reemplaza en el índice las filas de `servicio_ids` por `documentos` (de documentos_servicios)"""
+    motor = _motor(conexion)
+    if motor and servicio_ids:
+        with conexion.cursor() as cursor:
+            motor[1](cursor, servicio_ids, documentos)
+
+
+def reindexar_todo(tamano_lote=500, progreso=None):
+    """
+    Reconstruye el índice completo por lotes en una sola transacción: las
+    búsquedas concurrentes ven el índice viejo hasta que termina.
+    Retorna cuántos servicios indexó.
+    """
+    motor = _motor(connection)
+    if not motor:
+        return 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLA}')
+
+        ids = list(ServicioStreaming.objects.filter(activo=True).order_by('id').values_list('id', flat=True))
+        for inicio in range(0, len(ids), tamano_lote):
+            indexar_servicios(ids[inicio:inicio + tamano_lote])
+            if progreso:
+                progreso(min(inicio + tamano_lote, len(ids)), len(ids))
+    return len(ids)
+
+
+def buscar_servicios(texto, limite=LIMITE_RESULTADOS):
+    """
+    IDs de servicios activos que coinciden con `texto`, del más al menos
+    relevante. Sin motor de texto completo se cae a icontains sin ranking.
+    """
+    palabras = palabras_consulta(texto)
+    if not palabras:
+        return []
+    motor = _motor(connection)
+    if not motor:
+        servicios = ServicioStreaming.objects.filter(activo=True)
+        for palabra in palabras:
+            servicios = servicios.filter(Q(nombre__icontains=palabra) | Q(descripcion__icontains=palabra))
+        return list(servicios.order_by('nombre').values_list('id', flat=True)[:limite])
+    with connection.cursor() as cursor:
+        return motor[2](cursor, palabras, limite)
@@ -0,0 +1,60 @@
+# ============================================
+# core_public/cache_catalogo.py
+# Caché versionada del catálogo público
+# ============================================
+"""
+Las páginas y fragmentos del catálogo se guardan en caché bajo una clave que
+incluye la versión del catálogo. Cualquier cambio en categorías, servicios,
+planes o configuración de recompensas reemplaza la versión (ver signals.py),
+así que la invalidación es exacta e inmediata para todos los procesos que
+comparten el backend de caché. Las entradas viejas simplemente expiran.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+
+CLAVE_VERSION = 'catalogo:version'
+
+
+def version_catalogo():
+    """Versión vigente del catálogo (se crea al primer uso)"""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    """
+    Reemplaza la versión por un valor nuevo. No se usa incr(): dos cambios
+    concurrentes nunca deben terminar compartiendo la misma versión.
+    """
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
+
+
+def cachear_para_anonimos(vista):
+    """
+    Sirve la página completa desde la caché a los visitantes anónimos. Los
+    usuarios autenticados ven contenido personalizado y usan solo los
+    fragmentos cacheados de las plantillas.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        # Los mensajes pendientes son de este visitante: nunca se cachean
+        if request.method != 'GET' or request.user.is_authenticated or len(messages.get_messages(request)):
+            return vista(request, *args, **kwargs)
+
+        ruta = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        clave = f'catalogo:pagina:{version_catalogo()}:{ruta}'
+        respuesta = cache.get(clave)
+        if respuesta is None:
+            respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code == 200:
+                cache.set(clave, respuesta, settings.CATALOGO_CACHE_TIMEOUT)
+        return respuesta
+    return envoltura
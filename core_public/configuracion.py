@@ -0,0 +1,81 @@
+# ============================================
+# core_public/configuracion.py
+# ConfiguracionRecompensa activa en memoria del proceso
+# ============================================
+"""
+La configuración de recompensas es una sola fila que cambia muy poco y se lee
+en casi todas las rutas de compra. Cada proceso la guarda en memoria junto
+con la versión con la que la cargó; en cada acceso compara esa versión con el
+sello compartido en la caché (una lectura de caché, sin consultas a la base).
+Al guardar la configuración, signals.py reemplaza el sello y todos los
+procesos la recargan en su siguiente acceso.
+
+Carga inicial sin estampida: dentro del proceso un candado deja pasar un solo
+hilo, y entre procesos un candado en la caché deja que uno solo consulte la
+base mientras los demás esperan el valor compartido.
+"""
+import copy
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .models import ConfiguracionRecompensa
+
+CLAVE_VERSION = 'config_recompensas:version'
+CLAVE_VALOR = 'config_recompensas:valor:{}'
+CLAVE_CANDADO = 'config_recompensas:cargando:{}'
+ESPERA_CANDADO = 0.05
+INTENTOS_CANDADO = 40  # ~2 segundos antes de leer la base directamente
+
+_SIN_CONFIG = 'sin_config'
+
+_local = {'version': None, 'config': None}
+_candado = threading.Lock()
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _cargar_compartida(version):
+    """Valor de la caché compartida; solo un proceso lo carga desde la base"""
+    clave = CLAVE_VALOR.format(version)
+    for _ in range(INTENTOS_CANDADO):
+        valor = cache.get(clave)
+        if valor is not None:
+            return valor
+        if cache.add(CLAVE_CANDADO.format(version), 1, timeout=10):
+            try:
+                valor = ConfiguracionRecompensa.objects.filter(activo=True).first() or _SIN_CONFIG
+                cache.set(clave, valor, timeout=None)
+                return valor
+            finally:
+                cache.delete(CLAVE_CANDADO.format(version))
+        time.sleep(ESPERA_CANDADO)
+    return ConfiguracionRecompensa.objects.filter(activo=True).first() or _SIN_CONFIG
+
+
+def configuracion_activa():
+    """
+    ConfiguracionRecompensa activa o None. Retorna una copia: modificarla no
+    afecta a otras peticiones (para editarla, leerla de la base).
+    """
+    version = _version()
+    if _local['version'] != version:
+        with _candado:
+            if _local['version'] != version:
+                _local['config'] = _cargar_compartida(version)
+                _local['version'] = version
+    config = _local['config']
+    return None if config == _SIN_CONFIG else copy.copy(config)
+
+
+def invalidar_configuracion():
+    """Nuevo sello de versión: todos los procesos recargan en su siguiente acceso"""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
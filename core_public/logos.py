@@ -0,0 +1,145 @@
+# ============================================
+# core_public/logos.py
+# Copia local de los logos de servicios
+# ============================================
+"""
+Los logos de ServicioStreaming.logo_url apuntan a sitios externos. El comando
+`ingerir_logos` los descarga una vez y genera variantes rasterizadas en
+varios anchos (AVIF, WebP y PNG de respaldo) en el almacenamiento local. El
+nombre de cada archivo lleva el SHA-256 del original, así que dos servicios
+con el mismo logo comparten archivos y un logo que no cambió no se vuelve a
+procesar.
+
+Los SVG solo se rasterizan si está instalado `cairosvg` (opcional); sin él
+se guarda el SVG tal cual, que igual escala sin pérdida y deja de depender
+del sitio externo.
+
+El template tag `{% logo_servicio %}` (templatetags/catalogo_extras.py)
+arma el `<picture>` con `srcset` y `loading="lazy"` a partir de LogoServicio.
+"""
+import hashlib
+import io
+import os
+from urllib.parse import unquote, urlparse
+from urllib.request import Request, urlopen
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+try:
+    import cairosvg
+except ImportError:  # cairosvg es opcional: sin él los SVG se sirven como SVG
+    cairosvg = None
+
+# Cambiarla regenera todas las variantes (p. ej. al agregar un ancho)
+VERSION_VARIANTES = 1
+DIRECTORIO = 'logos'
+ANCHOS = (64, 128, 256)
+# (extensión, formato de Pillow, tipo MIME, opciones de guardado)
+FORMATOS = (
+    ('avif', 'AVIF', 'image/avif', {'quality': 60}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+    ('png', 'PNG', 'image/png', {'optimize': True}),
+)
+TIPOS_MIME = {extension: mime for extension, _, mime, _ in FORMATOS}
+TIPOS_MIME['svg'] = 'image/svg+xml'
+TAMANO_MAXIMO = 5 * 1024 * 1024
+TIEMPO_ESPERA = 15
+
+
+class LogoInvalido(Exception):
+    """El origen no se pudo leer o no es una imagen utilizable"""
+
+
+def ruta_variante(huella, extension, ancho=None):
+    nombre = f'{huella}-{ancho}.{extension}' if ancho else f'{huella}.{extension}'
+    return f'{DIRECTORIO}/{huella[:2]}/{nombre}'
+
+
+def leer_origen(url, directorio_local=None):
+    """
+    Bytes del logo. Con `directorio_local` (modo sin conexión) se busca ahí un
+    archivo con el mismo nombre que el de la URL; las URL file:// se leen del
+    disco y el resto se descarga.
+    """
+    partes = urlparse(url)
+    if directorio_local:
+        ruta = os.path.join(directorio_local, os.path.basename(unquote(partes.path)))
+        if not os.path.isfile(ruta):
+            raise LogoInvalido(f'No existe {ruta}')
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read(TAMANO_MAXIMO + 1)
+    elif partes.scheme == 'file':
+        with open(unquote(partes.path), 'rb') as archivo:
+            contenido = archivo.read(TAMANO_MAXIMO + 1)
+    elif partes.scheme in ('http', 'https'):
+        # Wikimedia rechaza peticiones sin User-Agent
+        peticion = Request(url, headers={'User-Agent': 'StreamPoint/1.0 (ingesta de logos)'})
+        with urlopen(peticion, timeout=TIEMPO_ESPERA) as respuesta:
+            contenido = respuesta.read(TAMANO_MAXIMO + 1)
+    else:
+        raise LogoInvalido(f'Esquema no soportado: {url}')
+
+    if len(contenido) > TAMANO_MAXIMO:
+        raise LogoInvalido('El logo supera el tamaño máximo')
+    return contenido
+
+
+def es_svg(contenido):
+    inicio = contenido[:512].lstrip().lower()
+    return inicio.startswith(b'<svg') or (inicio.startswith(b'<?xml') and b'<svg' in contenido[:2048].lower())
+
+
+def _abrir_imagen(contenido):
+    if es_svg(contenido):
+        contenido = cairosvg.svg2png(bytestring=contenido, output_width=max(ANCHOS) * 2)
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        imagen.load()
+    except Exception as error:
+        raise LogoInvalido(f'No es una imagen válida: {error}')
+    return imagen.convert('RGBA')
+
+
+def _guardar(ruta, datos):
+    # Contenido direccionado por huella: si ya existe es idéntico
+    if not default_storage.exists(ruta):
+        default_storage.save(ruta, ContentFile(datos))
+
+
+def generar_variantes(contenido, huella):
+    """
+    Escribe las variantes del logo y retorna (formatos, anchos). Nunca amplía:
+    los anchos mayores que el original se omiten (salvo el menor, para que
+    siempre haya al menos una variante).
+    """
+    if es_svg(contenido) and cairosvg is None:
+        _guardar(ruta_variante(huella, 'svg'), contenido)
+        return ['svg'], []
+
+    imagen = _abrir_imagen(contenido)
+    anchos = [a for a in ANCHOS if a <= imagen.width] or [min(ANCHOS)]
+    for ancho in anchos:
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        variante = imagen.resize((ancho, alto), Image.LANCZOS)
+        for extension, formato, _, opciones in FORMATOS:
+            buffer = io.BytesIO()
+            variante.save(buffer, formato, **opciones)
+            _guardar(ruta_variante(huella, extension, ancho), buffer.getvalue())
+    return [extension for extension, _, _, _ in FORMATOS], anchos
+
+
+def procesar_logo(servicio_id, url, huella_anterior=None, directorio_local=None):
+    """
+    Trabajo de un worker: descarga el logo y, si su contenido cambió, genera
+    las variantes. No toca la base de datos.
+    Retorna (servicio_id, huella, formatos, anchos); formatos es None si el
+    contenido es el mismo que ya estaba procesado.
+    """
+    contenido = leer_origen(url, directorio_local)
+    huella = hashlib.sha256(contenido).hexdigest()
+    if huella == huella_anterior:
+        return servicio_id, huella, None, None
+    formatos, anchos = generar_variantes(contenido, huella)
+    return servicio_id, huella, formatos, anchos
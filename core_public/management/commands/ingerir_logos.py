@@ -0,0 +1,102 @@
+# ============================================
+# core_public/management/commands/ingerir_logos.py
+# Comando para descargar los logos y generar sus variantes locales
+# ============================================
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core_public.logos import VERSION_VARIANTES, procesar_logo
+from core_public.models import LogoServicio, ServicioStreaming
+from core_user.segundo_plano import inicializar_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Descarga el logo de cada servicio y genera variantes AVIF/WebP/PNG locales. '
+        'Solo procesa los logos nuevos o cuya URL o contenido cambió'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo; 1 procesa todo en el proceso actual'
+        )
+        parser.add_argument(
+            '--origen', default=None,
+            help='Directorio local con los archivos de los logos (modo sin conexión)'
+        )
+        parser.add_argument(
+            '--forzar', action='store_true',
+            help='Vuelve a descargar y procesar todos los logos'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        forzar = options['forzar']
+
+        tareas = []
+        sin_cambios = 0
+        servicios = ServicioStreaming.objects.exclude(logo_url='').select_related('logo').order_by('id')
+        for servicio in servicios:
+            logo = servicio.logo if hasattr(servicio, 'logo') else None
+            vigente = logo is not None and logo.version == VERSION_VARIANTES and not forzar
+            if vigente and logo.url_origen == servicio.logo_url:
+                sin_cambios += 1
+                continue
+            # Si solo cambió la URL, la huella anterior evita regenerar un archivo idéntico
+            tareas.append((servicio.id, servicio.logo_url, logo.huella if vigente else None, options['origen']))
+
+        if not tareas:
+            self.stdout.write(self.style.SUCCESS(f'Todos los logos están al día ({sin_cambios}).'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Procesando {len(tareas)} logo(s) con {workers} worker(s)...'
+        ))
+        urls = {tarea[0]: tarea[1] for tarea in tareas}
+        procesados = generados = errores = 0
+
+        def registrar(servicio_id, ejecutar):
+            nonlocal procesados, generados, errores
+            try:
+                resultado, error = ejecutar(), None
+            except Exception as excepcion:  # un logo roto no detiene la ingesta
+                resultado, error = None, excepcion
+
+            procesados += 1
+            if error is not None:
+                errores += 1
+                self.stdout.write(self.style.WARNING(f'  Servicio {servicio_id}: {error}'))
+                return
+            _, huella, formatos, anchos = resultado
+            if formatos is None:
+                LogoServicio.objects.filter(servicio_id=servicio_id).update(url_origen=urls[servicio_id])
+            else:
+                generados += 1
+                LogoServicio.objects.update_or_create(servicio_id=servicio_id, defaults={
+                    'url_origen': urls[servicio_id],
+                    'huella': huella,
+                    'version': VERSION_VARIANTES,
+                    'formatos': formatos,
+                    'anchos': anchos,
+                })
+            self.stdout.write(f'  Logos procesados: {procesados}/{len(tareas)}')
+
+        if workers > 1:
+            # Los procesos hijos no deben heredar conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker) as pool:
+                futuros = {pool.submit(procesar_logo, *tarea): tarea[0] for tarea in tareas}
+                for futuro in as_completed(futuros):
+                    registrar(futuros[futuro], futuro.result)
+        else:
+            for tarea in tareas:
+                registrar(tarea[0], lambda: procesar_logo(*tarea))
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Logos con variantes nuevas: {generados}'))
+        self.stdout.write(self.style.SUCCESS(f'Logos sin cambios: {sin_cambios + procesados - generados - errores}'))
+        if errores:
+            self.stdout.write(self.style.WARNING(f'Logos con error: {errores}'))
@@ -0,0 +1,28 @@
+# ============================================
+# core_public/management/commands/reindexar_busqueda.py
+# Comando para reconstruir el índice de búsqueda del catálogo
+# ============================================
+from django.core.management.base import BaseCommand
+from core_public.busqueda import reindexar_todo
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye el índice de texto completo de servicios y planes. '
+        'Necesario tras cambios masivos hechos con .update() o SQL directo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Servicios indexados por lote (por defecto 500)'
+        )
+
+    def handle(self, *args, **options):
+        def progreso(hechos, total):
+            self.stdout.write(f'  Servicios indexados: {hechos}/{total}')
+
+        total = reindexar_todo(tamano_lote=options['lote'], progreso=progreso)
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Servicios en el índice: {total}'))
@@ -0,0 +1,65 @@
+# ============================================
+# core_public/manifiesto.py
+# Manifiesto JSON de planes por servicio
+# ============================================
+"""
+Mapa {servicio_id: [planes]} que usa el formulario de registro de compras
+para llenar el selector de planes. Se sirve como un archivo JSON aparte cuya
+URL lleva la huella de su contenido, así el navegador lo guarda por un año y
+solo lo vuelve a pedir cuando cambia la huella.
+
+El contenido se arma una vez por versión del catálogo (ver cache_catalogo.py)
+y se guarda en la caché también bajo su huella, para que las páginas que aún
+apuntan a la versión anterior puedan terminar de cargarla.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .cache_catalogo import version_catalogo
+from .models import PlanSuscripcion
+
+CLAVE_VERSION = 'catalogo:manifiesto:{}'
+CLAVE_HUELLA = 'catalogo:manifiesto:huella:{}'
+
+
+def contenido_manifiesto():
+    """JSON (bytes) de los planes activos agrupados por servicio, en una consulta"""
+    planes_data = {}
+    planes = PlanSuscripcion.objects.filter(activo=True).order_by('servicio_id', 'precio', 'id').values_list(
+        'servicio_id', 'id', 'nombre', 'precio'
+    )
+    for servicio_id, plan_id, nombre, precio in planes:
+        planes_data.setdefault(str(servicio_id), []).append({
+            'id': plan_id,
+            'nombre': nombre,
+            'precio': float(precio),
+        })
+    return json.dumps(planes_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def manifiesto_planes():
+    """(huella, contenido) del manifiesto vigente; solo consulta la base si cambió el catálogo"""
+    clave = CLAVE_VERSION.format(version_catalogo())
+    manifiesto = cache.get(clave)
+    if manifiesto is None:
+        contenido = contenido_manifiesto()
+        manifiesto = (hashlib.sha256(contenido).hexdigest()[:16], contenido)
+        cache.set(clave, manifiesto, settings.CATALOGO_CACHE_TIMEOUT)
+        cache.set(CLAVE_HUELLA.format(manifiesto[0]), contenido, settings.CATALOGO_CACHE_TIMEOUT)
+    return manifiesto
+
+
+def contenido_por_huella(huella):
+    """Contenido de un manifiesto por su huella, o None si ya no está en la caché"""
+    huella_vigente, contenido = manifiesto_planes()
+    if huella == huella_vigente:
+        return contenido
+    return cache.get(CLAVE_HUELLA.format(huella))
+
+
+def url_manifiesto_planes():
+    return reverse('public:manifiesto_planes', args=[manifiesto_planes()[0]])
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from core_public import busqueda
+
+
+def crear_indice(apps, schema_editor):
+    # Los servicios existentes se indexan con los modelos históricos y la
+    # conexión de la migración; después se mantiene con `reindexar_busqueda`
+    conexion = schema_editor.connection
+    busqueda.crear_indice(conexion)
+    documentos = busqueda.documentos_servicios(
+        servicios=apps.get_model('core_public', 'ServicioStreaming').objects.using(conexion.alias),
+        planes=apps.get_model('core_public', 'PlanSuscripcion').objects.using(conexion.alias),
+    )
+    busqueda.escribir_documentos(conexion, list(documentos), documentos)
+
+
+def borrar_indice(apps, schema_editor):
+    if busqueda._motor(schema_editor.connection):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {busqueda.TABLA}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_public', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
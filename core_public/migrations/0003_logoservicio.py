@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_public', '0002_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogoServicio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_origen', models.URLField(help_text='logo_url del servicio al momento de la descarga')),
+                ('huella', models.CharField(help_text='SHA-256 del archivo original; nombra las variantes', max_length=64)),
+                ('version', models.PositiveSmallIntegerField(default=1, help_text='Versión de la receta de variantes')),
+                ('formatos', models.JSONField(default=list, help_text='Extensiones generadas, de la más a la menos eficiente')),
+                ('anchos', models.JSONField(default=list, help_text='Anchos en píxeles generados (vacío si el logo es SVG)')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('servicio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='logo', to='core_public.serviciostreaming')),
+            ],
+            options={
+                'verbose_name_plural': 'Logos de Servicios',
+            },
+        ),
+    ]
@@ -84,4 +84,21 @@ class ConfiguracionRecompensa(models.Model):
         verbose_name_plural = "Configuración de Recompensas"
     
     def __str__(self):
-        return f"Config: {self.puntos_por_peso} puntos = $1 COP"
\ No newline at end of file
+        return f"Config: {self.puntos_por_peso} puntos = $1 COP"
+
+
+class LogoServicio(models.Model):
+    """Copia local del logo de un servicio, en variantes de tamaño y formato"""
+    servicio = models.OneToOneField(ServicioStreaming, on_delete=models.CASCADE, related_name='logo')
+    url_origen = models.URLField(help_text="logo_url del servicio al momento de la descarga")
+    huella = models.CharField(max_length=64, help_text="SHA-256 del archivo original; nombra las variantes")
+    version = models.PositiveSmallIntegerField(default=1, help_text="Versión de la receta de variantes")
+    formatos = models.JSONField(default=list, help_text="Extensiones generadas, de la más a la menos eficiente")
+    anchos = models.JSONField(default=list, help_text="Anchos en píxeles generados (vacío si el logo es SVG)")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Logos de Servicios"
+    
+    def __str__(self):
+        return f"Logo de {self.servicio.nombre}"
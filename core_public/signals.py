@@ -0,0 +1,50 @@
+# ============================================
+# core_public/signals.py
+# ============================================
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion, ConfiguracionRecompensa, LogoServicio
+from .cache_catalogo import invalidar_catalogo
+from .configuracion import invalidar_configuracion
+from .busqueda import indexar_servicios
+
+
+@receiver(post_save, sender=CategoriaStreaming)
+@receiver(post_delete, sender=CategoriaStreaming)
+@receiver(post_save, sender=ServicioStreaming)
+@receiver(post_delete, sender=ServicioStreaming)
+@receiver(post_save, sender=PlanSuscripcion)
+@receiver(post_delete, sender=PlanSuscripcion)
+@receiver(post_save, sender=ConfiguracionRecompensa)
+@receiver(post_delete, sender=ConfiguracionRecompensa)
+@receiver(post_save, sender=LogoServicio)
+@receiver(post_delete, sender=LogoServicio)
+def invalidar_cache_catalogo(sender, **kwargs):
+    """Nueva versión del catálogo cuando el cambio ya es visible para otros procesos"""
+    transaction.on_commit(invalidar_catalogo)
+
+
+@receiver(post_save, sender=ConfiguracionRecompensa)
+@receiver(post_delete, sender=ConfiguracionRecompensa)
+def invalidar_configuracion_recompensas(sender, **kwargs):
+    """
+    Invalida de inmediato (este proceso ve su propio cambio) y otra vez al
+    confirmar, por si otro proceso recargó la fila vieja entre medio.
+    """
+    invalidar_configuracion()
+    transaction.on_commit(invalidar_configuracion)
+
+
+@receiver(post_save, sender=ServicioStreaming)
+@receiver(post_delete, sender=ServicioStreaming)
+def indexar_servicio(sender, instance, **kwargs):
+    """Mantiene al día la fila del servicio en el índice de búsqueda (misma transacción)"""
+    indexar_servicios([instance.pk])
+
+
+@receiver(post_save, sender=PlanSuscripcion)
+@receiver(post_delete, sender=PlanSuscripcion)
+def indexar_plan(sender, instance, **kwargs):
+    """Los planes forman parte del documento de su servicio"""
+    indexar_servicios([instance.servicio_id])
@@ -0,0 +1,63 @@
+# ============================================
+# core_public/templatetags/catalogo_extras.py
+# Template tags del catálogo público
+# ============================================
+from django import template
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from core_public.logos import TIPOS_MIME, ruta_variante
+
+register = template.Library()
+
+
+def _logo_local(servicio):
+    try:
+        return servicio.logo
+    except ObjectDoesNotExist:
+        return None
+
+
+@register.simple_tag
+def logo_servicio(servicio, ancho=128, clase='', estilo=''):
+    """
+    Logo del servicio servido desde las variantes locales, con `srcset` por
+    formato y carga diferida. `ancho` es el ancho en CSS píxeles con que se
+    muestra; el navegador elige la variante según la densidad de pantalla.
+    Si el logo aún no se ingirió se usa logo_url tal cual.
+    Uso: {% logo_servicio servicio 128 "img-fluid" %}
+    Para evitar una consulta por servicio, cargar con select_related('logo').
+    """
+    logo = _logo_local(servicio)
+    if logo is None:
+        if not servicio.logo_url:
+            return ''
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">',
+            servicio.logo_url, servicio.nombre, clase, estilo
+        )
+
+    if not logo.anchos:
+        # SVG guardado tal cual
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">',
+            default_storage.url(ruta_variante(logo.huella, logo.formatos[0])), servicio.nombre, clase, estilo
+        )
+
+    def srcset(extension):
+        return ', '.join(
+            f'{default_storage.url(ruta_variante(logo.huella, extension, a))} {a}w' for a in logo.anchos
+        )
+
+    *modernos, respaldo = logo.formatos
+    sizes = f'{ancho}px'
+    fuente = next((a for a in logo.anchos if a >= ancho), logo.anchos[-1])
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (TIPOS_MIME[extension], srcset(extension), sizes) for extension in modernos
+        )),
+        default_storage.url(ruta_variante(logo.huella, respaldo, fuente)),
+        srcset(respaldo), sizes, servicio.nombre, clase, estilo
+    )
@@ -1,3 +1,530 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import configuracion
+from .asequibles import indice_asequibles
+from .busqueda import buscar_servicios, reindexar_todo
+from .cache_catalogo import version_catalogo
+from .manifiesto import manifiesto_planes, url_manifiesto_planes
+from .configuracion import configuracion_activa
+from .logos import cairosvg, ruta_variante
+from .models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion, ConfiguracionRecompensa, LogoServicio
+
+
+CACHE_PRUEBAS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalogo'}}
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class CacheCatalogoTests(TestCase):
+    """Caché de páginas y fragmentos del catálogo, invalidada por versión"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria = CategoriaStreaming.objects.create(nombre='Películas')
+            self.servicio = ServicioStreaming.objects.create(
+                nombre='Netflix', categoria=self.categoria, descripcion='Series', sitio_web='https://netflix.com'
+            )
+            self.plan = PlanSuscripcion.objects.create(servicio=self.servicio, nombre='Básico', precio=16900)
+
+    def test_pagina_anonima_sin_consultas(self):
+        for url in ('/', '/catalogo/', f'/servicio/{self.servicio.pk}/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cambio_invalida_al_confirmar(self):
+        self.assertContains(self.client.get('/catalogo/'), '16900')
+        version = version_catalogo()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.precio = 12900
+            self.plan.save()
+
+        self.assertNotEqual(version_catalogo(), version)
+        respuesta = self.client.get('/catalogo/')
+        self.assertContains(respuesta, '12900')
+        self.assertNotContains(respuesta, '16900')
+
+    def test_usuario_autenticado_usa_fragmentos(self):
+        self.client.force_login(User.objects.create_user('ana', password='x'))
+        self.client.get('/catalogo/')
+        with self.assertNumQueries(3):  # sesión, usuario y perfil del menú; el catálogo sale de los fragmentos
+            self.assertContains(self.client.get('/catalogo/'), 'Netflix')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ServicioStreaming.objects.create(
+                nombre='Mubi', categoria=self.categoria, descripcion='Cine', sitio_web='https://mubi.com'
+            )
+        self.assertContains(self.client.get('/catalogo/'), 'Mubi')
+
+    def test_busqueda_en_cache_no_vuelve_a_buscar(self):
+        self.client.force_login(User.objects.create_user('ana', password='x'))
+        self.assertContains(self.client.get('/catalogo/?q=netflix'), 'Mostrando <strong>1</strong> resultado')
+        with mock.patch('core_public.views.buscar_servicios', wraps=buscar_servicios) as buscar:
+            with self.assertNumQueries(3):  # sesión, usuario y perfil del menú
+                respuesta = self.client.get('/catalogo/?q=netflix')
+        buscar.assert_not_called()
+        self.assertContains(respuesta, 'Mostrando <strong>1</strong> resultado')
+
+    @override_settings(CATALOGO_CACHE_TIMEOUT=0)
+    def test_fragmentos_usan_el_tiempo_configurado(self):
+        self.client.force_login(User.objects.create_user('ana', password='x'))
+        for url in ('/', '/catalogo/'):
+            with self.subTest(url):
+                self.client.get(url)
+                # Con tiempo 0 los fragmentos vencen enseguida y la página vuelve a consultarse
+                with CaptureQueriesContext(connection) as consultas:
+                    self.assertContains(self.client.get(url), 'Netflix')
+                self.assertGreater(len(consultas), 3)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ConsultasCatalogoTests(TestCase):
+    """El catálogo se arma con un número fijo de consultas sin importar su tamaño"""
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = CategoriaStreaming.objects.create(nombre='Música')
+        self.creados = 0
+
+    def _crear_servicios(self, cantidad):
+        for _ in range(cantidad):
+            servicio = ServicioStreaming.objects.create(
+                nombre=f'Servicio {self.creados}', categoria=self.categoria,
+                descripcion='Música', sitio_web='https://example.com'
+            )
+            PlanSuscripcion.objects.create(servicio=servicio, nombre='Caro', precio=30000, puntos_primera_compra=300)
+            PlanSuscripcion.objects.create(servicio=servicio, nombre='Barato', precio=10000, puntos_primera_compra=100)
+            PlanSuscripcion.objects.create(servicio=servicio, nombre='Viejo', precio=5000, activo=False)
+            self.creados += 1
+
+    def _obtener(self, url):
+        cache.clear()
+        with self.assertNumQueries(2):  # servicios anotados y categorías anotadas
+            return self.client.get(url)
+
+    def test_catalogo_en_consultas_constantes(self):
+        self._crear_servicios(2)
+        self._obtener('/catalogo/')
+        self._crear_servicios(6)
+        respuesta = self._obtener('/catalogo/')
+
+        self.assertContains(respuesta, '2 planes', count=8)
+        self.assertContains(respuesta, '$10000 COP', count=8)
+        self.assertContains(respuesta, '+100 pts', count=8)
+        self.assertContains(respuesta, 'data-target="8"')
+
+    def test_index_en_consultas_constantes(self):
+        self._crear_servicios(3)
+        ServicioStreaming.objects.filter(nombre='Servicio 0').update(activo=False)
+        respuesta = self._obtener('/')
+        self.assertContains(respuesta, '2 servicios')
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ConfiguracionActivaTests(TestCase):
+    """ConfiguracionRecompensa en memoria con sello de versión compartido"""
+
+    def setUp(self):
+        cache.clear()
+        self.config = ConfiguracionRecompensa.objects.create(puntos_por_peso=10)
+
+    def test_lecturas_sin_consultas(self):
+        self.assertEqual(configuracion_activa().puntos_por_peso, 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(configuracion_activa().puntos_por_peso, 10)
+
+    def test_edicion_del_admin_invalida(self):
+        configuracion_activa()
+        admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_login(admin)
+        self.client.post('/management/configurar-recompensas/', {'puntos_por_peso': '20', 'puntos_minimos_canje': '100'})
+        self.assertEqual(configuracion_activa().puntos_por_peso, 20)
+
+    def test_sin_configuracion_activa(self):
+        self.config.activo = False
+        self.config.save()
+        self.assertIsNone(configuracion_activa())
+        with self.assertNumQueries(0):
+            self.assertIsNone(configuracion_activa())
+
+    def test_espera_la_carga_de_otro_proceso(self):
+        version = configuracion._version()
+        # Otro proceso tiene el candado y ya publicó el valor
+        cache.add(configuracion.CLAVE_CANDADO.format(version), 1)
+        cache.set(configuracion.CLAVE_VALOR.format(version), self.config)
+        with self.assertNumQueries(0):
+            self.assertEqual(configuracion_activa().pk, self.config.pk)
+
+    def test_un_solo_hilo_carga(self):
+        configuracion.invalidar_configuracion()
+
+        def carga_lenta(version):
+            time.sleep(0.05)
+            return self.config
+
+        with mock.patch.object(configuracion, '_cargar_compartida', side_effect=carga_lenta) as cargar:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                resultados = list(pool.map(lambda _: configuracion_activa(), range(8)))
+        self.assertEqual(cargar.call_count, 1)
+        self.assertTrue(all(r.pk == self.config.pk for r in resultados))
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ApiCatalogoTests(TestCase):
+    """API JSON con ETag por versión del catálogo y compresión"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria = CategoriaStreaming.objects.create(nombre='Música')
+            self.servicio = ServicioStreaming.objects.create(
+                nombre='Spotify', categoria=self.categoria, descripcion='Música', sitio_web='https://spotify.com'
+            )
+            PlanSuscripcion.objects.create(
+                servicio=self.servicio, nombre='Premium', precio=16900, caracteristicas=['Sin anuncios']
+            )
+            PlanSuscripcion.objects.create(servicio=self.servicio, nombre='Viejo', precio=9900, activo=False)
+
+    def test_servicios_con_planes_activos(self):
+        respuesta = self.client.get('/api/catalogo/servicios/')
+        self.assertEqual(respuesta.status_code, 200)
+        servicio, = json.loads(respuesta.content)['servicios']
+        self.assertEqual(servicio['categoria'], {'id': self.categoria.pk, 'nombre': 'Música'})
+        self.assertEqual([p['nombre'] for p in servicio['planes']], ['Premium'])
+        self.assertEqual(servicio['planes'][0]['caracteristicas'], ['Sin anuncios'])
+        self.assertEqual(servicio['planes'][0]['precio'], '16900.00')
+
+    def test_seleccion_de_campos(self):
+        with self.assertNumQueries(1):  # sin 'planes' no se hace el prefetch
+            respuesta = self.client.get('/api/catalogo/servicios/?campos=id,nombre')
+        self.assertEqual(json.loads(respuesta.content), {'servicios': [{'id': self.servicio.pk, 'nombre': 'Spotify'}]})
+        self.assertEqual(self.client.get('/api/catalogo/servicios/?campos=clave').status_code, 400)
+
+    def test_if_none_match_sin_consultas(self):
+        etag = self.client.get('/api/catalogo/categorias/')['ETag']
+        with self.assertNumQueries(0):
+            respuesta = self.client.get('/api/catalogo/categorias/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CategoriaStreaming.objects.create(nombre='Gaming')
+        respuesta = self.client.get('/api/catalogo/categorias/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_respuesta_comprimida(self):
+        respuesta = self.client.get(f'/api/catalogo/servicios/{self.servicio.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(respuesta.content))['nombre'], 'Spotify')
+        # La versión sin comprimir es otra representación y tiene otro ETag
+        self.assertNotEqual(self.client.get(f'/api/catalogo/servicios/{self.servicio.pk}/')['ETag'], respuesta['ETag'])
+
+    def test_servicio_inexistente(self):
+        self.assertEqual(self.client.get('/api/catalogo/servicios/9999/').status_code, 404)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class BusquedaCatalogoTests(TestCase):
+    """Búsqueda de texto completo sobre servicios y planes"""
+
+    def setUp(self):
+        cache.clear()
+        self.musica = CategoriaStreaming.objects.create(nombre='Música')
+        self.video = CategoriaStreaming.objects.create(nombre='Películas')
+        self.spotify = ServicioStreaming.objects.create(
+            nombre='Spotify', categoria=self.musica, descripcion='Música sin anuncios', sitio_web='https://spotify.com'
+        )
+        self.netflix = ServicioStreaming.objects.create(
+            nombre='Netflix', categoria=self.video, descripcion='Series y películas', sitio_web='https://netflix.com'
+        )
+        self.plan = PlanSuscripcion.objects.create(
+            servicio=self.netflix, nombre='Premium', precio=38900, caracteristicas=['Ultra HD 4K', '4 pantallas']
+        )
+        PlanSuscripcion.objects.create(servicio=self.spotify, nombre='Familiar', precio=26900)
+
+    def test_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(buscar_servicios('musica'), [self.spotify.pk])
+        self.assertEqual(buscar_servicios('famil'), [self.spotify.pk])
+        self.assertEqual(buscar_servicios('4K'), [self.netflix.pk])
+        self.assertEqual(buscar_servicios('("4k*'), [self.netflix.pk])  # los operadores se ignoran
+        self.assertEqual(buscar_servicios('musica 4k'), [])
+
+    def test_el_nombre_pesa_mas_que_la_descripcion(self):
+        deezer = ServicioStreaming.objects.create(
+            nombre='Deezer', categoria=self.musica, descripcion='Alternativa a Spotify', sitio_web='https://deezer.com'
+        )
+        self.assertEqual(buscar_servicios('spotify'), [self.spotify.pk, deezer.pk])
+
+    def test_indice_al_dia_al_guardar(self):
+        self.plan.caracteristicas = ['Full HD']
+        self.plan.save()
+        self.assertEqual(buscar_servicios('4k'), [])
+
+        self.spotify.activo = False
+        self.spotify.save()
+        self.assertEqual(buscar_servicios('musica'), [])
+
+        self.netflix.delete()
+        self.assertEqual(buscar_servicios('premium'), [])
+
+    def test_reindexar_tras_update_masivo(self):
+        PlanSuscripcion.objects.filter(pk=self.plan.pk).update(nombre='Estándar')
+        self.assertEqual(buscar_servicios('estandar'), [])
+        self.assertEqual(reindexar_todo(), 2)
+        self.assertEqual(buscar_servicios('estandar'), [self.netflix.pk])
+
+    def test_migracion_indexa_con_modelos_historicos(self):
+        migracion = import_module('core_public.migrations.0002_busqueda')
+        apps = MigrationLoader(connection).project_state(('core_public', '0002_busqueda')).apps
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_public_busqueda')
+        self.assertEqual(buscar_servicios('premium'), [])
+
+        migracion.crear_indice(apps, mock.Mock(connection=connection))
+        self.assertEqual(buscar_servicios('premium'), [self.netflix.pk])
+        self.assertEqual(buscar_servicios('musica'), [self.spotify.pk])
+
+    def test_catalogo_filtra_por_busqueda(self):
+        respuesta = self.client.get('/catalogo/?q=películas')
+        self.assertContains(respuesta, f'/servicio/{self.netflix.pk}/')
+        self.assertNotContains(respuesta, f'/servicio/{self.spotify.pk}/')
+        respuesta = self.client.get(f'/catalogo/?q=premium&categoria={self.musica.pk}')
+        self.assertNotContains(respuesta, f'/servicio/{self.netflix.pk}/')
+
+    def test_catalogo_grande_en_una_consulta(self):
+        servicios = ServicioStreaming.objects.bulk_create([
+            ServicioStreaming(nombre=f'Servicio {i}', categoria=self.video, descripcion='Video', sitio_web='https://example.com')
+            for i in range(500)
+        ])
+        PlanSuscripcion.objects.bulk_create([
+            PlanSuscripcion(servicio=servicio, nombre=nombre, precio=10000, caracteristicas=['HD'])
+            for servicio in servicios for nombre in ('Básico', 'Estándar', 'Familiar 4K')
+        ])
+        reindexar_todo()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(buscar_servicios('familiar 4k', limite=1000)), 500)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class PlanesAsequiblesTests(TestCase):
+    """Índice en memoria de planes pagables con puntos"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            ConfiguracionRecompensa.objects.create(puntos_por_peso=10)
+            categoria = CategoriaStreaming.objects.create(nombre='Música')
+            self.spotify = ServicioStreaming.objects.create(
+                nombre='Spotify', categoria=categoria, descripcion='Música', sitio_web='https://spotify.com'
+            )
+            self.netflix = ServicioStreaming.objects.create(
+                nombre='Netflix', categoria=categoria, descripcion='Series', sitio_web='https://netflix.com'
+            )
+            self.individual = PlanSuscripcion.objects.create(servicio=self.spotify, nombre='Individual', precio=100)
+            self.familiar = PlanSuscripcion.objects.create(servicio=self.spotify, nombre='Familiar', precio=300)
+            self.premium = PlanSuscripcion.objects.create(servicio=self.netflix, nombre='Premium', precio=500)
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.usuario.perfil.puntos_disponibles = 3000
+        self.usuario.perfil.save()
+
+    def test_busqueda_binaria_por_saldo(self):
+        indice = indice_asequibles()
+        self.assertEqual([p.id for p in indice.asequibles(1000)], [self.individual.pk])
+        self.assertEqual([p.id for p in indice.asequibles(3000)], [self.individual.pk, self.familiar.pk])
+        self.assertEqual(indice.asequibles(0), [])
+        self.assertEqual(indice.servicios_asequibles(3000), {self.spotify.pk})
+        self.assertEqual(indice.puntos_necesarios(self.premium.pk), 5000)
+
+    def test_se_reutiliza_hasta_que_cambia_el_catalogo(self):
+        indice = indice_asequibles()
+        with self.assertNumQueries(0):
+            self.assertIs(indice_asequibles(), indice)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.premium.precio = 200
+            self.premium.save()
+        self.assertEqual(indice_asequibles().servicios_asequibles(3000), {self.spotify.pk, self.netflix.pk})
+
+    def test_cambio_de_configuracion_recalcula(self):
+        indice_asequibles()
+        with self.captureOnCommitCallbacks(execute=True):
+            ConfiguracionRecompensa.objects.update(puntos_por_peso=1)
+            ConfiguracionRecompensa.objects.first().save()
+        self.assertEqual(indice_asequibles().puntos_necesarios(self.premium.pk), 500)
+
+    def test_catalogo_marca_servicios_asequibles(self):
+        self.client.force_login(self.usuario)
+        self.client.get('/catalogo/')
+        with self.assertNumQueries(3):  # sesión, usuario y perfil (compartido con el menú)
+            respuesta = self.client.get('/catalogo/')
+        self.assertEqual(respuesta.context['servicios_asequibles'], [self.spotify.pk])
+        self.assertContains(respuesta, f'<script id="servicios-asequibles" type="application/json">[{self.spotify.pk}]</script>', html=True)
+
+    def test_detalle_usa_el_indice(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(f'/servicio/{self.spotify.pk}/')
+        info = {i['plan'].pk: i for i in respuesta.context['planes_con_info']}
+        self.assertTrue(info[self.individual.pk]['puede_pagar_con_puntos'])
+        self.assertEqual(info[self.familiar.pk]['puntos_necesarios'], 3000)
+        self.assertTrue(info[self.familiar.pk]['puede_pagar_con_puntos'])
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ManifiestoPlanesTests(TestCase):
+    """Manifiesto JSON de planes con huella de contenido"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria = CategoriaStreaming.objects.create(nombre='Música')
+            self.servicio = ServicioStreaming.objects.create(
+                nombre='Spotify', categoria=categoria, descripcion='Música', sitio_web='https://spotify.com'
+            )
+            self.plan = PlanSuscripcion.objects.create(servicio=self.servicio, nombre='Premium', precio=16900)
+            PlanSuscripcion.objects.create(servicio=self.servicio, nombre='Viejo', precio=9900, activo=False)
+
+    def test_contenido_y_cabeceras(self):
+        url = url_manifiesto_planes()
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(json.loads(respuesta.content), {
+            str(self.servicio.pk): [{'id': self.plan.pk, 'nombre': 'Premium', 'precio': 16900.0}]
+        })
+
+    def test_se_arma_una_vez_por_version(self):
+        manifiesto_planes()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url_manifiesto_planes()).status_code, 200)
+
+        url_vieja = url_manifiesto_planes()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.precio = 12900
+            self.plan.save()
+        url_nueva = url_manifiesto_planes()
+        self.assertNotEqual(url_nueva, url_vieja)
+        # Las páginas viejas aún pueden cargar su versión
+        self.assertContains(self.client.get(url_vieja), '16900')
+
+    def test_huella_desconocida_redirige(self):
+        respuesta = self.client.get('/planes/0000000000000000.json')
+        self.assertRedirects(respuesta, url_manifiesto_planes(), fetch_redirect_response=False)
+
+    def test_formulario_no_incrusta_los_planes(self):
+        self.client.force_login(User.objects.create_user('ana', password='x'))
+        respuesta = self.client.get('/user/registrar-compra/')
+        self.assertContains(respuesta, url_manifiesto_planes())
+        self.assertNotContains(respuesta, '"nombre": "Premium"')
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class LogosServicioTests(TestCase):
+    """Ingesta de logos a variantes locales y su template tag"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.origen = tempfile.mkdtemp()
+        for directorio in (self.media, self.origen):
+            self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        Image.new('RGBA', (200, 80), (229, 9, 20, 255)).save(os.path.join(self.origen, 'Netflix_logo.png'))
+        Image.new('RGBA', (200, 80), (229, 9, 20, 255)).save(os.path.join(self.origen, 'Netflix_copia.png'))
+        with open(os.path.join(self.origen, 'Spotify_logo.svg'), 'w') as svg:
+            svg.write('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><circle r="5"/></svg>')
+
+        categoria = CategoriaStreaming.objects.create(nombre='Películas')
+        self.netflix = ServicioStreaming.objects.create(
+            nombre='Netflix', categoria=categoria, descripcion='Series', sitio_web='https://netflix.com',
+            logo_url='https://upload.wikimedia.org/wikipedia/commons/0/08/Netflix_logo.png'
+        )
+        self.spotify = ServicioStreaming.objects.create(
+            nombre='Spotify', categoria=categoria, descripcion='Música', sitio_web='https://spotify.com',
+            logo_url='https://upload.wikimedia.org/wikipedia/commons/1/19/Spotify_logo.svg'
+        )
+
+    def _ingerir(self):
+        salida = StringIO()
+        call_command('ingerir_logos', workers=1, origen=self.origen, stdout=salida)
+        return salida.getvalue()
+
+    def test_genera_variantes_sin_ampliar(self):
+        self._ingerir()
+        logo = LogoServicio.objects.get(servicio=self.netflix)
+        self.assertEqual(logo.formatos, ['avif', 'webp', 'png'])
+        self.assertEqual(logo.anchos, [64, 128])  # el original mide 200 px
+        for extension in logo.formatos:
+            for ancho in logo.anchos:
+                self.assertTrue(default_storage.exists(ruta_variante(logo.huella, extension, ancho)))
+        with default_storage.open(ruta_variante(logo.huella, 'webp', 64)) as archivo:
+            self.assertEqual(Image.open(archivo).size, (64, 26))
+
+    def test_svg_sin_cairosvg_se_guarda_tal_cual(self):
+        if cairosvg is not None:
+            self.skipTest('cairosvg instalado: el SVG se rasteriza')
+        self._ingerir()
+        logo = LogoServicio.objects.get(servicio=self.spotify)
+        self.assertEqual((logo.formatos, logo.anchos), (['svg'], []))
+        self.assertTrue(default_storage.exists(ruta_variante(logo.huella, 'svg')))
+
+    def test_reingesta_solo_procesa_cambios(self):
+        self._ingerir()
+        self.assertIn('Todos los logos están al día (2)', self._ingerir())
+
+        huella = LogoServicio.objects.get(servicio=self.netflix).huella
+        self.netflix.logo_url = 'https://example.com/Netflix_copia.png'  # mismo contenido, otra URL
+        self.netflix.save()
+        with mock.patch('core_public.logos.generar_variantes') as generar:
+            self.assertIn('Logos con variantes nuevas: 0', self._ingerir())
+        generar.assert_not_called()
+        logo = LogoServicio.objects.get(servicio=self.netflix)
+        self.assertEqual((logo.url_origen, logo.huella), (self.netflix.logo_url, huella))
+
+    def test_logo_faltante_no_detiene_la_ingesta(self):
+        os.remove(os.path.join(self.origen, 'Spotify_logo.svg'))
+        salida = self._ingerir()
+        self.assertIn('Logos con error: 1', salida)
+        self.assertTrue(LogoServicio.objects.filter(servicio=self.netflix).exists())
+
+    def test_template_tag(self):
+        plantilla = Template('{% load catalogo_extras %}{% logo_servicio servicio 128 "logo" %}')
+        remoto = plantilla.render(Context({'servicio': self.netflix}))
+        self.assertIn(f'src="{self.netflix.logo_url}"', remoto)
+        self.assertIn('loading="lazy"', remoto)
+
+        self._ingerir()
+        servicio = ServicioStreaming.objects.select_related('logo').get(pk=self.netflix.pk)
+        with self.assertNumQueries(0):
+            html = plantilla.render(Context({'servicio': servicio}))
+        huella = servicio.logo.huella
+        self.assertIn(f'<source type="image/avif" srcset="/media/logos/{huella[:2]}/{huella}-64.avif 64w, ', html)
+        self.assertIn(f'src="/media/logos/{huella[:2]}/{huella}-128.png"', html)
+        self.assertIn('sizes="128px"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertNotIn('wikimedia', html)
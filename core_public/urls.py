@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'public'
 
@@ -8,4 +8,11 @@ urlpatterns = [
     path('catalogo/', views.catalogo_servicios, name='catalogo'),
     path('servicio/<int:servicio_id>/', views.detalle_servicio, name='detalle_servicio'),
     path('proyecto/', views.informacion_proyecto, name='informacion_proyecto'),
+    path('planes/<slug:huella>.json', views.manifiesto_planes, name='manifiesto_planes'),
+
+    # API JSON de solo lectura
+    path('api/catalogo/categorias/', api.api_categorias, name='api_categorias'),
+    path('api/catalogo/servicios/', api.api_servicios, name='api_servicios'),
+    path('api/catalogo/servicios/<int:servicio_id>/', api.api_detalle_servicio, name='api_detalle_servicio'),
+    path('api/catalogo/planes/', api.api_planes, name='api_planes'),
 ]
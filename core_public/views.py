@@ -1,76 +1,135 @@
-from django.shortcuts import render, get_object_or_404
+from functools import partial
+
+from django.conf import settings
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.db.models import Case, Count, Min, Q, OuterRef, Subquery, Value, When
 from .models import ServicioStreaming, CategoriaStreaming, PlanSuscripcion
+from .cache_catalogo import cachear_para_anonimos, version_catalogo
+from .configuracion import configuracion_activa
+from .busqueda import buscar_servicios
+from .asequibles import indice_asequibles
+from .manifiesto import contenido_por_huella, url_manifiesto_planes
+
+
+def categorias_con_conteo():
+    """Categorías activas con la cantidad de servicios activos (una sola consulta agrupada)"""
+    return CategoriaStreaming.objects.filter(activo=True).annotate(
+        num_servicios=Count('servicios', filter=Q(servicios__activo=True))
+    )
+
 
+def servicios_con_resumen(**filtros):
+    """
+    Servicios activos con su categoría, la cantidad de planes activos, el
+    precio más bajo y los puntos del plan más barato, en una sola consulta.
+    """
+    plan_mas_barato = PlanSuscripcion.objects.filter(
+        servicio=OuterRef('pk'),
+        activo=True
+    ).order_by('precio', 'id')
+    return ServicioStreaming.objects.filter(activo=True, **filtros).select_related('categoria', 'logo').annotate(
+        num_planes=Count('planes', filter=Q(planes__activo=True)),
+        precio_desde=Min('planes__precio', filter=Q(planes__activo=True)),
+        puntos_desde=Subquery(plan_mas_barato.values('puntos_primera_compra')[:1]),
+    )
 
+
+@cachear_para_anonimos
 def index(request):
     """Página principal - Vista pública"""
-    servicios_destacados = ServicioStreaming.objects.filter(activo=True)[:6]
-    categorias = CategoriaStreaming.objects.filter(activo=True)
+    servicios_destacados = ServicioStreaming.objects.filter(activo=True).select_related('categoria', 'logo')[:6]
+    categorias = categorias_con_conteo()
     
     context = {
         'servicios_destacados': servicios_destacados,
         'categorias': categorias,
+        'version_catalogo': version_catalogo(),
+        'cache_timeout': settings.CATALOGO_CACHE_TIMEOUT,
     }
     return render(request, 'public/index.html', context)
 
 
+def _por_relevancia(servicios, busqueda):
+    ids = buscar_servicios(busqueda)
+    return servicios.filter(id__in=ids).order_by(
+        Case(*[When(id=pk, then=Value(posicion)) for posicion, pk in enumerate(ids)], default=Value(len(ids)))
+    )
+
+
+@cachear_para_anonimos
 def catalogo_servicios(request):
     """Catálogo completo de servicios de streaming"""
     categoria_id = request.GET.get('categoria')
+    busqueda = request.GET.get('q', '').strip()
     
     if categoria_id:
-        servicios = ServicioStreaming.objects.filter(
-            categoria_id=categoria_id,
-            activo=True
-        )
+        servicios = servicios_con_resumen(categoria_id=categoria_id)
     else:
-        servicios = ServicioStreaming.objects.filter(activo=True)
+        servicios = servicios_con_resumen()
     
-    categorias = CategoriaStreaming.objects.filter(activo=True)
+    if busqueda:
+        # Resultados del índice de texto completo, en orden de relevancia. La
+        # búsqueda solo corre si la plantilla los usa (los fragmentos cacheados no)
+        servicios = SimpleLazyObject(partial(_por_relevancia, servicios, busqueda))
+    
+    categorias = categorias_con_conteo()
+    
+    # Servicios con algún plan pagable con los puntos del usuario (badge dorado).
+    # Va fuera de los fragmentos cacheados, que son iguales para todos.
+    servicios_asequibles = []
+    if request.user.is_authenticated:
+        from core_user.models import PerfilUsuario
+        perfil, created = PerfilUsuario.objects.get_or_create(user=request.user)
+        request.user.perfil = perfil  # el menú reutiliza este perfil
+        indice = indice_asequibles()
+        if indice:
+            servicios_asequibles = sorted(indice.servicios_asequibles(perfil.puntos_disponibles))
     
     context = {
         'servicios': servicios,
         'categorias': categorias,
         'categoria_seleccionada': categoria_id,
+        'busqueda': busqueda,
+        'servicios_asequibles': servicios_asequibles,
+        'version_catalogo': version_catalogo(),
+        'cache_timeout': settings.CATALOGO_CACHE_TIMEOUT,
     }
     return render(request, 'public/catalogo.html', context)
 
 
+@cachear_para_anonimos
 def detalle_servicio(request, servicio_id):
     """Detalle de un servicio con sus planes"""
-    servicio = get_object_or_404(ServicioStreaming, id=servicio_id, activo=True)
+    servicio = get_object_or_404(ServicioStreaming.objects.select_related('categoria', 'logo'), id=servicio_id, activo=True)
     planes = servicio.planes.filter(activo=True)
     
     # Obtener puntos del usuario y configuración
     puntos_disponibles = 0
     config = None
+    indice = None
     if request.user.is_authenticated:
         from core_user.models import PerfilUsuario
-        from .models import ConfiguracionRecompensa
         try:
             perfil = PerfilUsuario.objects.get(user=request.user)
+            request.user.perfil = perfil  # el menú reutiliza este perfil
             puntos_disponibles = perfil.puntos_disponibles
-            config = ConfiguracionRecompensa.objects.filter(activo=True).first()
+            config = configuracion_activa()
+            indice = indice_asequibles()
         except PerfilUsuario.DoesNotExist:
             pass
     
-    # Calcular para cada plan si puede pagarse con puntos
+    # Puntos necesarios de cada plan según el índice de planes asequibles
     planes_con_info = []
     for plan in planes:
-        plan_info = {
+        puntos_necesarios = (indice.puntos_necesarios(plan.id) or 0) if indice else 0
+        planes_con_info.append({
             'plan': plan,
-            'puede_pagar_con_puntos': False,
-            'puntos_necesarios': 0,
-            'puntos_faltantes': 0,
-        }
-        
-        if config:
-            puntos_necesarios = int(plan.precio * config.puntos_por_peso)
-            plan_info['puntos_necesarios'] = puntos_necesarios
-            plan_info['puede_pagar_con_puntos'] = puntos_disponibles >= puntos_necesarios
-            plan_info['puntos_faltantes'] = max(0, puntos_necesarios - puntos_disponibles)
-        
-        planes_con_info.append(plan_info)
+            'puede_pagar_con_puntos': bool(indice) and puntos_disponibles >= puntos_necesarios,
+            'puntos_necesarios': puntos_necesarios,
+            'puntos_faltantes': max(0, puntos_necesarios - puntos_disponibles),
+        })
     
     context = {
         'servicio': servicio,
@@ -82,6 +141,22 @@ def detalle_servicio(request, servicio_id):
     return render(request, 'public/detalle_servicio.html', context)
 
 
+def manifiesto_planes(request, huella):
+    """
+    Manifiesto JSON de planes por servicio. La URL cambia con el contenido,
+    así que se puede guardar sin revalidar; una huella que ya no existe
+    redirige a la vigente.
+    """
+    contenido = contenido_por_huella(huella)
+    if contenido is None:
+        respuesta = redirect(url_manifiesto_planes())
+        respuesta['Cache-Control'] = 'no-cache'
+        return respuesta
+    respuesta = HttpResponse(contenido, content_type='application/json')
+    respuesta['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return respuesta
+
+
 def informacion_proyecto(request):
     """Información sobre el proyecto StreamPoint"""
     return render(request, 'public/informacion_proyecto.html')
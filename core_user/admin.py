@@ -2,8 +2,12 @@
 # core_user/admin.py
 # ============================================
 from django.contrib import admin
-from .models import PerfilUsuario, Suscripcion, TransaccionPuntos, RegistroCompra
 from django.utils import timezone
+from .models import (
+    PerfilUsuario, Suscripcion, TransaccionPuntos, RegistroCompra, CheckpointPuntos,
+    CambioEstadoSuscripcion, CorreoPendiente, ComprobanteAlmacenado
+)
+from .suscripciones import validar_suscripciones_lote
 
 @admin.register(PerfilUsuario)
 class PerfilUsuarioAdmin(admin.ModelAdmin):
@@ -24,14 +28,10 @@ class SuscripcionAdmin(admin.ModelAdmin):
     actions = ['validar_suscripciones', 'rechazar_suscripciones']
     
     def validar_suscripciones(self, request, queryset):
-        """Acción para validar múltiples suscripciones"""
-        count = 0
-        for suscripcion in queryset.filter(validada=False):
-            suscripcion.validada = True
-            suscripcion.fecha_validacion = timezone.now()
-            suscripcion.estado = 'activa'
-            suscripcion.save()
-            count += 1
+        """Acción para validar múltiples suscripciones en bloque"""
+        count = validar_suscripciones_lote(
+            list(queryset.filter(validada=False).values_list('id', flat=True))
+        )
         self.message_user(request, f'{count} suscripción(es) validada(s) exitosamente.')
     validar_suscripciones.short_description = "Validar suscripciones seleccionadas"
     
@@ -50,19 +50,33 @@ class TransaccionPuntosAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha']
 
 
+@admin.register(CambioEstadoSuscripcion)
+class CambioEstadoSuscripcionAdmin(admin.ModelAdmin):
+    list_display = ['suscripcion', 'estado_anterior', 'estado_nuevo', 'motivo', 'fecha']
+    list_filter = ['estado_nuevo', 'fecha']
+    readonly_fields = ['suscripcion', 'estado_anterior', 'estado_nuevo', 'motivo', 'fecha']
+
+
+@admin.register(CheckpointPuntos)
+class CheckpointPuntosAdmin(admin.ModelAdmin):
+    list_display = ['perfil', 'puntos_totales', 'puntos_disponibles', 'ultima_transaccion_id', 'fecha']
+    search_fields = ['perfil__user__username']
+    readonly_fields = ['perfil', 'puntos_totales', 'puntos_disponibles', 'ultima_transaccion_id', 'fecha', 'fecha_creacion']
+
+
 @admin.register(RegistroCompra)
 class RegistroCompraAdmin(admin.ModelAdmin):
     list_display = ['id', 'usuario', 'servicio', 'monto_pagado', 'estado', 'fecha_compra', 'fecha_registro', 'puntos_otorgados']
     list_filter = ['estado', 'servicio', 'fecha_compra', 'fecha_registro']
     search_fields = ['usuario__username', 'nombre_completo', 'correo', 'nombre_usuario_app']
-    readonly_fields = ['fecha_registro', 'fecha_revision']
+    readonly_fields = ['fecha_registro', 'fecha_revision', 'comprobante_almacenado']
     
     fieldsets = (
         ('Información del Usuario', {
             'fields': ('usuario', 'nombre_completo', 'correo', 'nombre_usuario_app', 'telefono')
         }),
         ('Información de la Compra', {
-            'fields': ('servicio', 'plan', 'monto_pagado', 'fecha_compra', 'comprobante', 'descripcion')
+            'fields': ('servicio', 'plan', 'monto_pagado', 'fecha_compra', 'comprobante', 'comprobante_almacenado', 'descripcion')
         }),
         ('Estado y Revisión', {
             'fields': ('estado', 'fecha_registro', 'fecha_revision', 'revisado_por', 'puntos_otorgados', 'notas_admin')
@@ -70,3 +84,29 @@ class RegistroCompraAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ComprobanteAlmacenado)
+class ComprobanteAlmacenadoAdmin(admin.ModelAdmin):
+    list_display = ['huella', 'referencias', 'tamano', 'fecha_creacion', 'fecha_actualizacion']
+    list_filter = ['fecha_creacion']
+    search_fields = ['huella']
+    readonly_fields = [
+        'huella', 'ruta', 'tamano', 'referencias', 'fecha_creacion', 'fecha_actualizacion',
+        'miniatura', 'vista_previa', 'fecha_miniaturas'
+    ]
+
+
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    list_display = ['asunto', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_envio']
+    list_filter = ['estado', 'fecha_creacion']
+    search_fields = ['asunto', 'ultimo_error']
+    readonly_fields = ['fecha_creacion', 'fecha_envio', 'reclamado_por', 'ultimo_error']
+    actions = ['reintentar']
+    
+    def reintentar(self, request, queryset):
+        """Devuelve correos fallidos (dead-letter) a la cola"""
+        reencolados = queryset.filter(estado='fallido').update(
+            estado='pendiente', intentos=0, proximo_intento=timezone.now()
+        )
+        self.message_user(request, f'{reencolados} correo(s) devueltos a la cola.')
+    reintentar.short_description = "Reintentar correos fallidos"
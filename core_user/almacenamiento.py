@@ -0,0 +1,113 @@
+# ============================================
+# core_user/almacenamiento.py
+# Almacenamiento de comprobantes por contenido
+# ============================================
+"""
+Cada comprobante se guarda una sola vez con el SHA-256 de su contenido como
+nombre (comprobantes/ab/cd/<huella>.<ext>). La huella se calcula mientras el
+archivo se escribe a disco, sin leerlo dos veces: si ya existía un archivo con
+esa huella, la copia nueva se descarta y el registro apunta al existente.
+
+El índice ComprobanteAlmacenado (models.py) cuenta cuántos registros de compra
+usan cada archivo; con él se detectan comprobantes repetidos entre usuarios y
+se sabe qué archivos ya no usa nadie (comando `deduplicar_comprobantes`).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+DIRECTORIO = 'comprobantes'
+DIRECTORIO_TEMPORAL = f'{DIRECTORIO}/tmp'
+# El mismo contenido subido como .jpeg y como .jpg debe terminar en el mismo archivo
+_EXTENSIONES_EQUIVALENTES = {'.jpeg': '.jpg'}
+_RUTA = re.compile(rf'^{DIRECTORIO}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+
+
+def ruta_comprobante(huella, extension=''):
+    return f'{DIRECTORIO}/{huella[:2]}/{huella[2:4]}/{huella}{extension}'
+
+
+def huella_de_ruta(nombre):
+    """Huella de un comprobante guardado por contenido, o None (p. ej. archivos antiguos)"""
+    coincidencia = _RUTA.match(nombre or '')
+    return coincidencia.group(1) if coincidencia else None
+
+
+class AlmacenamientoComprobantes(FileSystemStorage):
+    """FileSystemStorage que nombra los archivos por su contenido y no los duplica"""
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide _save según el contenido; un archivo
+        # con el mismo nombre es el mismo contenido y no hay que renombrar nada
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        extension = _EXTENSIONES_EQUIVALENTES.get(extension, extension)
+        huella = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Subida grande que Django ya dejó en disco: se lee para la huella y se mueve
+            origen = content.temporary_file_path()
+            for parte in content.chunks():
+                huella.update(parte)
+        else:
+            origen = self._escribir_temporal(content.chunks(), huella)
+
+        nombre = ruta_comprobante(huella.hexdigest(), extension)
+        self._publicar(origen, nombre, mover=hasattr(content, 'temporary_file_path'))
+        return nombre
+
+    def guardar_derivado(self, nombre, datos):
+        """
+        Guarda con el nombre dado un archivo derivado de un comprobante (p. ej.
+        su miniatura, nombrada con la huella del original)
+        """
+        self._publicar(self._escribir_temporal([datos]), nombre)
+        return nombre
+
+    def _escribir_temporal(self, partes, huella=None):
+        directorio = self.path(DIRECTORIO_TEMPORAL)
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio)
+        try:
+            with os.fdopen(descriptor, 'wb') as destino:
+                for parte in partes:
+                    if huella is not None:
+                        huella.update(parte)
+                    destino.write(parte)
+        except BaseException:
+            os.remove(temporal)
+            raise
+        return temporal
+
+    def _publicar(self, origen, nombre, mover=False):
+        """Deja `origen` en `nombre`; si ya existe, es el mismo contenido y se descarta"""
+        ruta = self.path(nombre)
+        try:
+            # Se renueva la fecha del archivo existente: la purga de archivos sin
+            # referencias respeta el plazo de gracia mientras el registro que lo
+            # va a usar todavía no se guarda
+            os.utime(ruta)
+        except FileNotFoundError:
+            pass
+        else:
+            if not mover:
+                os.remove(origen)
+            return
+
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        if mover:
+            file_move_safe(origen, ruta)
+        else:
+            # Mismo sistema de archivos (el temporal está dentro de MEDIA_ROOT): el cambio es atómico
+            os.replace(origen, ruta)
+        if self.file_permissions_mode is not None:
+            os.chmod(ruta, self.file_permissions_mode)
+
+
+almacenamiento_comprobantes = AlmacenamientoComprobantes()
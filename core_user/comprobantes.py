@@ -0,0 +1,496 @@
+# ============================================
+# core_user/comprobantes.py
+# Validación incremental de comprobantes de pago
+# ============================================
+"""
+Los comprobantes (PDF, PNG, JPEG o WEBP de hasta 5MB) se validan a medida que
+llegan los bytes, sin cargar el archivo completo en memoria:
+
+- El tipo se detecta por los bytes mágicos del inicio, no por la extensión.
+- La estructura se recorre en línea: bloques y CRC de PNG, segmentos de
+  JPEG hasta el EOI, chunks RIFF de WEBP y encabezado/fin de PDF. Solo se
+  guardan en memoria los encabezados (a lo sumo un segmento JPEG de 64KB).
+- Las dimensiones se limitan para frenar bombas de descompresión. Después
+  del fin de la imagen solo se acepta una cola corta: relleno de ceros y,
+  en JPEG, los trailers que agregan algunas cámaras y celulares; un
+  ejecutable, ZIP, PDF o script pegado al final (archivo políglota) se
+  rechaza, igual que los PDF con acciones activas (/JavaScript, /Launch, ...).
+
+`ComprobanteUploadHandler` aplica el validador mientras Django recibe la
+subida y corta el archivo en cuanto algo falla o se pasa del tamaño máximo.
+`validar_comprobante` hace lo mismo sobre un archivo ya recibido (validador
+del modelo); los archivos que el handler ya validó quedan marcados con
+`marcar_validado` y no se vuelven a leer.
+"""
+import re
+import struct
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+TAMANO_MAXIMO = 5 * 1024 * 1024
+MAX_LADO = 20000
+MAX_PIXELES = 50_000_000  # unos 50 megapíxeles: más que cualquier captura o foto de un recibo
+CAMPO = 'comprobante'
+
+MENSAJE_TAMANO = "El archivo no puede ser mayor a 5MB. Por favor, comprima la imagen o use un archivo más pequeño."
+MENSAJE_TIPO = "Tipo de archivo no permitido. Solo se aceptan PDF, JPG, PNG o WEBP válidos."
+
+
+class ComprobanteInvalido(ValidationError):
+    """El comprobante no es un archivo permitido o su estructura está dañada"""
+
+
+def _invalido(formato, detalle):
+    return ComprobanteInvalido(f"El archivo {formato} está corrupto o no es válido: {detalle}")
+
+
+def _validar_dimensiones(formato, ancho, alto):
+    if not (0 < ancho <= MAX_LADO and 0 < alto <= MAX_LADO) or ancho * alto > MAX_PIXELES:
+        raise _invalido(formato, f'dimensiones no permitidas ({ancho}x{alto})')
+
+
+# ============================================
+# RECORRIDO POR FORMATO
+# ============================================
+# Cada formato es un generador que pide bytes al Validador con:
+#   ('leer', n)         -> recibe exactamente n bytes (n pequeño)
+#   ('saltar', n, fn)   -> los siguientes n bytes se pasan a fn sin guardarse
+#   ('flujo', fn)       -> fn(bytes) retorna cuántos consumió al terminar, o None si quiere más
+#   ('resto', objeto)   -> objeto.alimentar(bytes) hasta el final y objeto.finalizar()
+# Cuando el generador termina, el archivo debe terminar también.
+
+def _ignorar(datos):
+    pass
+
+
+def _png():
+    yield ('leer', 8)  # firma, ya verificada al detectar el tipo
+    primero = True
+    vio_idat = False
+    while True:
+        largo, tipo = struct.unpack('>I4s', (yield ('leer', 8)))
+        if largo > 0x7FFFFFFF or not tipo.isalpha():
+            raise _invalido('PNG', 'bloque mal formado')
+        if primero and (tipo != b'IHDR' or largo != 13):
+            raise _invalido('PNG', 'falta el encabezado IHDR')
+        crc = [zlib.crc32(tipo)]
+
+        if tipo == b'IHDR':
+            datos = yield ('leer', 13)
+            crc[0] = zlib.crc32(datos, crc[0])
+            ancho, alto, profundidad, color = struct.unpack('>IIBB', datos[:10])
+            _validar_dimensiones('PNG', ancho, alto)
+            if profundidad not in (1, 2, 4, 8, 16) or color not in (0, 2, 3, 4, 6):
+                raise _invalido('PNG', 'encabezado IHDR inválido')
+        elif largo:
+            yield ('saltar', largo, lambda datos: crc.__setitem__(0, zlib.crc32(datos, crc[0])))
+
+        (esperado,) = struct.unpack('>I', (yield ('leer', 4)))
+        if esperado != crc[0] & 0xFFFFFFFF:
+            raise _invalido('PNG', f'CRC incorrecto en el bloque {tipo.decode("ascii")}')
+
+        primero = False
+        vio_idat = vio_idat or tipo == b'IDAT'
+        if tipo == b'IEND':
+            if not vio_idat:
+                raise _invalido('PNG', 'no contiene datos de imagen')
+            return
+
+
+# Marcadores SOF (inicio de cuadro) que llevan las dimensiones
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class _EscanerEntropia:
+    """
+    Recorre los datos comprimidos de un JPEG (tras SOS) hasta el siguiente
+    marcador real: 0xFF seguido de algo distinto de 0x00 (relleno), RSTn o 0xFF.
+    """
+
+    def __init__(self):
+        self.ff_pendiente = False
+        self.marcador = None
+
+    def __call__(self, datos):
+        datos = bytes(datos)
+        i = 0
+        if self.ff_pendiente:
+            self.ff_pendiente = False
+            i = self._despues_de_ff(datos, -1)
+            if self.marcador is not None:
+                return i
+        while True:
+            j = datos.find(b'\xff', i)
+            if j == -1:
+                return None
+            if j + 1 == len(datos):
+                self.ff_pendiente = True
+                return None
+            i = self._despues_de_ff(datos, j)
+            if self.marcador is not None:
+                return i
+
+    def _despues_de_ff(self, datos, j):
+        siguiente = datos[j + 1]
+        if siguiente == 0x00 or 0xD0 <= siguiente <= 0xD7:
+            return j + 2
+        if siguiente == 0xFF:
+            return j + 1
+        self.marcador = siguiente
+        return j + 2
+
+
+def _jpeg():
+    yield ('leer', 2)  # SOI, ya verificado al detectar el tipo
+    vio_sof = False
+    vio_sos = False
+    marcador = None
+    while True:
+        if marcador is None:
+            prefijo, marcador = yield ('leer', 2)
+            if prefijo != 0xFF:
+                raise _invalido('JPEG', 'segmento mal formado')
+            while marcador == 0xFF:  # bytes de relleno
+                (marcador,) = yield ('leer', 1)
+
+        if marcador == 0xD9:  # EOI
+            if not vio_sos:
+                raise _invalido('JPEG', 'no contiene datos de imagen')
+            return
+        if 0xD0 <= marcador <= 0xD7 or marcador == 0x01:
+            marcador = None
+            continue
+
+        (largo,) = struct.unpack('>H', (yield ('leer', 2)))
+        if largo < 2:
+            raise _invalido('JPEG', 'segmento mal formado')
+        if marcador in _SOF:
+            datos = yield ('leer', largo - 2)
+            if len(datos) < 5:
+                raise _invalido('JPEG', 'encabezado de cuadro incompleto')
+            _, alto, ancho = struct.unpack('>BHH', datos[:5])
+            _validar_dimensiones('JPEG', ancho, alto)
+            vio_sof = True
+        elif largo > 2:
+            yield ('saltar', largo - 2, _ignorar)
+
+        if marcador == 0xDA:  # SOS: siguen datos comprimidos hasta el próximo marcador
+            if not vio_sof:
+                raise _invalido('JPEG', 'datos de imagen sin encabezado de cuadro')
+            vio_sos = True
+            escaner = _EscanerEntropia()
+            yield ('flujo', escaner)
+            marcador = escaner.marcador
+        else:
+            marcador = None
+
+
+def _webp():
+    _, tamano, _ = struct.unpack('<4sI4s', (yield ('leer', 12)))
+    if tamano + 8 > TAMANO_MAXIMO:
+        raise ComprobanteInvalido(MENSAJE_TAMANO)
+    restante = tamano - 4
+    primero = True
+    while restante > 0:
+        if restante < 8:
+            raise _invalido('WEBP', 'chunk incompleto')
+        tipo, largo = struct.unpack('<4sI', (yield ('leer', 8)))
+        ocupado = largo + (largo & 1)  # los chunks se rellenan a tamaño par
+        if ocupado + 8 > restante:
+            raise _invalido('WEBP', 'el chunk excede el archivo')
+
+        leido = 0
+        if primero:
+            if tipo not in (b'VP8 ', b'VP8L', b'VP8X'):
+                raise _invalido('WEBP', 'no contiene datos de imagen')
+            leido = min(largo, 10)
+            ancho, alto = _dimensiones_webp(tipo, (yield ('leer', leido)))
+            _validar_dimensiones('WEBP', ancho, alto)
+            primero = False
+        if ocupado > leido:
+            yield ('saltar', ocupado - leido, _ignorar)
+        restante -= 8 + ocupado
+    if primero:
+        raise _invalido('WEBP', 'no contiene datos de imagen')
+
+
+def _dimensiones_webp(tipo, datos):
+    if tipo == b'VP8X' and len(datos) >= 10:
+        return (int.from_bytes(datos[4:7], 'little') + 1, int.from_bytes(datos[7:10], 'little') + 1)
+    if tipo == b'VP8L' and len(datos) >= 5 and datos[0] == 0x2F:
+        bits = int.from_bytes(datos[1:5], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if tipo == b'VP8 ' and len(datos) >= 10 and datos[3:6] == b'\x9d\x01\x2a':
+        ancho, alto = struct.unpack('<HH', datos[6:10])
+        return ancho & 0x3FFF, alto & 0x3FFF
+    raise _invalido('WEBP', 'encabezado de imagen inválido')
+
+
+# ============================================
+# DATOS DESPUÉS DEL FIN DE LA IMAGEN
+# ============================================
+
+MAX_COLA = 64 * 1024
+# Firmas de ejecutables, archivos comprimidos, PDF y HTML activo
+_FIRMA_PROHIBIDA = re.compile(rb'PK\x03\x04|%PDF|<script', re.IGNORECASE)
+_SOLAPE_COLA = 8
+
+
+class _ColaImagen:
+    """
+    Revisa los bytes que siguen al fin de la imagen: relleno de ceros (y, si
+    se permiten, trailers de fabricante) de hasta MAX_COLA bytes, sin
+    ejecutables ni archivos comprimidos escondidos.
+    """
+
+    def __init__(self, formato, permite_trailers):
+        self.formato = formato
+        self.permite_trailers = permite_trailers
+        self.tamano = 0
+        self.contenido = b''  # primeros bytes distintos de cero, para detectar 'MZ'
+        self.solape = b''
+
+    def alimentar(self, datos):
+        datos = bytes(datos)
+        self.tamano += len(datos)
+        if self.tamano > MAX_COLA:
+            raise self._rechazo()
+        if len(self.contenido) < 2:
+            self.contenido = (self.contenido + datos).lstrip(b'\x00')[:2]
+            if self.contenido and not self.permite_trailers:
+                raise self._rechazo()
+            if self.contenido.startswith(b'MZ'):
+                raise self._rechazo()
+        ventana = self.solape + datos
+        if _FIRMA_PROHIBIDA.search(ventana):
+            raise self._rechazo()
+        self.solape = ventana[-_SOLAPE_COLA:]
+
+    def _rechazo(self):
+        return _invalido(self.formato, 'contiene datos después del final de la imagen')
+
+
+# Nombres PDF que ejecutan código o abren otros archivos al visualizar
+_PDF_ACTIVO = re.compile(rb'/(JavaScript|JS|Launch|EmbeddedFile|RichMedia)(?![A-Za-z0-9])')
+# Nombres con escapes #xx (/J#61vaScript es /JavaScript para el lector de PDF)
+_NOMBRE_ESCAPADO = re.compile(rb'/[^\x00\t\n\x0c\r /%()<>\[\]{}]*#[^\x00\t\n\x0c\r /%()<>\[\]{}]*')
+_ESCAPE_NOMBRE = re.compile(rb'#([0-9A-Fa-f]{2})')
+# Alcanza para el nombre activo más largo con todos sus caracteres escapados
+_SOLAPE_PDF = 64
+_COLA_PDF = 1024
+
+
+class _EscanerPdf:
+    """Busca nombres activos (con solape entre bloques) y guarda solo la cola del archivo"""
+
+    def __init__(self):
+        self.cola = b''
+
+    def alimentar(self, datos):
+        ventana = self.cola[-_SOLAPE_PDF:] + bytes(datos)
+        if _PDF_ACTIVO.search(ventana) or any(
+            _PDF_ACTIVO.match(_ESCAPE_NOMBRE.sub(lambda escape: bytes([int(escape.group(1), 16)]), nombre.group()))
+            for nombre in _NOMBRE_ESCAPADO.finditer(ventana)
+        ):
+            raise ComprobanteInvalido("El PDF contiene acciones activas (JavaScript o archivos embebidos) y no se acepta.")
+        self.cola = ventana[-_COLA_PDF:]
+
+    def finalizar(self):
+        if b'%%EOF' not in self.cola:
+            raise _invalido('PDF', 'el archivo está incompleto')
+
+
+def _pdf():
+    encabezado = yield ('leer', 8)
+    if not re.match(rb'%PDF-\d\.\d', encabezado):
+        raise _invalido('PDF', 'encabezado inválido')
+    yield ('resto', _EscanerPdf())
+
+
+def detectar_formato(inicio):
+    """Formato según los bytes mágicos (necesita los primeros 12 bytes)"""
+    if inicio.startswith(b'%PDF-'):
+        return 'PDF', _pdf
+    if inicio.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG', _png
+    if inicio.startswith(b'\xff\xd8\xff'):
+        return 'JPEG', _jpeg
+    if inicio[:4] == b'RIFF' and inicio[8:12] == b'WEBP':
+        return 'WEBP', _webp
+    return None, None
+
+
+# ============================================
+# VALIDADOR
+# ============================================
+
+class ValidadorComprobante:
+    """
+    Recibe el archivo por partes con `alimentar(bytes)` y se cierra con
+    `finalizar()`. Lanza ComprobanteInvalido apenas detecta un problema.
+    """
+    BYTES_DETECCION = 12
+
+    def __init__(self, tamano_maximo=TAMANO_MAXIMO):
+        self.tamano_maximo = tamano_maximo
+        self.tamano = 0
+        self.formato = None
+        self._inicio = b''
+        self._recorrido = None
+        self._paso = None
+        self._buffer = bytearray()
+        self._terminado = False
+        self._cola = None
+
+    def alimentar(self, datos):
+        self.tamano += len(datos)
+        if self.tamano > self.tamano_maximo:
+            raise ComprobanteInvalido(MENSAJE_TAMANO)
+
+        if self._recorrido is None:
+            # Se acumula hasta tener los bytes mágicos (casi siempre llegan en el primer bloque)
+            self._inicio += bytes(datos)
+            if len(self._inicio) < self.BYTES_DETECCION:
+                return
+            self.formato, recorrido = detectar_formato(self._inicio)
+            if recorrido is None:
+                raise ComprobanteInvalido(MENSAJE_TIPO)
+            self._recorrido = recorrido()
+            self._paso = next(self._recorrido)
+            datos, self._inicio = self._inicio, b''
+        self._consumir(memoryview(datos))
+
+    def _avanzar(self, valor=None):
+        try:
+            self._paso = self._recorrido.send(valor)
+        except StopIteration:
+            self._paso = None
+            self._terminado = True
+
+    def _consumir(self, datos):
+        posicion = 0
+        while posicion < len(datos):
+            if self._terminado:
+                if self._cola is None:
+                    self._cola = _ColaImagen(self.formato, permite_trailers=self.formato == 'JPEG')
+                self._cola.alimentar(datos[posicion:])
+                return
+            operacion = self._paso
+            tipo = operacion[0]
+            if tipo == 'leer':
+                falta = operacion[1] - len(self._buffer)
+                self._buffer += datos[posicion:posicion + falta]
+                posicion += min(falta, len(datos) - posicion)
+                if len(self._buffer) == operacion[1]:
+                    valor = bytes(self._buffer)
+                    self._buffer.clear()
+                    self._avanzar(valor)
+            elif tipo == 'saltar':
+                parte = datos[posicion:posicion + operacion[1]]
+                operacion[2](parte)
+                posicion += len(parte)
+                restante = operacion[1] - len(parte)
+                if restante:
+                    self._paso = ('saltar', restante, operacion[2])
+                else:
+                    self._avanzar()
+            elif tipo == 'flujo':
+                consumidos = operacion[1](datos[posicion:])
+                if consumidos is None:
+                    posicion = len(datos)
+                else:
+                    posicion += consumidos
+                    self._avanzar()
+            else:  # 'resto'
+                operacion[1].alimentar(datos[posicion:])
+                posicion = len(datos)
+
+    def finalizar(self):
+        if self._recorrido is None:
+            if not self.tamano:
+                raise ComprobanteInvalido("El archivo está vacío.")
+            raise ComprobanteInvalido(MENSAJE_TIPO)
+        if self._paso and self._paso[0] == 'resto':
+            self._paso[1].finalizar()
+            self._terminado = True
+        if not self._terminado:
+            raise _invalido(self.formato, 'el archivo está incompleto')
+        return self.formato
+
+
+def marcar_validado(archivo, formato):
+    """Registra en el archivo subido que ComprobanteUploadHandler ya lo validó"""
+    archivo.formato_validado = formato
+
+
+def formato_validado(archivo):
+    """Formato con el que se validó el archivo durante la subida, o None"""
+    # Un FieldFile envuelve el archivo subido; `.file` abriría uno ya guardado
+    subido = getattr(archivo, '_file', None) or archivo
+    return getattr(subido, 'formato_validado', None)
+
+
+def validar_comprobante(archivo, tamano_maximo=TAMANO_MAXIMO):
+    """Valida un archivo ya recibido leyéndolo por partes. Retorna el formato."""
+    if archivo.size is not None and archivo.size > tamano_maximo:
+        raise ComprobanteInvalido(MENSAJE_TAMANO)
+    validador = ValidadorComprobante(tamano_maximo)
+    archivo.seek(0)
+    for parte in archivo.chunks():
+        validador.alimentar(parte)
+    archivo.seek(0)
+    return validador.finalizar()
+
+
+# ============================================
+# UPLOAD HANDLER
+# ============================================
+
+class ComprobanteUploadHandler(FileUploadHandler):
+    """
+    Valida el campo `comprobante` mientras se recibe. Debe ir primero en
+    request.upload_handlers: pasa cada bloque intacto a los handlers de
+    Django que lo guardan. Si el archivo no es válido se descarta el resto
+    sin guardarlo y el error queda en `request.errores_subida[campo]` para
+    que el formulario lo muestre; si es válido, su formato queda en
+    `request.comprobantes_validados[campo]`.
+    """
+
+    def __init__(self, request=None, campos=(CAMPO,)):
+        super().__init__(request)
+        self.campos = campos
+        self.validador = None
+        if request is not None and not hasattr(request, 'errores_subida'):
+            request.errores_subida = {}
+            request.comprobantes_validados = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.validador = ValidadorComprobante() if field_name in self.campos else None
+
+    def _rechazar(self, error):
+        if self.request is not None:
+            self.request.errores_subida[self.field_name] = error.messages[0]
+        self.validador = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.validador is not None:
+            try:
+                self.validador.alimentar(raw_data)
+            except ValidationError as error:
+                self._rechazar(error)
+                raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.validador is not None:
+            try:
+                formato = self.validador.finalizar()
+            except ValidationError as error:
+                self._rechazar(error)
+            else:
+                if self.request is not None:
+                    self.request.comprobantes_validados[self.field_name] = formato
+        return None
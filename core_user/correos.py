@@ -0,0 +1,169 @@
+# ============================================
+# core_user/correos.py
+# Bandeja de salida (outbox) de correos transaccionales
+# ============================================
+"""
+Los flujos web solo encolan filas CorreoPendiente dentro de su transacción;
+el comando enviar_correos las drena en segundo plano. Así el tiempo de
+respuesta del checkout no depende del servidor SMTP.
+
+Cada worker reclama un lote con un UPDATE condicional (sin bloqueos largos),
+lo envía sobre una sola conexión SMTP y guarda el resultado. Los fallos se
+reintentan con espera exponencial hasta MAX_INTENTOS; después el correo queda
+en estado 'fallido' (dead-letter) para revisión manual.
+"""
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.utils import timezone
+
+from .models import CorreoPendiente
+
+
+ResultadoEnvio = namedtuple('ResultadoEnvio', ['enviados', 'reintentos', 'fallidos'])
+
+MAX_INTENTOS = 5
+ESPERA_BASE = timedelta(seconds=30)
+ESPERA_MAXIMA = timedelta(hours=1)
+# Si un worker muere con un lote reclamado, otro lo retoma pasado este tiempo
+DURACION_RECLAMO = timedelta(minutes=5)
+
+
+def encolar_correo(asunto, cuerpo, destinatarios, remitente=None):
+    """Encola un correo; llamar dentro de la transacción que lo origina"""
+    return CorreoPendiente.objects.create(
+        asunto=asunto,
+        cuerpo=cuerpo,
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(destinatarios),
+    )
+
+
+def espera_reintento(intentos):
+    """Espera exponencial: 30s, 1m, 2m, 4m... con tope de una hora"""
+    return min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA)
+
+
+def _reclamar_lote(tamano_lote, token, ahora):
+    """
+    Marca como 'enviando' hasta `tamano_lote` correos disponibles. El UPDATE
+    vuelve a exigir proximo_intento <= ahora, así dos workers nunca reclaman
+    la misma fila.
+    """
+    disponibles = CorreoPendiente.objects.filter(
+        estado__in=['pendiente', 'enviando'],
+        proximo_intento__lte=ahora,
+    )
+    ids = list(disponibles.order_by('proximo_intento', 'id').values_list('id', flat=True)[:tamano_lote])
+    if not ids:
+        return []
+    disponibles.filter(id__in=ids).update(
+        estado='enviando',
+        reclamado_por=token,
+        proximo_intento=ahora + DURACION_RECLAMO,
+    )
+    return list(CorreoPendiente.objects.filter(id__in=ids, estado='enviando', reclamado_por=token))
+
+
+def _registrar_fallo(correo, error, max_intentos, ahora):
+    correo.intentos += 1
+    correo.ultimo_error = f'{type(error).__name__}: {error}'
+    correo.reclamado_por = ''
+    if correo.intentos >= max_intentos:
+        correo.estado = 'fallido'
+    else:
+        correo.estado = 'pendiente'
+        correo.proximo_intento = ahora + espera_reintento(correo.intentos)
+
+
+def _enviar_lote(correos, conexion, max_intentos):
+    """Envía el lote sobre la conexión y guarda el resultado de cada correo"""
+    enviados, fallos = [], []
+    pendientes = list(correos)
+    try:
+        conexion.open()  # No hace nada si la conexión ya está abierta
+    except Exception as error:
+        # Servidor caído: todo el lote se reintenta más tarde
+        for correo in pendientes:
+            _registrar_fallo(correo, error, max_intentos, timezone.now())
+        fallos, pendientes = pendientes, []
+
+    for i, correo in enumerate(pendientes):
+        mensaje = EmailMessage(
+            correo.asunto, correo.cuerpo, correo.remitente, correo.destinatarios, connection=conexion
+        )
+        try:
+            conexion.send_messages([mensaje])
+            enviados.append(correo.pk)
+        except Exception as error:
+            ahora = timezone.now()
+            _registrar_fallo(correo, error, max_intentos, ahora)
+            fallos.append(correo)
+            # La conexión puede haber quedado inutilizable: se reabre
+            try:
+                conexion.close()
+                conexion.open()
+            except Exception as error_conexion:
+                for resto in pendientes[i + 1:]:
+                    _registrar_fallo(resto, error_conexion, max_intentos, ahora)
+                    fallos.append(resto)
+                break
+
+    if enviados:
+        CorreoPendiente.objects.filter(id__in=enviados).update(
+            estado='enviado', fecha_envio=timezone.now(), reclamado_por=''
+        )
+    if fallos:
+        CorreoPendiente.objects.bulk_update(
+            fallos, ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'reclamado_por']
+        )
+    fallidos = sum(1 for correo in fallos if correo.estado == 'fallido')
+    return ResultadoEnvio(len(enviados), len(fallos) - fallidos, fallidos)
+
+
+def _drenar(tamano_lote, max_intentos, progreso):
+    """Un worker: reclama y envía lotes hasta que no queden correos disponibles"""
+    token = uuid.uuid4().hex
+    total = ResultadoEnvio(0, 0, 0)
+    conexion = None
+    try:
+        while True:
+            correos = _reclamar_lote(tamano_lote, token, timezone.now())
+            if not correos:
+                break
+            if conexion is None:
+                # La conexión SMTP se abre una vez y se reutiliza entre lotes
+                conexion = get_connection()
+            resultado = _enviar_lote(correos, conexion, max_intentos)
+            total = ResultadoEnvio(*(a + b for a, b in zip(total, resultado)))
+            if progreso:
+                progreso(resultado)
+    finally:
+        if conexion is not None:
+            conexion.close()
+    return total
+
+
+def enviar_pendientes(tamano_lote=50, concurrencia=1, max_intentos=MAX_INTENTOS, progreso=None):
+    """
+    Drena la bandeja de salida con `concurrencia` workers, cada uno con su
+    propia conexión SMTP (el límite de conexiones simultáneas al servidor).
+    Retorna un ResultadoEnvio con los totales.
+    """
+    if concurrencia <= 1:
+        return _drenar(tamano_lote, max_intentos, progreso)
+
+    def worker():
+        try:
+            return _drenar(tamano_lote, max_intentos, progreso)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        resultados = [executor.submit(worker) for _ in range(concurrencia)]
+        return ResultadoEnvio(*(sum(columna) for columna in zip(*(r.result() for r in resultados))))
@@ -0,0 +1,150 @@
+# ============================================
+# core_user/facturas_pdf.py
+# PDF de facturas con caché por contenido
+# ============================================
+"""
+Los PDF se guardan con el hash (SHA-256) del contenido de la factura como
+nombre. Si la factura no cambió desde la última generación, el archivo ya
+existe y se sirve tal cual; cualquier cambio produce otra huella y un PDF nuevo.
+
+Tras el checkout la generación se delega a un pool de procesos para no
+cargar la petición. El render usa Pillow, que ya es dependencia del proyecto.
+"""
+import hashlib
+import io
+import json
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont
+
+from . import segundo_plano
+from .models import Factura
+
+# Cambiarla invalida todos los PDF en caché (p. ej. al rediseñar la plantilla)
+VERSION_PLANTILLA = 1
+DIRECTORIO = 'facturas/pdf'
+
+
+def contenido_factura(factura):
+    """Datos que aparecen en el PDF; cualquier cambio en ellos cambia la huella"""
+    suscripcion = factura.suscripcion
+    return {
+        'version': VERSION_PLANTILLA,
+        'numero': factura.numero_factura,
+        'fecha_pago': factura.fecha_pago.isoformat() if factura.fecha_pago else '',
+        'nombre_completo': factura.nombre_completo,
+        'telefono': factura.telefono,
+        'direccion': factura.direccion,
+        'correo': factura.correo,
+        'metodo_pago': factura.get_metodo_pago_display(),
+        'metodo_pago_secundario': factura.get_metodo_pago_secundario_display() or '',
+        'monto_total': f'{factura.monto_total:.2f}',
+        'puntos_usados': factura.puntos_usados,
+        'valor_puntos': f'{factura.valor_puntos:.2f}',
+        'monto_pendiente': f'{factura.monto_pendiente:.2f}',
+        'pagado': factura.pagado,
+        'servicio': suscripcion.plan.servicio.nombre if suscripcion else '',
+        'plan': suscripcion.plan.nombre if suscripcion else '',
+        'email_servicio': suscripcion.email_servicio if suscripcion else '',
+    }
+
+
+def huella_factura(contenido):
+    datos = json.dumps(contenido, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(datos.encode('utf-8')).hexdigest()
+
+
+def ruta_pdf(huella):
+    return f'{DIRECTORIO}/{huella[:2]}/{huella}.pdf'
+
+
+def renderizar_pdf(contenido):
+    """Dibuja la factura en una página A4 (100 ppp) y la retorna como bytes PDF"""
+    pagina = Image.new('RGB', (827, 1169), 'white')
+    dibujo = ImageDraw.Draw(pagina)
+    titulo = ImageFont.load_default(size=28)
+    texto = ImageFont.load_default(size=16)
+
+    dibujo.text((60, 60), 'StreamPoint', font=titulo, fill='#6f42c1')
+    dibujo.text((60, 100), f"Factura {contenido['numero']}", font=texto, fill='black')
+    dibujo.line((60, 130, 767, 130), fill='#cccccc', width=2)
+
+    filas = [
+        ('Fecha de pago', contenido['fecha_pago'][:16].replace('T', ' ')),
+        ('Cliente', contenido['nombre_completo']),
+        ('Teléfono', contenido['telefono']),
+        ('Dirección', contenido['direccion']),
+        ('Correo', contenido['correo']),
+        ('', ''),
+        ('Servicio', contenido['servicio']),
+        ('Plan', contenido['plan']),
+        ('Email del servicio', contenido['email_servicio']),
+        ('', ''),
+        ('Método de pago', contenido['metodo_pago']),
+        ('Total', f"${contenido['monto_total']} COP"),
+    ]
+    if contenido['puntos_usados']:
+        filas += [
+            ('Puntos usados', str(contenido['puntos_usados'])),
+            ('Valor de los puntos', f"${contenido['valor_puntos']} COP"),
+            (f"Pagado con {contenido['metodo_pago_secundario'] or 'otro método'}", f"${contenido['monto_pendiente']} COP"),
+        ]
+    filas.append(('Estado', 'Pagada' if contenido['pagado'] else 'Pendiente de pago'))
+
+    y = 160
+    for etiqueta, valor in filas:
+        if etiqueta:
+            dibujo.text((60, y), etiqueta, font=texto, fill='#555555')
+            dibujo.text((300, y), valor, font=texto, fill='black')
+        y += 32
+
+    salida = io.BytesIO()
+    pagina.save(salida, 'PDF', resolution=100)
+    return salida.getvalue()
+
+
+def generar_pdf(factura):
+    """
+    Garantiza que el PDF de la factura esté al día.
+    Retorna (ruta, generado) donde generado es False si se usó la caché.
+    """
+    contenido = contenido_factura(factura)
+    huella = huella_factura(contenido)
+    ruta = ruta_pdf(huella)
+
+    if factura.pdf_huella == huella and default_storage.exists(ruta):
+        return ruta, False
+
+    generado = False
+    if not default_storage.exists(ruta):
+        guardado = default_storage.save(ruta, ContentFile(renderizar_pdf(contenido)))
+        if guardado != ruta:
+            # Otro worker lo generó al mismo tiempo: se conserva el suyo
+            default_storage.delete(guardado)
+        generado = True
+
+    anterior = factura.pdf.name
+    Factura.objects.filter(pk=factura.pk).update(pdf=ruta, pdf_huella=huella)
+    factura.pdf.name, factura.pdf_huella = ruta, huella
+    if anterior and anterior != ruta:
+        default_storage.delete(anterior)
+    return ruta, generado
+
+
+def generar_pdfs(factura_ids):
+    """Trabajo de un worker: genera los PDF de un grupo de facturas"""
+    generados = en_cache = 0
+    facturas = Factura.objects.filter(id__in=factura_ids).select_related('suscripcion__plan__servicio')
+    for factura in facturas:
+        _, generado = generar_pdf(factura)
+        if generado:
+            generados += 1
+        else:
+            en_cache += 1
+    return generados, en_cache
+
+
+def programar_pdf(factura):
+    """Encarga el PDF al pool de procesos cuando la transacción actual confirme"""
+    segundo_plano.encolar('generando PDF de factura', generar_pdfs, [factura.pk])
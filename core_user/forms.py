@@ -1,5 +1,6 @@
 from django import forms
 from django.core.validators import RegexValidator
+from .comprobantes import marcar_validado
 from .models import RegistroCompra
 from core_public.models import ServicioStreaming, PlanSuscripcion
 import re
@@ -102,6 +103,10 @@ class RegistroCompraForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         pagar_con_puntos = kwargs.pop('pagar_con_puntos', False)
+        # Errores que ComprobanteUploadHandler detectó mientras llegaba el
+        # archivo, y formatos de los que ya validó
+        self.errores_subida = kwargs.pop('errores_subida', None) or {}
+        self.comprobantes_validados = kwargs.pop('comprobantes_validados', None) or {}
         super().__init__(*args, **kwargs)
         
         # Pre-rellenar datos del usuario si está disponible
@@ -137,6 +142,11 @@ class RegistroCompraForm(forms.ModelForm):
             # Hacer el comprobante OBLIGATORIO para pagos normales
             self.fields['comprobante'].required = True
         
+        # Si el comprobante se descartó al subirlo, clean_comprobante muestra
+        # el motivo en lugar de "Este campo es obligatorio"
+        if 'comprobante' in self.errores_subida:
+            self.fields['comprobante'].required = False
+        
         # Configurar validaciones de correo y teléfono
         self.fields['correo'].required = True
         self.fields['telefono'].required = True
@@ -178,23 +188,27 @@ class RegistroCompraForm(forms.ModelForm):
         """Validar que el comprobante sea una imagen o PDF (solo si es requerido)"""
         comprobante = self.cleaned_data.get('comprobante')
         
+        # El archivo se descartó durante la subida (tamaño, tipo o estructura)
+        if 'comprobante' in self.errores_subida:
+            raise forms.ValidationError(self.errores_subida['comprobante'])
+        
         # Si el campo no es requerido y no se subió archivo, retornar None
         if not self.fields['comprobante'].required and not comprobante:
             return None
             
         if comprobante:
-            # Validar tamaño del archivo (máximo 5MB)
-            if comprobante.size > 5 * 1024 * 1024:
-                raise forms.ValidationError('El archivo no debe superar los 5MB.')
-            
+            # El tamaño y el contenido los valida validate_file_size_and_content
             # Validar tipo de archivo
             archivo_nombre = comprobante.name.lower()
-            extensiones_validas = ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.webp']
+            extensiones_validas = ['.jpg', '.jpeg', '.png', '.pdf', '.webp']
             
             if not any(archivo_nombre.endswith(ext) for ext in extensiones_validas):
                 raise forms.ValidationError(
-                    'Solo se permiten archivos de imagen (JPG, PNG, GIF, WEBP) o PDF.'
+                    'Solo se permiten archivos de imagen (JPG, PNG, WEBP) o PDF.'
                 )
+            
+            if 'comprobante' in self.comprobantes_validados:
+                marcar_validado(comprobante, self.comprobantes_validados['comprobante'])
         elif self.fields['comprobante'].required:
             raise forms.ValidationError('El comprobante de pago es obligatorio.')
             
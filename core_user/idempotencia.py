@@ -0,0 +1,75 @@
+# ============================================
+# core_user/idempotencia.py
+# Claves de idempotencia para los formularios de compra
+# ============================================
+"""
+Cada formulario de compra lleva un token generado al renderizarlo. La
+petición que primero lo reclama (INSERT sobre la clave única) procesa la
+compra; las repeticiones solo leen la fila y devuelven la respuesta guardada.
+Ningún bloqueo se mantiene durante la petición: el reclamo se confirma de
+inmediato y el resultado se guarda en la misma transacción de la compra.
+"""
+import uuid
+
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.shortcuts import redirect
+
+from .models import ClaveIdempotencia
+
+CAMPO_FORMULARIO = 'clave_idempotencia'
+
+
+def nueva_clave():
+    """Token para incluir como campo oculto en el formulario"""
+    return uuid.uuid4().hex
+
+
+def buscar(usuario, clave):
+    """Lectura barata para detectar repeticiones antes de validar nada"""
+    if not clave:
+        return None
+    return ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).first()
+
+
+def reclamar(usuario, clave, operacion):
+    """
+    Intenta reclamar la clave. Retorna None si esta petición debe procesar la
+    compra, o la ClaveIdempotencia existente si es una repetición.
+    Sin clave (formularios antiguos) siempre procesa.
+    """
+    if not clave:
+        return None
+    try:
+        with transaction.atomic():
+            ClaveIdempotencia.objects.create(usuario=usuario, clave=clave, operacion=operacion)
+        return None
+    except IntegrityError:
+        return ClaveIdempotencia.objects.get(usuario=usuario, clave=clave)
+
+
+def completar(usuario, clave, url_respuesta, mensaje):
+    """Guarda el resultado; llamar dentro de la transacción de la compra"""
+    if not clave:
+        return
+    ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).update(
+        estado='completada',
+        url_respuesta=url_respuesta,
+        mensaje=mensaje
+    )
+
+
+def liberar(usuario, clave):
+    """La compra falló: la clave vuelve a quedar disponible para reintentar"""
+    if not clave:
+        return
+    ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave, estado='en_proceso').delete()
+
+
+def respuesta_guardada(request, registro, url_en_proceso):
+    """Respuesta para una petición repetida"""
+    if registro.estado == 'completada':
+        messages.success(request, registro.mensaje)
+        return redirect(registro.url_respuesta)
+    messages.info(request, 'Tu pago ya se está procesando. Revisa tu panel en unos segundos.')
+    return redirect(url_en_proceso)
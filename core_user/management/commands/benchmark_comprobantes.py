@@ -0,0 +1,202 @@
+# ============================================
+# core_user/management/commands/benchmark_comprobantes.py
+# Benchmark de la validación de comprobantes
+# ============================================
+import io
+import random
+import struct
+import time
+import tracemalloc
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from core_user.comprobantes import TAMANO_MAXIMO, ValidadorComprobante
+
+TAMANO_BLOQUE = 64 * 1024  # el mismo que usan los upload handlers de Django
+
+
+def _imagen(ancho, alto, formato, semilla, **opciones):
+    # Ruido: no se comprime, así el archivo pesa lo que pesaría una foto
+    azar = random.Random(semilla)
+    imagen = Image.frombytes('RGB', (ancho, alto), azar.randbytes(ancho * alto * 3))
+    buffer = io.BytesIO()
+    imagen.save(buffer, formato, **opciones)
+    return buffer.getvalue()
+
+
+def _pdf(cuerpo=b''):
+    return (
+        b'%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+        b'2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n'
+        + cuerpo +
+        b'trailer << /Root 1 0 R >>\n%%EOF\n'
+    )
+
+
+def _png_gigante():
+    """PNG diminuto que declara 100000x100000 píxeles (bomba de descompresión)"""
+    ihdr = struct.pack('>IIBBBBB', 100000, 100000, 8, 2, 0, 0, 0)
+    bloque = lambda tipo, datos: (
+        struct.pack('>I', len(datos)) + tipo + datos + struct.pack('>I', zlib.crc32(tipo + datos))
+    )
+    return (
+        b'\x89PNG\r\n\x1a\n' + bloque(b'IHDR', ihdr)
+        + bloque(b'IDAT', zlib.compress(b'\x00' * 1024)) + bloque(b'IEND', b'')
+    )
+
+
+def construir_corpus(escala=1):
+    """Lista de (nombre, contenido, debe_aceptarse)"""
+    lado = 256 * escala
+    png = _imagen(lado, lado, 'PNG', 1)
+    jpeg = _imagen(lado * 2, lado * 2, 'JPEG', 2, quality=90)
+    jpeg_progresivo = _imagen(lado, lado, 'JPEG', 3, quality=85, progressive=True)
+    webp = _imagen(lado, lado, 'WEBP', 4, quality=80)
+    webp_sin_perdida = _imagen(lado // 2, lado // 2, 'WEBP', 5, lossless=True)
+    pdf = _pdf(b'3 0 obj << /Length 0 >> stream\n' + b'0' * (200 * 1024 * escala) + b'\nendstream endobj\n')
+
+    png_crc = bytearray(png)
+    png_crc[40] ^= 0xFF  # un byte dentro del primer bloque de datos
+
+    return [
+        ('PNG', png, True),
+        ('JPEG', jpeg, True),
+        ('JPEG progresivo', jpeg_progresivo, True),
+        ('WEBP', webp, True),
+        ('WEBP sin pérdida', webp_sin_perdida, True),
+        ('PDF', pdf, True),
+        ('PNG truncado', png[:len(png) // 2], False),
+        ('PNG con CRC alterado', bytes(png_crc), False),
+        ('JPEG truncado', jpeg[:len(jpeg) - 100], False),
+        ('JPEG + ZIP (políglota)', jpeg + b'PK\x03\x04' + b'\x00' * 4096, False),
+        ('PNG + HTML (políglota)', png + b'<script>alert(1)</script>', False),
+        ('PDF con JavaScript', _pdf(b'4 0 obj << /S /JavaScript /JS (app.alert(1)) >> endobj\n'), False),
+        ('PDF sin %%EOF', pdf[:-7], False),
+        ('Ejecutable MZ', b'MZ\x90\x00\x03\x00\x00\x00' + b'\x00' * 4096, False),
+        ('PNG 100000x100000', _png_gigante(), False),
+        ('Más de 5MB', png[:1024] + b'\x00' * TAMANO_MAXIMO, False),
+    ]
+
+
+def _bloques(contenido):
+    """El archivo como lo entrega el parser multipart: bloques nuevos de 64KB"""
+    for inicio in range(0, len(contenido), TAMANO_BLOQUE):
+        yield contenido[inicio:inicio + TAMANO_BLOQUE]
+
+
+def validar_en_flujo(contenido):
+    """Validador nuevo: cada bloque se revisa al llegar y se descarta"""
+    validador = ValidadorComprobante()
+    for bloque in _bloques(contenido):
+        validador.alimentar(bloque)
+    validador.finalizar()
+
+
+def validar_con_pil(contenido):
+    """
+    Validación anterior: MemoryFileUploadHandler junta el archivo completo en
+    un BytesIO y después se revisan el tamaño y Image.verify()
+    """
+    archivo = io.BytesIO()
+    for bloque in _bloques(contenido):
+        archivo.write(bloque)
+    if archivo.tell() > TAMANO_MAXIMO:
+        raise ValidationError('tamaño')
+    archivo.seek(0)
+    inicio = archivo.read(512)
+    archivo.seek(0)
+    if inicio.startswith(b'%PDF'):
+        return
+    if inicio.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n')) or (inicio.startswith(b'RIFF') and b'WEBP' in inicio[:20]):
+        try:
+            Image.open(archivo).verify()
+        except Exception:
+            raise ValidationError('imagen')
+        return
+    raise ValidationError('tipo')
+
+
+def _medir(validar, corpus, repeticiones):
+    """
+    (resultados, segundos, pico de memoria en bytes). El tiempo se mide sobre
+    los archivos válidos, que son los que se recorren completos.
+    """
+    resultados = []
+    for _, contenido, _ in corpus:
+        try:
+            validar(contenido)
+            resultados.append(True)
+        except ValidationError:
+            resultados.append(False)
+
+    validos = [contenido for _, contenido, esperado in corpus if esperado]
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for contenido in validos:
+            validar(contenido)
+    duracion = time.perf_counter() - inicio
+
+    pico = 0
+    for _, contenido, _ in corpus:
+        tracemalloc.start()
+        try:
+            validar(contenido)
+        except ValidationError:
+            pass
+        pico = max(pico, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return resultados, duracion, pico
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento y la memoria de la validación de comprobantes '
+        'sobre archivos válidos y maliciosos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeticiones', type=int, default=20,
+            help='Veces que se validan los archivos válidos para medir el tiempo (por defecto 20)'
+        )
+        parser.add_argument(
+            '--escala', type=int, default=2,
+            help='Multiplica el tamaño de las imágenes y el PDF de prueba (por defecto 2)'
+        )
+
+    def handle(self, *args, **options):
+        repeticiones = max(options['repeticiones'], 1)
+        corpus = construir_corpus(max(options['escala'], 1))
+        total_mb = sum(len(c) for _, c, esperado in corpus if esperado) * repeticiones / (1024 * 1024)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Validando {len(corpus)} archivo(s); los válidos {repeticiones} vez/veces ({total_mb:.1f}MB)...'
+        ))
+
+        medidas = {
+            'flujo': _medir(validar_en_flujo, corpus, repeticiones),
+            'pil': _medir(validar_con_pil, corpus, repeticiones),
+        }
+
+        self.stdout.write(f'  {"Archivo":<26} {"Tamaño":>10}  {"Esperado":<9} {"Flujo":<9} {"PIL":<9}')
+        texto = {True: 'aceptado', False: 'rechazado'}
+        for indice, (nombre, contenido, esperado) in enumerate(corpus):
+            self.stdout.write(
+                f'  {nombre:<26} {len(contenido):>10}  {texto[esperado]:<9} '
+                f'{texto[medidas["flujo"][0][indice]]:<9} {texto[medidas["pil"][0][indice]]:<9}'
+            )
+
+        for clave, titulo in (('flujo', 'Validador en flujo'), ('pil', 'PIL verify()')):
+            resultados, duracion, pico = medidas[clave]
+            errores = sum(r != esperado for r, (_, _, esperado) in zip(resultados, corpus))
+            self.stdout.write(
+                f'  {titulo}: {total_mb / duracion:.0f}MB/s, pico de memoria {pico / 1024:.0f}KB, '
+                f'{errores} resultado(s) incorrecto(s)'
+            )
+
+        errores = sum(r != esperado for r, (_, _, esperado) in zip(medidas['flujo'][0], corpus))
+        estilo = self.style.SUCCESS if errores == 0 else self.style.ERROR
+        self.stdout.write(estilo(f'Resultados incorrectos del validador: {errores}'))
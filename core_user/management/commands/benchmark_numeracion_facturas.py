@@ -0,0 +1,77 @@
+# ============================================
+# core_user/management/commands/benchmark_numeracion_facturas.py
+# Benchmark de concurrencia de la numeración de facturas
+# ============================================
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, connection
+from django.test.utils import CaptureQueriesContext
+from core_user.models import Secuencia
+from core_user.numeracion import siguiente_numero, TAMANO_BLOQUE
+from core_user.segundo_plano import inicializar_worker
+
+# Secuencia propia del benchmark: no consume números de factura reales
+SECUENCIA_BENCHMARK = 'benchmark_numeracion'
+
+
+def _asignar(cantidad, tamano_bloque):
+    """Trabajo de un worker: pide `cantidad` números y cuenta las consultas hechas"""
+    with CaptureQueriesContext(connection) as consultas:
+        numeros = [siguiente_numero(SECUENCIA_BENCHMARK, tamano_bloque) for _ in range(cantidad)]
+    return numeros, len(consultas)
+
+
+class Command(BaseCommand):
+    help = (
+        'Asigna números de una secuencia de prueba desde varios procesos a la vez y '
+        'verifica que no haya colisiones (no consume números de factura)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help='Procesos asignando números en paralelo'
+        )
+        parser.add_argument(
+            '--numeros', type=int, default=1000,
+            help='Números pedidos por cada proceso (por defecto 1000)'
+        )
+        parser.add_argument(
+            '--bloque', type=int, default=TAMANO_BLOQUE,
+            help=f'Números reservados por consulta (por defecto {TAMANO_BLOQUE})'
+        )
+
+    def handle(self, *args, **options):
+        procesos = options['procesos']
+        cantidad = options['numeros']
+        bloque = options['bloque']
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Asignando {cantidad} número(s) en cada uno de {procesos} proceso(s), bloques de {bloque}...'
+        ))
+
+        # Los procesos hijos no deben heredar conexiones abiertas del padre
+        connections.close_all()
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=procesos, initializer=inicializar_worker) as pool:
+            resultados = list(pool.map(_asignar, [cantidad] * procesos, [bloque] * procesos))
+        duracion = time.perf_counter() - inicio
+        Secuencia.objects.filter(nombre=SECUENCIA_BENCHMARK).delete()
+
+        numeros = [n for lote, _ in resultados for n in lote]
+        consultas = sum(c for _, c in resultados)
+        colisiones = sum(veces - 1 for veces in Counter(numeros).values() if veces > 1)
+        # Cada proceso debe recibir sus números en orden creciente
+        monotonos = all(lote == sorted(lote) for lote, _ in resultados)
+
+        self.stdout.write(f'  Números asignados: {len(numeros)}')
+        self.stdout.write(f'  Consultas: {consultas} ({consultas / max(len(numeros), 1):.3f} por número)')
+        self.stdout.write(f'  Tiempo: {duracion:.2f}s ({len(numeros) / duracion:.0f} números/s)')
+        self.stdout.write(f'  Monótonos por proceso: {"sí" if monotonos else "no"}')
+
+        estilo = self.style.SUCCESS if colisiones == 0 else self.style.ERROR
+        self.stdout.write(estilo(f'Colisiones: {colisiones}'))
@@ -0,0 +1,49 @@
+# ============================================
+# core_user/management/commands/crear_checkpoints_puntos.py
+# Comando para crear checkpoints incrementales del ledger de puntos
+# ============================================
+from django.core.management.base import BaseCommand
+from core_user.models import PerfilUsuario
+from core_user.puntos import crear_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Crea checkpoints de saldo por perfil a partir de las transacciones nuevas del ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de perfiles procesados por consulta (por defecto 1000)'
+        )
+        parser.add_argument(
+            '--minimo', type=int, default=1,
+            help='Transacciones nuevas necesarias para crear un checkpoint (por defecto 1)'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        minimo = options['minimo']
+        self.stdout.write(self.style.SUCCESS('Iniciando creación de checkpoints...'))
+
+        ultimo_id = 0
+        procesados = 0
+        creados = 0
+
+        # Paginación por clave: cada lote cuesta lo mismo sin importar su posición
+        while True:
+            perfil_ids = list(
+                PerfilUsuario.objects.filter(id__gt=ultimo_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:lote]
+            )
+            if not perfil_ids:
+                break
+
+            creados += crear_checkpoints(perfil_ids, minimo_transacciones=minimo)
+            procesados += len(perfil_ids)
+            ultimo_id = perfil_ids[-1]
+            self.stdout.write(f'  Perfiles procesados: {procesados} (checkpoints creados: {creados})')
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Perfiles revisados: {procesados}'))
+        self.stdout.write(self.style.SUCCESS(f'Checkpoints creados: {creados}'))
@@ -0,0 +1,118 @@
+# ============================================
+# core_user/management/commands/deduplicar_comprobantes.py
+# Mantenimiento del almacenamiento de comprobantes por contenido
+# ============================================
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from core_user.almacenamiento import DIRECTORIO_TEMPORAL, almacenamiento_comprobantes
+from core_user.models import ComprobanteAlmacenado, RegistroCompra
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa los comprobantes antiguos al almacenamiento por contenido y borra '
+        'los archivos que ya no usa ningún registro de compra'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=24,
+            help='Horas que un archivo sin referencias se conserva antes de borrarlo (por defecto 24)'
+        )
+        parser.add_argument(
+            '--recontar', action='store_true',
+            help='Recalcula los contadores de referencias desde los registros de compra'
+        )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options['horas'])
+
+        migrados = self.migrar_antiguos()
+        if options['recontar']:
+            corregidos = self.recontar()
+            self.stdout.write(f'  Contadores corregidos: {corregidos}')
+        borrados = self.purgar(limite)
+        temporales = self.limpiar_temporales(limite)
+
+        ahorro = ComprobanteAlmacenado.objects.filter(referencias__gt=1).aggregate(
+            total=Sum(F('tamano') * (F('referencias') - 1))
+        )['total'] or 0
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Comprobantes antiguos migrados: {migrados}'))
+        self.stdout.write(self.style.SUCCESS(f'Archivos sin referencias borrados: {borrados}'))
+        self.stdout.write(self.style.SUCCESS(f'Temporales huérfanos borrados: {temporales}'))
+        self.stdout.write(self.style.SUCCESS(f'Espacio ahorrado por duplicados: {ahorro / (1024 * 1024):.1f}MB'))
+
+    def migrar_antiguos(self):
+        """Registros con comprobante guardado por nombre (antes del almacenamiento por contenido)"""
+        registros = RegistroCompra.objects.filter(
+            comprobante_almacenado__isnull=True
+        ).exclude(comprobante='').exclude(comprobante__isnull=True).only('id', 'comprobante', 'comprobante_almacenado')
+        total = registros.count()
+        migrados = 0
+        for registro in registros.iterator():
+            anterior = registro.comprobante.name
+            if not almacenamiento_comprobantes.exists(anterior):
+                self.stdout.write(self.style.WARNING(f'  Registro #{registro.pk}: no existe {anterior}'))
+                continue
+            with almacenamiento_comprobantes.open(anterior) as archivo:
+                registro.comprobante.name = almacenamiento_comprobantes.save(anterior, archivo)
+            registro.save(update_fields=['comprobante'])
+            if not RegistroCompra.objects.filter(comprobante=anterior).exists():
+                almacenamiento_comprobantes.delete(anterior)
+            migrados += 1
+            if migrados % 100 == 0:
+                self.stdout.write(f'  Comprobantes migrados: {migrados}/{total}')
+        return migrados
+
+    def recontar(self):
+        corregidos = 0
+        conteos = ComprobanteAlmacenado.objects.annotate(reales=Count('registros')).exclude(referencias=F('reales'))
+        for huella, reales in conteos.values_list('huella', 'reales'):
+            corregidos += ComprobanteAlmacenado.objects.filter(pk=huella).update(referencias=reales)
+        return corregidos
+
+    def purgar(self, limite):
+        borrados = 0
+        sin_uso = ComprobanteAlmacenado.objects.filter(referencias=0, fecha_actualizacion__lt=limite)
+        for huella, ruta, *derivados in sin_uso.values_list('huella', 'ruta', 'miniatura', 'vista_previa'):
+            # Un registro que lo usa (contador desfasado, o subida que aún no
+            # actualizó el índice) lo protege; --recontar corrige el contador
+            if RegistroCompra.objects.filter(Q(comprobante_almacenado=huella) | Q(comprobante=ruta)).exists():
+                continue
+            # Una subida del mismo contenido renueva la fecha del archivo aunque
+            # descarte su copia: la fila se deja para una corrida posterior
+            if not self._modificado_antes(ruta, limite):
+                continue
+            # Se borra la fila solo si sigue sin uso (una subida pudo volver a referenciarla)
+            if ComprobanteAlmacenado.objects.filter(
+                pk=huella, referencias=0, fecha_actualizacion__lt=limite
+            ).delete()[0]:
+                for nombre in filter(None, [ruta, *derivados]):
+                    almacenamiento_comprobantes.delete(nombre)
+                borrados += 1
+        return borrados
+
+    def _modificado_antes(self, nombre, limite):
+        try:
+            return os.path.getmtime(almacenamiento_comprobantes.path(nombre)) < limite.timestamp()
+        except FileNotFoundError:
+            return True
+
+    def limpiar_temporales(self, limite):
+        """Temporales que dejó una escritura interrumpida (p. ej. el proceso murió a mitad)"""
+        directorio = almacenamiento_comprobantes.path(DIRECTORIO_TEMPORAL)
+        if not os.path.isdir(directorio):
+            return 0
+        borrados = 0
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre)
+            if os.path.getmtime(ruta) < limite.timestamp():
+                os.remove(ruta)
+                borrados += 1
+        return borrados
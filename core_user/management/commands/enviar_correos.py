@@ -0,0 +1,47 @@
+# ============================================
+# core_user/management/commands/enviar_correos.py
+# Comando para drenar la bandeja de salida de correos
+# ============================================
+from django.core.management.base import BaseCommand
+from core_user.correos import enviar_pendientes, MAX_INTENTOS
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la bandeja de salida (reintentos con espera exponencial)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=50,
+            help='Correos reclamados y enviados por lote (por defecto 50)'
+        )
+        parser.add_argument(
+            '--concurrencia', type=int, default=1,
+            help='Workers en paralelo, cada uno con su conexión SMTP (por defecto 1)'
+        )
+        parser.add_argument(
+            '--max-intentos', type=int, default=MAX_INTENTOS,
+            help=f'Intentos antes de marcar un correo como fallido (por defecto {MAX_INTENTOS})'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Enviando correos pendientes...'))
+
+        def progreso(resultado):
+            self.stdout.write(
+                f'  Lote: {resultado.enviados} enviados, {resultado.reintentos} para reintento, '
+                f'{resultado.fallidos} fallidos'
+            )
+
+        resultado = enviar_pendientes(
+            tamano_lote=options['lote'],
+            concurrencia=options['concurrencia'],
+            max_intentos=options['max_intentos'],
+            progreso=progreso
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Correos enviados: {resultado.enviados}'))
+        if resultado.reintentos:
+            self.stdout.write(self.style.WARNING(f'Correos para reintento: {resultado.reintentos}'))
+        if resultado.fallidos:
+            self.stdout.write(self.style.ERROR(f'Correos fallidos (dead-letter): {resultado.fallidos}'))
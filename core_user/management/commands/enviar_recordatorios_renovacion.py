@@ -0,0 +1,37 @@
+# ============================================
+# core_user/management/commands/enviar_recordatorios_renovacion.py
+# Comando para enviar recordatorios de renovación por correo
+# ============================================
+from django.core.management.base import BaseCommand
+from core_user.suscripciones import enviar_recordatorios_renovacion
+
+
+class Command(BaseCommand):
+    help = 'Envía recordatorios de renovación a las suscripciones activas que vencen en los próximos días'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=3,
+            help='Días de anticipación al vencimiento (por defecto 3)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=100,
+            help='Correos enviados por lote sobre la misma conexión (por defecto 100)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Enviando recordatorios para suscripciones que vencen en {options["dias"]} día(s) o menos...'
+        ))
+
+        def progreso(total):
+            self.stdout.write(f'  Recordatorios enviados: {total}')
+
+        enviados = enviar_recordatorios_renovacion(
+            dias=options['dias'],
+            tamano_lote=options['lote'],
+            progreso=progreso
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Recordatorios enviados: {enviados}'))
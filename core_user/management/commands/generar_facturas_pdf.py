@@ -0,0 +1,67 @@
+# ============================================
+# core_user/management/commands/generar_facturas_pdf.py
+# Comando para generar (backfill) los PDF de facturas
+# ============================================
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core_user.models import Factura
+from core_user.facturas_pdf import generar_pdfs
+from core_user.segundo_plano import inicializar_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los PDF de las facturas que no lo tienen o cuyo contenido cambió. '
+        'Los PDF al día se reutilizan desde la caché'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=100,
+            help='Facturas por tarea enviada a cada worker (por defecto 100)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo; 1 procesa todo en el proceso actual'
+        )
+
+    def handle(self, *args, **options):
+        tamano = options['lote']
+        workers = options['workers']
+
+        ids = list(Factura.objects.order_by('id').values_list('id', flat=True))
+        if not ids:
+            self.stdout.write(self.style.WARNING('No hay facturas.'))
+            return
+
+        lotes = [ids[i:i + tamano] for i in range(0, len(ids), tamano)]
+        self.stdout.write(self.style.SUCCESS(
+            f'Procesando {len(ids)} factura(s) en {len(lotes)} lote(s) con {workers} worker(s)...'
+        ))
+
+        procesadas = generados = en_cache = 0
+
+        def progreso(lote, resultado):
+            nonlocal procesadas, generados, en_cache
+            procesadas += len(lote)
+            generados += resultado[0]
+            en_cache += resultado[1]
+            self.stdout.write(f'  Facturas procesadas: {procesadas}/{len(ids)}')
+
+        if workers > 1:
+            # Los procesos hijos no deben heredar conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker) as pool:
+                tareas = {pool.submit(generar_pdfs, lote): lote for lote in lotes}
+                for tarea in as_completed(tareas):
+                    progreso(tareas[tarea], tarea.result())
+        else:
+            for lote in lotes:
+                progreso(lote, generar_pdfs(lote))
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'PDF generados: {generados}'))
+        self.stdout.write(self.style.SUCCESS(f'PDF reutilizados de la caché: {en_cache}'))
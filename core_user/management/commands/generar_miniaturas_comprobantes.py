@@ -0,0 +1,77 @@
+# ============================================
+# core_user/management/commands/generar_miniaturas_comprobantes.py
+# Comando para generar (backfill) las miniaturas de comprobantes
+# ============================================
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core_user.models import ComprobanteAlmacenado
+from core_user.miniaturas import generar_miniaturas
+from core_user.segundo_plano import inicializar_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las miniaturas y vistas previas WebP de los comprobantes que aún '
+        'no las tienen'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=50,
+            help='Comprobantes por tarea enviada a cada worker (por defecto 50)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo; 1 procesa todo en el proceso actual'
+        )
+        parser.add_argument(
+            '--todas', action='store_true',
+            help='Regenera también las que ya existen (p. ej. tras cambiar los tamaños)'
+        )
+
+    def handle(self, *args, **options):
+        tamano = options['lote']
+        workers = options['workers']
+
+        comprobantes = ComprobanteAlmacenado.objects.filter(referencias__gt=0)
+        if not options['todas']:
+            comprobantes = comprobantes.filter(fecha_miniaturas__isnull=True)
+        huellas = list(comprobantes.order_by('huella').values_list('huella', flat=True))
+        if not huellas:
+            self.stdout.write(self.style.WARNING('No hay comprobantes sin miniatura.'))
+            return
+
+        lotes = [huellas[i:i + tamano] for i in range(0, len(huellas), tamano)]
+        self.stdout.write(self.style.SUCCESS(
+            f'Procesando {len(huellas)} comprobante(s) en {len(lotes)} lote(s) con {workers} worker(s)...'
+        ))
+
+        procesados = generadas = sin_vista = errores = 0
+
+        def progreso(lote, resultado):
+            nonlocal procesados, generadas, sin_vista, errores
+            procesados += len(lote)
+            generadas += resultado[0]
+            sin_vista += resultado[1]
+            errores += resultado[2]
+            self.stdout.write(f'  Comprobantes procesados: {procesados}/{len(huellas)}')
+
+        if workers > 1:
+            # Los procesos hijos no deben heredar conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker) as pool:
+                tareas = {pool.submit(generar_miniaturas, lote): lote for lote in lotes}
+                for tarea in as_completed(tareas):
+                    progreso(tareas[tarea], tarea.result())
+        else:
+            for lote in lotes:
+                progreso(lote, generar_miniaturas(lote))
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Miniaturas generadas: {generadas}'))
+        self.stdout.write(self.style.SUCCESS(f'Sin vista previa (PDF sin imágenes): {sin_vista}'))
+        if errores:
+            self.stdout.write(self.style.ERROR(f'Con error (ver el log): {errores}'))
@@ -0,0 +1,85 @@
+# ============================================
+# core_user/management/commands/reconciliar_puntos.py
+# Comando para conciliar los contadores de puntos con el ledger
+# ============================================
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Min, Max
+from core_user.models import PerfilUsuario
+from core_user.puntos import diferencias_en_rango, corregir_saldos
+from core_user.segundo_plano import inicializar_worker
+
+
+def _procesar_rango(rango, corregir):
+    """Trabajo de un worker: detectar (y opcionalmente corregir) un rango de perfiles"""
+    diferencias = diferencias_en_rango(*rango)
+    if corregir:
+        corregir_saldos([d.perfil_id for d in diferencias])
+    return diferencias
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica que puntos_totales y puntos_disponibles de cada perfil '
+        'coincidan con la suma de sus transacciones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rango', type=int, default=10000,
+            help='Cantidad de IDs de perfil por rango (por defecto 10000)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo; 1 procesa todo en el proceso actual'
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Corrige los contadores con las sumas del ledger'
+        )
+
+    def handle(self, *args, **options):
+        tamano = options['rango']
+        workers = options['workers']
+        corregir = options['fix']
+
+        limites = PerfilUsuario.objects.aggregate(minimo=Min('id'), maximo=Max('id'))
+        if limites['minimo'] is None:
+            self.stdout.write(self.style.WARNING('No hay perfiles para conciliar.'))
+            return
+
+        rangos = [
+            (desde, desde + tamano)
+            for desde in range(limites['minimo'], limites['maximo'] + 1, tamano)
+        ]
+        self.stdout.write(self.style.SUCCESS(
+            f'Conciliando {len(rangos)} rango(s) de perfiles con {workers} worker(s)...'
+        ))
+
+        if workers > 1:
+            # Los procesos hijos no deben heredar conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=inicializar_worker) as pool:
+                resultados = pool.map(_procesar_rango, rangos, [corregir] * len(rangos))
+                diferencias = [d for lote in resultados for d in lote]
+        else:
+            diferencias = [d for rango in rangos for d in _procesar_rango(rango, corregir)]
+
+        for d in diferencias:
+            self.stdout.write(
+                f'  #{d.perfil_id} {d.username}: '
+                f'totales {d.puntos_totales} -> {d.totales_ledger}, '
+                f'disponibles {d.puntos_disponibles} -> {d.disponibles_ledger}'
+            )
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('\nTodos los saldos coinciden con el ledger.'))
+        elif corregir:
+            self.stdout.write(self.style.SUCCESS(f'\nPerfiles corregidos: {len(diferencias)}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'\nPerfiles con diferencias: {len(diferencias)} (usa --fix para corregirlos)'
+            ))
@@ -0,0 +1,27 @@
+# ============================================
+# core_user/management/commands/vencer_suscripciones.py
+# Comando nocturno para marcar como vencidas las suscripciones expiradas
+# ============================================
+from django.core.management.base import BaseCommand
+from core_user.suscripciones import vencer_suscripciones
+
+
+class Command(BaseCommand):
+    help = "Cambia a 'vencida' las suscripciones activas cuya fecha de vencimiento ya pasó"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Suscripciones actualizadas por transacción (por defecto 1000)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Buscando suscripciones vencidas...'))
+
+        def progreso(total):
+            self.stdout.write(f'  Suscripciones vencidas: {total}')
+
+        vencidas = vencer_suscripciones(tamano_lote=options['lote'], progreso=progreso)
+
+        self.stdout.write(self.style.SUCCESS(f'\n¡Proceso completado!'))
+        self.stdout.write(self.style.SUCCESS(f'Suscripciones marcadas como vencidas: {vencidas}'))
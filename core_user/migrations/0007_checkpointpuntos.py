@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0006_alter_registrocompra_comprobante'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckpointPuntos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntos_totales', models.IntegerField()),
+                ('puntos_disponibles', models.IntegerField()),
+                ('ultima_transaccion_id', models.BigIntegerField(help_text='ID de la última TransaccionPuntos incluida')),
+                ('fecha', models.DateTimeField(help_text='Fecha de la última transacción incluida')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Puntos',
+                'verbose_name_plural': 'Checkpoints de Puntos',
+                'ordering': ['-ultima_transaccion_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaccionpuntos',
+            index=models.Index(fields=['perfil', 'id'], name='core_user_t_perfil__6a7eaa_idx'),
+        ),
+        migrations.AddField(
+            model_name='checkpointpuntos',
+            name='perfil',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='core_user.perfilusuario'),
+        ),
+        migrations.AddIndex(
+            model_name='checkpointpuntos',
+            index=models.Index(fields=['perfil', '-ultima_transaccion_id'], name='core_user_c_perfil__622b41_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkpointpuntos',
+            index=models.Index(fields=['perfil', '-fecha'], name='core_user_c_perfil__fac0d0_idx'),
+        ),
+    ]
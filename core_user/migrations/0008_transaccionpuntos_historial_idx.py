@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0007_checkpointpuntos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccionpuntos',
+            index=models.Index(fields=['perfil', '-fecha', '-id'], name='core_user_t_perfil__ce9d68_idx'),
+        ),
+    ]
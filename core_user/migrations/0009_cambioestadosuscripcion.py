@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_public', '0001_initial'),
+        ('core_user', '0008_transaccionpuntos_historial_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioEstadoSuscripcion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('pendiente', 'Pendiente de validación'), ('activa', 'Activa'), ('vencida', 'Vencida'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('pendiente', 'Pendiente de validación'), ('activa', 'Activa'), ('vencida', 'Vencida'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Estado de Suscripción',
+                'verbose_name_plural': 'Cambios de Estado de Suscripciones',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='suscripcion',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='core_user_s_estado_62627c_idx'),
+        ),
+        migrations.AddField(
+            model_name='cambioestadosuscripcion',
+            name='suscripcion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios_estado', to='core_user.suscripcion'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0009_cambioestadosuscripcion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordatorioRenovacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_envio', models.DateTimeField(auto_now_add=True)),
+                ('suscripcion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recordatorio_renovacion', to='core_user.suscripcion')),
+            ],
+            options={
+                'verbose_name': 'Recordatorio de Renovación',
+                'verbose_name_plural': 'Recordatorios de Renovación',
+            },
+        ),
+    ]
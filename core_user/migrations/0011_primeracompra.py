@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def poblar_primeras_compras(apps, schema_editor):
+    """Toma la compra confirmada más antigua de cada par (usuario, servicio)"""
+    Suscripcion = apps.get_model('core_user', 'Suscripcion')
+    RegistroCompra = apps.get_model('core_user', 'RegistroCompra')
+    PrimeraCompra = apps.get_model('core_user', 'PrimeraCompra')
+
+    primeras = {}
+    suscripciones = Suscripcion.objects.filter(
+        Q(validada=True) | Q(estado__in=['activa', 'vencida'])
+    ).values_list('usuario_id', 'plan__servicio_id', 'id', 'fecha_creacion')
+    for usuario_id, servicio_id, pk, fecha in suscripciones.iterator():
+        actual = primeras.get((usuario_id, servicio_id))
+        if actual is None or fecha < actual[0]:
+            primeras[(usuario_id, servicio_id)] = (fecha, pk, None)
+
+    registros = RegistroCompra.objects.filter(estado='aprobada').values_list(
+        'usuario_id', 'servicio_id', 'id', 'fecha_registro'
+    )
+    for usuario_id, servicio_id, pk, fecha in registros.iterator():
+        actual = primeras.get((usuario_id, servicio_id))
+        if actual is None or fecha < actual[0]:
+            primeras[(usuario_id, servicio_id)] = (fecha, None, pk)
+
+    PrimeraCompra.objects.bulk_create([
+        PrimeraCompra(
+            usuario_id=usuario_id,
+            servicio_id=servicio_id,
+            suscripcion_id=suscripcion_id,
+            registro_compra_id=registro_id
+        )
+        for (usuario_id, servicio_id), (_, suscripcion_id, registro_id) in primeras.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_public', '0001_initial'),
+        ('core_user', '0010_recordatoriorenovacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrimeraCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('registro_compra', models.ForeignKey(blank=True, help_text='Registro de compra que originó la primera compra', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core_user.registrocompra')),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='primeras_compras', to='core_public.serviciostreaming')),
+                ('suscripcion', models.ForeignKey(blank=True, help_text='Suscripción que originó la primera compra', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core_user.suscripcion')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='primeras_compras', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Primera Compra',
+                'verbose_name_plural': 'Primeras Compras',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'servicio'), name='primera_compra_usuario_servicio')],
+            },
+        ),
+        migrations.RunPython(poblar_primeras_compras, migrations.RunPython.noop),
+    ]
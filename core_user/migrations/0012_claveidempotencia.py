@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0011_primeracompra'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64)),
+                ('operacion', models.CharField(max_length=50)),
+                ('estado', models.CharField(choices=[('en_proceso', 'En proceso'), ('completada', 'Completada')], default='en_proceso', max_length=20)),
+                ('url_respuesta', models.CharField(blank=True, max_length=200)),
+                ('mensaje', models.TextField(blank=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claves_idempotencia', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='clave_idempotencia_usuario_clave')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0012_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo', models.TextField()),
+                ('remitente', models.CharField(max_length=255)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo puede tomarse el correo (reintento o vencimiento del reclamo)')),
+                ('reclamado_por', models.CharField(blank=True, max_length=32)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Correo Pendiente',
+                'verbose_name_plural': 'Correos Pendientes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_proximo_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0014_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='pdf',
+            field=models.FileField(blank=True, upload_to='facturas/pdf/'),
+        ),
+        migrations.AddField(
+            model_name='factura',
+            name='pdf_huella',
+            field=models.CharField(blank=True, help_text='Hash del contenido con el que se generó el PDF', max_length=64),
+        ),
+    ]
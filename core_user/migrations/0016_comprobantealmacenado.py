@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:46
+
+import core_user.almacenamiento
+import core_user.models
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0015_factura_pdf'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registrocompra',
+            name='comprobante',
+            field=models.FileField(blank=True, help_text='Comprobante de pago en formato PDF o imagen (JPG, PNG). Máximo 5MB', null=True, storage=core_user.almacenamiento.AlmacenamientoComprobantes(), upload_to='comprobantes', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf', 'jpg', 'jpeg', 'png', 'webp'], message='Solo se permiten archivos PDF, JPG, JPEG, PNG o WEBP'), core_user.models.validate_file_size_and_content]),
+        ),
+        migrations.CreateModel(
+            name='ComprobanteAlmacenado',
+            fields=[
+                ('huella', models.CharField(help_text='SHA-256 del contenido', max_length=64, primary_key=True, serialize=False)),
+                ('ruta', models.CharField(max_length=100)),
+                ('tamano', models.PositiveIntegerField(default=0)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Comprobante almacenado',
+                'verbose_name_plural': 'Comprobantes almacenados',
+                'indexes': [models.Index(fields=['referencias', 'fecha_actualizacion'], name='core_user_c_referen_f9c782_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='registrocompra',
+            name='comprobante_almacenado',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Archivo del comprobante en el índice por contenido', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='registros', to='core_user.comprobantealmacenado'),
+        ),
+    ]
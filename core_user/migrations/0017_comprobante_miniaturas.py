@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_user', '0016_comprobantealmacenado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comprobantealmacenado',
+            name='fecha_miniaturas',
+            field=models.DateTimeField(blank=True, help_text='Cuándo se generaron las miniaturas', null=True),
+        ),
+        migrations.AddField(
+            model_name='comprobantealmacenado',
+            name='miniatura',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='comprobantealmacenado',
+            name='vista_previa',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
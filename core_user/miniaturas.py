@@ -0,0 +1,146 @@
+# ============================================
+# core_user/miniaturas.py
+# Miniaturas y vistas previas de comprobantes
+# ============================================
+"""
+La revisión de compras muestra una miniatura WebP del comprobante en el
+listado y una vista previa (también WebP, a lo sumo 1200px) en el detalle;
+el original (hasta 5MB) solo se descarga si el revisor lo abre.
+
+Se generan en un pool de procesos apenas se guarda un comprobante nuevo.
+Como los comprobantes se guardan por contenido (almacenamiento.py), cada
+archivo se procesa una sola vez aunque lo envíen varias compras, y las
+miniaturas viven junto al original con la misma huella en el nombre.
+
+Para los PDF se dibuja la primera página si está instalado `pypdfium2`
+(opcional); sin él se usa la primera imagen JPEG incrustada, que es lo que
+contienen los PDF generados a partir de capturas o fotos.
+"""
+import io
+import logging
+import re
+
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .almacenamiento import DIRECTORIO, almacenamiento_comprobantes
+from . import segundo_plano
+from .models import ComprobanteAlmacenado
+
+try:
+    import pypdfium2
+except ImportError:  # pypdfium2 es opcional: sin él se usa la imagen incrustada en el PDF
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+LADO_MINIATURA = 240
+LADO_VISTA_PREVIA = 1200
+CALIDAD = {'miniatura': 70, 'vista': 80}
+
+_IMAGEN_PDF = re.compile(rb'/DCTDecode')
+
+
+class SinVistaPrevia(Exception):
+    """El comprobante no tiene nada que se pueda dibujar (p. ej. un PDF solo de texto sin pypdfium2)"""
+
+
+def ruta_derivada(huella, sufijo):
+    return f'{DIRECTORIO}/{huella[:2]}/{huella[2:4]}/{huella}-{sufijo}.webp'
+
+
+def _primera_pagina_pdf(contenido):
+    if pypdfium2 is not None:
+        documento = pypdfium2.PdfDocument(contenido)
+        try:
+            pagina = documento[0]
+            escala = LADO_VISTA_PREVIA / max(pagina.get_size())
+            return pagina.render(scale=escala).to_pil()
+        finally:
+            documento.close()
+
+    # Primera imagen JPEG incrustada: el flujo va tal cual entre 'stream' y 'endstream'
+    for filtro in _IMAGEN_PDF.finditer(contenido):
+        flujo = contenido.find(b'stream', filtro.end())
+        inicio = contenido.find(b'\xff\xd8\xff', flujo) if flujo != -1 else -1
+        fin = contenido.find(b'endstream', inicio) if inicio != -1 else -1
+        if fin == -1:
+            break
+        try:
+            imagen = Image.open(io.BytesIO(contenido[inicio:fin]))
+            imagen.draft('RGB', (LADO_VISTA_PREVIA, LADO_VISTA_PREVIA))
+            imagen.load()
+            return imagen
+        except Exception:
+            continue
+    raise SinVistaPrevia('El PDF no tiene imágenes que mostrar')
+
+
+def _abrir(contenido):
+    if contenido.startswith(b'%PDF-'):
+        imagen = _primera_pagina_pdf(contenido)
+    else:
+        imagen = Image.open(io.BytesIO(contenido))
+        # Los JPEG se decodifican directamente a escala reducida (mucho más rápido)
+        imagen.draft('RGB', (LADO_VISTA_PREVIA, LADO_VISTA_PREVIA))
+        # Fotos de celular: respetar la orientación guardada en EXIF
+        imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode not in ('RGB', 'RGBA'):
+        imagen = imagen.convert('RGBA' if imagen.has_transparency_data else 'RGB')
+    return imagen
+
+
+def _webp(imagen, lado, calidad):
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    salida = io.BytesIO()
+    copia.save(salida, 'WEBP', quality=calidad, method=4)
+    return salida.getvalue(), copia
+
+
+def renderizar(contenido):
+    """(miniatura, vista_previa) en bytes WebP a partir del comprobante original"""
+    imagen = _abrir(contenido)
+    vista, reducida = _webp(imagen, LADO_VISTA_PREVIA, CALIDAD['vista'])
+    miniatura, _ = _webp(reducida, LADO_MINIATURA, CALIDAD['miniatura'])
+    return miniatura, vista
+
+
+def generar_miniatura(comprobante):
+    """Genera y registra las miniaturas de un ComprobanteAlmacenado. Retorna True si hay vista previa."""
+    with almacenamiento_comprobantes.open(comprobante.ruta) as archivo:
+        contenido = archivo.read()
+    try:
+        miniatura, vista = renderizar(contenido)
+    except SinVistaPrevia:
+        rutas = ('', '')
+    else:
+        rutas = (ruta_derivada(comprobante.huella, 'miniatura'), ruta_derivada(comprobante.huella, 'vista'))
+        almacenamiento_comprobantes.guardar_derivado(rutas[0], miniatura)
+        almacenamiento_comprobantes.guardar_derivado(rutas[1], vista)
+
+    ComprobanteAlmacenado.objects.filter(pk=comprobante.pk).update(
+        miniatura=rutas[0], vista_previa=rutas[1], fecha_miniaturas=timezone.now()
+    )
+    comprobante.miniatura, comprobante.vista_previa = rutas
+    return bool(rutas[0])
+
+
+def generar_miniaturas(huellas):
+    """Trabajo de un worker: (con vista previa, sin vista previa, con error) de un grupo de comprobantes"""
+    generadas = sin_vista = errores = 0
+    for comprobante in ComprobanteAlmacenado.objects.filter(huella__in=huellas):
+        try:
+            if generar_miniatura(comprobante):
+                generadas += 1
+            else:
+                sin_vista += 1
+        except Exception:
+            logger.exception('Error generando la miniatura del comprobante %s', comprobante.huella)
+            errores += 1
+    return generadas, sin_vista, errores
+
+
+def programar_miniaturas(huella):
+    """Encarga las miniaturas al pool de procesos cuando la transacción actual confirme"""
+    segundo_plano.encolar('generando miniaturas de comprobantes', generar_miniaturas, [huella])
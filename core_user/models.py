@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -6,58 +6,24 @@ from django.core.validators import FileExtensionValidator
 from datetime import timedelta
 from core_public.models import PlanSuscripcion
 from decimal import Decimal
-from PIL import Image
-import io
+from .comprobantes import MENSAJE_TAMANO, TAMANO_MAXIMO, formato_validado, validar_comprobante
+from .almacenamiento import DIRECTORIO as DIRECTORIO_COMPROBANTES, almacenamiento_comprobantes, huella_de_ruta
 
 
 def validate_file_size(value):
     """Valida que el archivo no supere los 5MB"""
     filesize = value.size
-    if filesize > 5 * 1024 * 1024:  # 5MB en bytes
-        raise ValidationError("El archivo no puede ser mayor a 5MB. Por favor, comprima la imagen o use un archivo más pequeño.")
+    if filesize > TAMANO_MAXIMO:
+        raise ValidationError(MENSAJE_TAMANO)
     return value
 
 
 def validate_file_content(value):
-    """Valida el contenido real del archivo, no solo la extensión"""
-    # Leer los primeros bytes para detectar el tipo MIME
-    value.seek(0)
-    header = value.read(512)
-    value.seek(0)
-    
-    # Detectar tipo de archivo por magic numbers
-    if header.startswith(b'%PDF'):
-        # Es un PDF válido
-        return value
-    elif header.startswith(b'\xff\xd8\xff'):
-        # Es JPEG - validar que sea imagen válida
-        try:
-            img = Image.open(value)
-            img.verify()
-            value.seek(0)
-            return value
-        except Exception:
-            raise ValidationError("El archivo JPEG está corrupto o no es una imagen válida")
-    elif header.startswith(b'\x89PNG\r\n\x1a\n'):
-        # Es PNG - validar que sea imagen válida
-        try:
-            img = Image.open(value)
-            img.verify()
-            value.seek(0)
-            return value
-        except Exception:
-            raise ValidationError("El archivo PNG está corrupto o no es una imagen válida")
-    elif header.startswith(b'RIFF') and b'WEBP' in header[:20]:
-        # Es WEBP - validar que sea imagen válida
-        try:
-            img = Image.open(value)
-            img.verify()
-            value.seek(0)
-            return value
-        except Exception:
-            raise ValidationError("El archivo WEBP está corrupto o no es una imagen válida")
-    else:
-        raise ValidationError("Tipo de archivo no permitido. Solo se aceptan PDF, JPG, PNG o WEBP válidos.")
+    """Valida el contenido real del archivo, no solo la extensión (ver comprobantes.py)"""
+    # Si ComprobanteUploadHandler ya lo validó mientras llegaba, no se vuelve a leer
+    if formato_validado(value) is None:
+        validar_comprobante(value)
+    return value
 
 
 def validate_file_size_and_content(value):
@@ -82,34 +48,21 @@ class PerfilUsuario(models.Model):
         return f"{self.user.username} - {self.puntos_disponibles} puntos"
     
     def agregar_puntos(self, cantidad, descripcion=""):
-        """Agregar puntos al usuario"""
-        self.puntos_totales += cantidad
-        self.puntos_disponibles += cantidad
-        self.save()
-        
-        # Registrar transacción
-        TransaccionPuntos.objects.create(
-            perfil=self,
-            tipo='ganado',
-            cantidad=cantidad,
-            descripcion=descripcion
-        )
+        """Agregar puntos al usuario (UPDATE atómico + registro en el ledger)"""
+        from .puntos import acreditar_puntos
+        saldo = acreditar_puntos(self.pk, cantidad, descripcion)
+        self.puntos_totales = saldo.puntos_totales
+        self.puntos_disponibles = saldo.puntos_disponibles
     
     def canjear_puntos(self, cantidad, descripcion=""):
-        """Canjear puntos (restar)"""
-        if cantidad <= self.puntos_disponibles:
-            self.puntos_disponibles -= cantidad
-            self.save()
-            
-            # Registrar transacción
-            TransaccionPuntos.objects.create(
-                perfil=self,
-                tipo='canjeado',
-                cantidad=cantidad,
-                descripcion=descripcion
-            )
-            return True
-        return False
+        """Canjear puntos (restar) solo si el saldo en base de datos alcanza"""
+        from .puntos import debitar_puntos
+        saldo = debitar_puntos(self.pk, cantidad, descripcion)
+        if saldo is None:
+            return False
+        self.puntos_totales = saldo.puntos_totales
+        self.puntos_disponibles = saldo.puntos_disponibles
+        return True
     
     def usar_puntos(self, cantidad, descripcion=""):
         """Alias de canjear_puntos para usar puntos"""
@@ -164,6 +117,7 @@ class Suscripcion(models.Model):
             models.Index(fields=['fecha_vencimiento']),
             models.Index(fields=['-fecha_creacion']),
             models.Index(fields=['validada', 'estado']),
+            models.Index(fields=['estado', 'fecha_vencimiento']),
         ]
     
     def __str__(self):
@@ -204,6 +158,36 @@ class Suscripcion(models.Model):
         return 0
 
 
+class CambioEstadoSuscripcion(models.Model):
+    """Auditoría de las transiciones de estado aplicadas a una suscripción"""
+    suscripcion = models.ForeignKey(Suscripcion, on_delete=models.CASCADE, related_name='cambios_estado')
+    estado_anterior = models.CharField(max_length=20, choices=Suscripcion.ESTADO_CHOICES)
+    estado_nuevo = models.CharField(max_length=20, choices=Suscripcion.ESTADO_CHOICES)
+    motivo = models.CharField(max_length=200, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Cambio de Estado de Suscripción"
+        verbose_name_plural = "Cambios de Estado de Suscripciones"
+        ordering = ['-fecha']
+    
+    def __str__(self):
+        return f"#{self.suscripcion_id}: {self.estado_anterior} -> {self.estado_nuevo}"
+
+
+class RecordatorioRenovacion(models.Model):
+    """Marca de que ya se envió el recordatorio de renovación de una suscripción"""
+    suscripcion = models.OneToOneField(Suscripcion, on_delete=models.CASCADE, related_name='recordatorio_renovacion')
+    fecha_envio = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Recordatorio de Renovación"
+        verbose_name_plural = "Recordatorios de Renovación"
+    
+    def __str__(self):
+        return f"Recordatorio #{self.suscripcion_id} - {self.fecha_envio:%d/%m/%Y}"
+
+
 class TransaccionPuntos(models.Model):
     """Historial de transacciones de puntos"""
     TIPO_CHOICES = [
@@ -220,11 +204,41 @@ class TransaccionPuntos(models.Model):
     class Meta:
         verbose_name_plural = "Transacciones de Puntos"
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['perfil', 'id']),
+            models.Index(fields=['perfil', '-fecha', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.perfil.user.username} - {self.tipo} {self.cantidad} pts"
 
 
+class CheckpointPuntos(models.Model):
+    """
+    Foto del saldo de un perfil tras aplicar todas sus transacciones
+    hasta `ultima_transaccion_id`. Reconstruir un saldo solo requiere leer
+    las transacciones posteriores al checkpoint más cercano.
+    """
+    perfil = models.ForeignKey(PerfilUsuario, on_delete=models.CASCADE, related_name='checkpoints')
+    puntos_totales = models.IntegerField()
+    puntos_disponibles = models.IntegerField()
+    ultima_transaccion_id = models.BigIntegerField(help_text="ID de la última TransaccionPuntos incluida")
+    fecha = models.DateTimeField(help_text="Fecha de la última transacción incluida")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Checkpoint de Puntos"
+        verbose_name_plural = "Checkpoints de Puntos"
+        ordering = ['-ultima_transaccion_id']
+        indexes = [
+            models.Index(fields=['perfil', '-ultima_transaccion_id']),
+            models.Index(fields=['perfil', '-fecha']),
+        ]
+    
+    def __str__(self):
+        return f"{self.perfil_id} - {self.puntos_disponibles} pts hasta #{self.ultima_transaccion_id}"
+
+
 class Factura(models.Model):
     """
     Información de facturación para cada compra de suscripción.
@@ -284,6 +298,14 @@ class Factura(models.Model):
     fecha_pago = models.DateTimeField(null=True, blank=True)
     numero_factura = models.CharField(max_length=50, unique=True, blank=True)
     
+    # PDF generado en segundo plano (ver core_user.facturas_pdf)
+    pdf = models.FileField(upload_to='facturas/pdf/', blank=True)
+    pdf_huella = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash del contenido con el que se generó el PDF"
+    )
+    
     class Meta:
         verbose_name = "Factura"
         verbose_name_plural = "Facturas"
@@ -295,13 +317,72 @@ class Factura(models.Model):
     def save(self, *args, **kwargs):
         # Generar número de factura automáticamente
         if not self.numero_factura:
-            from django.utils.crypto import get_random_string
-            timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-            random_str = get_random_string(4, allowed_chars='0123456789')
-            self.numero_factura = f"FAC-{timestamp}-{random_str}"
+            from .numeracion import siguiente_numero_factura
+            self.numero_factura = siguiente_numero_factura()
         super().save(*args, **kwargs)
 
 
+class ComprobanteAlmacenado(models.Model):
+    """
+    Índice de los comprobantes guardados por contenido (core_user.almacenamiento).
+    `referencias` cuenta los registros de compra que apuntan al archivo; los
+    que quedan en 0 los borra el comando deduplicar_comprobantes.
+    """
+    huella = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 del contenido")
+    ruta = models.CharField(max_length=100)
+    tamano = models.PositiveIntegerField(default=0)
+    referencias = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+    # Derivados WebP para la revisión (core_user.miniaturas); vacíos si no hay nada que dibujar
+    miniatura = models.CharField(max_length=100, blank=True)
+    vista_previa = models.CharField(max_length=100, blank=True)
+    fecha_miniaturas = models.DateTimeField(null=True, blank=True, help_text="Cuándo se generaron las miniaturas")
+    
+    class Meta:
+        verbose_name = "Comprobante almacenado"
+        verbose_name_plural = "Comprobantes almacenados"
+        indexes = [
+            models.Index(fields=['referencias', 'fecha_actualizacion']),
+        ]
+    
+    def __str__(self):
+        return f"{self.huella[:12]} ({self.referencias} referencia{'s' if self.referencias != 1 else ''})"
+    
+    @property
+    def url_miniatura(self):
+        return almacenamiento_comprobantes.url(self.miniatura) if self.miniatura else ''
+    
+    @property
+    def url_vista_previa(self):
+        return almacenamiento_comprobantes.url(self.vista_previa) if self.vista_previa else ''
+    
+    @classmethod
+    def referenciar(cls, huella, ruta, tamano):
+        """Suma una referencia al archivo, creando su fila si es el primero. Retorna True si la creó."""
+        actualizados = cls.objects.filter(pk=huella).update(
+            referencias=models.F('referencias') + 1, fecha_actualizacion=timezone.now()
+        )
+        if actualizados:
+            return False
+        try:
+            with transaction.atomic():
+                cls.objects.create(huella=huella, ruta=ruta, tamano=tamano, referencias=1)
+            return True
+        except IntegrityError:
+            # Otra petición creó la fila al mismo tiempo
+            cls.objects.filter(pk=huella).update(
+                referencias=models.F('referencias') + 1, fecha_actualizacion=timezone.now()
+            )
+            return False
+    
+    @classmethod
+    def liberar(cls, huella):
+        cls.objects.filter(pk=huella, referencias__gt=0).update(
+            referencias=models.F('referencias') - 1, fecha_actualizacion=timezone.now()
+        )
+
+
 class RegistroCompra(models.Model):
     """
     Registro manual de compras realizadas por usuarios.
@@ -350,7 +431,8 @@ class RegistroCompra(models.Model):
     )
     fecha_compra = models.DateField(help_text="Fecha en que realizó la compra")
     comprobante = models.FileField(
-        upload_to='comprobantes/%Y/%m/',
+        upload_to=DIRECTORIO_COMPROBANTES,
+        storage=almacenamiento_comprobantes,
         blank=True,
         null=True,
         validators=[
@@ -362,6 +444,15 @@ class RegistroCompra(models.Model):
         ],
         help_text="Comprobante de pago en formato PDF o imagen (JPG, PNG). Máximo 5MB"
     )
+    comprobante_almacenado = models.ForeignKey(
+        ComprobanteAlmacenado,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='registros',
+        help_text="Archivo del comprobante en el índice por contenido"
+    )
     descripcion = models.TextField(
         blank=True,
         help_text="Detalles adicionales sobre la compra"
@@ -420,26 +511,14 @@ class RegistroCompra(models.Model):
         y calcula los puntos sugeridos según el plan
         """
         if not self.pk:  # Solo en la creación
-            # Detectar si es primera compra en este servicio
-            compras_anteriores = RegistroCompra.objects.filter(
-                usuario=self.usuario,
-                servicio=self.servicio,
-                estado='aprobada'
-            ).exists()
-            
-            # También revisar suscripciones anteriores
-            suscripciones_anteriores = Suscripcion.objects.filter(
-                usuario=self.usuario,
-                plan__servicio=self.servicio,
-                validada=True
-            ).exists()
-            
-            self.es_primera_compra = not (compras_anteriores or suscripciones_anteriores)
+            # Detectar si es primera compra en este servicio (índice PrimeraCompra)
+            from .primeras_compras import es_primera_compra
+            self.es_primera_compra = es_primera_compra(self.usuario_id, self.servicio_id)
             
             # Calcular puntos sugeridos basándose en el monto pagado
-            from core_public.models import ConfiguracionRecompensa
+            from core_public.configuracion import configuracion_activa
             try:
-                config = ConfiguracionRecompensa.objects.filter(activo=True).first()
+                config = configuracion_activa()
                 if config and self.monto_pagado:
                     # Calcular puntos basándose en el monto pagado
                     # Ejemplo: $100,000 × 10 puntos/peso = 1,000,000 puntos
@@ -458,16 +537,40 @@ class RegistroCompra(models.Model):
                 self.puntos_sugeridos = 100 if self.es_primera_compra else 50
         
         super().save(*args, **kwargs)
+        self._sincronizar_comprobante()
+    
+    def _sincronizar_comprobante(self):
+        """Mantiene el contador de referencias del índice de comprobantes"""
+        huella = huella_de_ruta(self.comprobante.name) if self.comprobante else None
+        if huella == self.comprobante_almacenado_id:
+            return
+        with transaction.atomic():
+            if huella and ComprobanteAlmacenado.referenciar(huella, self.comprobante.name, self.comprobante.size):
+                # Archivo nuevo: miniaturas en segundo plano tras confirmar
+                from .miniaturas import programar_miniaturas
+                programar_miniaturas(huella)
+            if self.comprobante_almacenado_id:
+                ComprobanteAlmacenado.liberar(self.comprobante_almacenado_id)
+            RegistroCompra.objects.filter(pk=self.pk).update(comprobante_almacenado=huella)
+        self.comprobante_almacenado_id = huella
+    
+    def registros_mismo_comprobante(self):
+        """Otras compras que enviaron exactamente el mismo archivo (búsqueda por huella)"""
+        if not self.comprobante_almacenado_id:
+            return RegistroCompra.objects.none()
+        return RegistroCompra.objects.filter(
+            comprobante_almacenado_id=self.comprobante_almacenado_id
+        ).exclude(pk=self.pk).select_related('usuario', 'servicio').order_by('fecha_registro')
     
     def calcular_puntos_automaticos(self):
         """
         Calcula los puntos que deberían otorgarse automáticamente
         basándose en el monto pagado y la configuración de puntos por peso.
         """
-        from core_public.models import ConfiguracionRecompensa
+        from core_public.configuracion import configuracion_activa
         
         try:
-            config = ConfiguracionRecompensa.objects.filter(activo=True).first()
+            config = configuracion_activa()
             if config and self.monto_pagado:
                 # Calcular puntos basándose en el monto pagado
                 # Ejemplo: $100,000 × 10 puntos/peso = 1,000,000 puntos
@@ -495,19 +598,23 @@ class RegistroCompra(models.Model):
         if puntos is None:
             puntos = self.puntos_sugeridos if self.puntos_sugeridos > 0 else self.calcular_puntos_automaticos()
         
-        self.estado = 'aprobada'
-        self.fecha_revision = timezone.now()
-        self.revisado_por = admin_user
-        self.puntos_otorgados = puntos
-        self.save()
+        from .primeras_compras import registrar_compras
         
-        # Otorgar puntos al usuario
-        perfil, created = PerfilUsuario.objects.get_or_create(user=self.usuario)
-        tipo_compra = "Primera compra" if self.es_primera_compra else "Renovación"
-        perfil.agregar_puntos(
-            puntos,
-            f"{tipo_compra} aprobada - {self.servicio.nombre}"
-        )
+        with transaction.atomic():
+            self.estado = 'aprobada'
+            self.fecha_revision = timezone.now()
+            self.revisado_por = admin_user
+            self.puntos_otorgados = puntos
+            self.save()
+            registrar_compras(registros=[self])
+            
+            # Otorgar puntos al usuario
+            perfil, created = PerfilUsuario.objects.get_or_create(user=self.usuario)
+            tipo_compra = "Primera compra" if self.es_primera_compra else "Renovación"
+            perfil.agregar_puntos(
+                puntos,
+                f"{tipo_compra} aprobada - {self.servicio.nombre}"
+            )
     
     def rechazar(self, admin_user, motivo=""):
         """Rechazar la compra"""
@@ -517,3 +624,130 @@ class RegistroCompra(models.Model):
         if motivo:
             self.notas_admin = motivo
         self.save()
+
+
+class PrimeraCompra(models.Model):
+    """
+    Índice desnormalizado con la primera compra validada de cada usuario en
+    cada servicio. Responder "¿es su primera compra?" es una búsqueda por la
+    clave única (usuario, servicio). Se mantiene desde core_user.primeras_compras.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='primeras_compras')
+    servicio = models.ForeignKey(
+        'core_public.ServicioStreaming',
+        on_delete=models.CASCADE,
+        related_name='primeras_compras'
+    )
+    suscripcion = models.ForeignKey(
+        Suscripcion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Suscripción que originó la primera compra"
+    )
+    registro_compra = models.ForeignKey(
+        RegistroCompra,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Registro de compra que originó la primera compra"
+    )
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Primera Compra"
+        verbose_name_plural = "Primeras Compras"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'servicio'], name='primera_compra_usuario_servicio'),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario_id} - {self.servicio_id}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Token de un solo uso incluido en los formularios de compra. La primera
+    petición con la clave la reclama; las repeticiones (doble clic, reintentos)
+    reciben la respuesta guardada sin volver a procesar la compra.
+    """
+    ESTADO_CHOICES = [
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+    ]
+    
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='claves_idempotencia')
+    clave = models.CharField(max_length=64)
+    operacion = models.CharField(max_length=50)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='en_proceso')
+    url_respuesta = models.CharField(max_length=200, blank=True)
+    mensaje = models.TextField(blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='clave_idempotencia_usuario_clave'),
+        ]
+    
+    def __str__(self):
+        return f"{self.operacion} - {self.clave} ({self.get_estado_display()})"
+
+
+class CorreoPendiente(models.Model):
+    """
+    Bandeja de salida (outbox) de correos transaccionales. Se escribe en la
+    misma transacción que la operación que origina el correo y el comando
+    enviar_correos la drena en segundo plano.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),  # Agotó los reintentos (dead-letter)
+    ]
+    
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo puede tomarse el correo (reintento o vencimiento del reclamo)"
+    )
+    reclamado_por = models.CharField(max_length=32, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Correo Pendiente"
+        verbose_name_plural = "Correos Pendientes"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_proximo_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.asunto} ({self.get_estado_display()})"
+
+
+class Secuencia(models.Model):
+    """
+    Contador persistente para numeraciones (p. ej. facturas). Los procesos
+    reservan bloques de números avanzando `valor`; ver core_user.numeracion.
+    """
+    nombre = models.CharField(max_length=50, primary_key=True)
+    valor = models.BigIntegerField(default=0, help_text="Último número reservado")
+    
+    class Meta:
+        verbose_name = "Secuencia"
+        verbose_name_plural = "Secuencias"
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
@@ -0,0 +1,111 @@
+# ============================================
+# core_user/numeracion.py
+# Numeración de facturas por bloques
+# ============================================
+"""
+Asigna números monótonos y sin colisiones desde la tabla Secuencia.
+
+Cada proceso reserva un bloque de TAMANO_BLOQUE números con un único UPDATE
+y luego los entrega desde memoria, sin consultas. Los números que no llegan
+a usarse (proceso que termina, transacción revertida) quedan como huecos:
+la numeración no es contigua.
+
+Los números son únicos, pero no estrictamente crecientes en el tiempo: los
+bloques de varios procesos se intercalan, y dentro de un proceso un hilo
+puede encolar un bloque menor que el que se está entregando (ver abajo).
+Para ordenar facturas por fecha se usa su fecha de creación, no el número.
+
+Un bloque reservado dentro de una transacción solo se comparte con el resto
+del proceso cuando esa transacción confirma; si se revierte, la secuencia
+vuelve atrás junto con el bloque y nadie usa esos números. Si varios hilos
+reservan a la vez, sus bloques se encolan y se entregan de menor a mayor:
+ninguno reemplaza a otro que aún tiene números.
+"""
+import bisect
+import os
+import threading
+from collections import namedtuple
+
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from .models import Secuencia
+
+
+SECUENCIA_FACTURA = 'factura'
+TAMANO_BLOQUE = 50
+
+Bloque = namedtuple('Bloque', ['pid', 'siguiente', 'limite'])
+
+# Bloques disponibles en este proceso por (base de datos, secuencia), del menor al mayor
+_bloques = {}
+_candado = threading.Lock()
+
+
+def _reservar_bloque(nombre, tamano, using):
+    """Avanza la secuencia `tamano` posiciones y retorna (primero, ultimo) del bloque"""
+    secuencias = Secuencia.objects.using(using).filter(nombre=nombre)
+    with transaction.atomic(using=using, savepoint=False):
+        if not secuencias.update(valor=F('valor') + tamano):
+            # Primera reserva: crea la fila (otro proceso puede ganarnos la carrera)
+            Secuencia.objects.using(using).bulk_create([Secuencia(nombre=nombre)], ignore_conflicts=True)
+            secuencias.update(valor=F('valor') + tamano)
+        # La fila queda bloqueada por el UPDATE hasta el fin de la transacción
+        ultimo = secuencias.values_list('valor', flat=True).get()
+    return ultimo - tamano + 1, ultimo
+
+
+def _publicar(clave, bloque):
+    """Encola el bloque para el resto de hilos del proceso, en orden"""
+    with _candado:
+        bisect.insort(_bloques.setdefault(clave, []), bloque, key=lambda b: b.siguiente)
+
+
+def _tomar_de_memoria(clave, pid):
+    with _candado:
+        # Un proceso hijo (fork) hereda el diccionario pero no puede usar los bloques del padre
+        cola = [bloque for bloque in _bloques.get(clave, ()) if bloque.pid == pid]
+        _bloques[clave] = cola
+        if not cola:
+            return None
+        bloque = cola[0]
+        if bloque.siguiente < bloque.limite:
+            cola[0] = bloque._replace(siguiente=bloque.siguiente + 1)
+        else:
+            cola.pop(0)
+        return bloque.siguiente
+
+
+def siguiente_numero(nombre, tamano_bloque=TAMANO_BLOQUE, using=None):
+    """Siguiente número de la secuencia `nombre`; consulta la base solo al agotar el bloque"""
+    using = using or router.db_for_write(Secuencia)
+    clave = (using, nombre)
+    pid = os.getpid()
+
+    numero = _tomar_de_memoria(clave, pid)
+    if numero is not None:
+        return numero
+
+    primero, ultimo = _reservar_bloque(nombre, tamano_bloque, using)
+    if primero < ultimo:
+        resto = Bloque(pid, primero + 1, ultimo)
+        if connections[using].in_atomic_block:
+            transaction.on_commit(lambda: _publicar(clave, resto), using=using)
+        else:
+            _publicar(clave, resto)
+    return primero
+
+
+def descartar_bloques():
+    """Olvida los bloques reservados por este proceso (quedan como huecos)"""
+    with _candado:
+        _bloques.clear()
+
+
+def formatear_numero_factura(numero):
+    return f"FAC-{numero:010d}"
+
+
+def siguiente_numero_factura():
+    """Número para una Factura nueva, p. ej. FAC-0000000042"""
+    return formatear_numero_factura(siguiente_numero(SECUENCIA_FACTURA))
@@ -0,0 +1,109 @@
+# ============================================
+# core_user/pagos.py
+# Checkout de la pasarela de pago
+# ============================================
+"""
+Procesa una compra completa de la pasarela en una sola transacción:
+suscripción, factura, índice de primeras compras y movimiento de puntos.
+El perfil se bloquea una sola vez, con el UPDATE del saldo neto, al final
+de la transacción para mantener el bloqueo el menor tiempo posible.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Suscripcion, Factura, TransaccionPuntos
+from .primeras_compras import es_primera_compra, registrar_compras
+from .facturas_pdf import programar_pdf
+from .puntos import aplicar_transacciones
+
+
+class PagoRechazado(Exception):
+    """El pago no puede completarse (p. ej. puntos insuficientes)"""
+
+
+def calcular_montos(plan, config, puntos_a_usar, metodo_pago):
+    """
+    Reparte el precio del plan entre puntos y el método de pago elegido.
+    Retorna (puntos_usados, valor_puntos, monto_pendiente, metodo_final, metodo_secundario).
+    """
+    if not config or puntos_a_usar <= 0:
+        return 0, Decimal('0'), plan.precio, metodo_pago, None
+
+    valor_puntos = Decimal(puntos_a_usar) / Decimal(config.puntos_por_peso)
+    monto_pendiente = max(Decimal('0'), plan.precio - valor_puntos)
+    if monto_pendiente > 0:
+        # Pago mixto
+        return puntos_a_usar, valor_puntos, monto_pendiente, 'mixto', metodo_pago
+    # Pago solo con puntos
+    return puntos_a_usar, valor_puntos, monto_pendiente, 'puntos', None
+
+
+def procesar_pago(usuario, perfil, plan, config, facturacion, metodo_pago, puntos_a_usar, email_servicio):
+    """
+    Crea la suscripción activa y su factura, descuenta los puntos usados y
+    otorga el cashback en una transacción con un número fijo de consultas.
+    `facturacion` trae nombre_completo, telefono, direccion y correo.
+    Retorna (suscripcion, factura) o lanza PagoRechazado.
+    """
+    puntos_usados, valor_puntos, monto_pendiente, metodo_final, metodo_secundario = calcular_montos(
+        plan, config, puntos_a_usar, metodo_pago
+    )
+    es_primera = es_primera_compra(usuario.id, plan.servicio_id)
+    # Solo hay cashback si no pagó 100% con puntos
+    puntos_cashback = 0
+    if metodo_final != 'puntos':
+        puntos_cashback = plan.puntos_primera_compra if es_primera else plan.puntos_renovacion
+
+    with transaction.atomic():
+        ahora = timezone.now()
+        suscripcion = Suscripcion.objects.create(
+            usuario=usuario,
+            plan=plan,
+            fecha_inicio=ahora.date(),
+            metodo_pago=metodo_final,
+            monto_pagado=plan.precio,
+            email_servicio=email_servicio,
+            es_primera_compra=es_primera,
+            puntos_otorgados=puntos_cashback,
+            estado='activa'  # Ahora se activa directamente
+        )
+        factura = Factura.objects.create(
+            suscripcion=suscripcion,
+            metodo_pago=metodo_final,
+            monto_total=plan.precio,
+            puntos_usados=puntos_usados,
+            valor_puntos=valor_puntos,
+            monto_pendiente=monto_pendiente,
+            metodo_pago_secundario=metodo_secundario,
+            pagado=True,
+            fecha_pago=ahora,
+            **facturacion
+        )
+        # El PDF se genera en segundo plano cuando la compra se confirma
+        programar_pdf(factura)
+        registrar_compras(suscripciones=[suscripcion])
+
+        transacciones = []
+        if puntos_usados > 0:
+            transacciones.append(TransaccionPuntos(
+                tipo='canjeado',
+                cantidad=puntos_usados,
+                descripcion=f"Pago de {plan.servicio.nombre} - {plan.nombre} (Factura #{factura.numero_factura})"
+            ))
+        if puntos_cashback > 0:
+            transacciones.append(TransaccionPuntos(
+                tipo='ganado',
+                cantidad=puntos_cashback,
+                descripcion=f"Cashback por {plan.servicio.nombre} - {plan.nombre}"
+            ))
+
+        if transacciones:
+            saldo = aplicar_transacciones(perfil.pk, transacciones)
+            if saldo is None:
+                # Revierte suscripción y factura
+                raise PagoRechazado('No tienes suficientes puntos disponibles.')
+            perfil.puntos_totales, perfil.puntos_disponibles = saldo
+
+    return suscripcion, factura
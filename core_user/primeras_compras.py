@@ -0,0 +1,73 @@
+# ============================================
+# core_user/primeras_compras.py
+# Índice de primeras compras por (usuario, servicio)
+# ============================================
+"""
+Única fuente para decidir si una compra es la primera de un usuario en un
+servicio. Todos los flujos (pasarela de pago, pago con puntos, registro de
+compras y validación del admin) consultan y mantienen la tabla PrimeraCompra
+en lugar de recorrer Suscripcion y RegistroCompra con joins.
+"""
+from django.db.models import Q
+
+from .models import PrimeraCompra
+
+# Pares por consulta: cada par es un OR en el WHERE y SQLite limita la
+# profundidad de las expresiones
+LOTE_PARES = 300
+
+
+def pares_con_compra(pares):
+    """
+    Del conjunto de pares (usuario_id, servicio_id), retorna {par: suscripcion_id}
+    para los que ya tienen una compra confirmada; suscripcion_id es la de esa
+    primera compra (None si fue un registro de compra). Una consulta por cada
+    LOTE_PARES pares.
+    """
+    pares = list(set(pares))
+    primeras = {}
+    for inicio in range(0, len(pares), LOTE_PARES):
+        condicion = Q()
+        for usuario_id, servicio_id in pares[inicio:inicio + LOTE_PARES]:
+            condicion |= Q(usuario_id=usuario_id, servicio_id=servicio_id)
+        primeras.update(
+            ((usuario_id, servicio_id), suscripcion_id)
+            for usuario_id, servicio_id, suscripcion_id in PrimeraCompra.objects.filter(condicion).values_list(
+                'usuario_id', 'servicio_id', 'suscripcion_id'
+            )
+        )
+    return primeras
+
+
+def es_primera_compra(usuario_id, servicio_id, suscripcion_id=None, registro_compra_id=None):
+    """
+    True si el usuario no tiene compras confirmadas en el servicio, o si la
+    primera registrada es justamente la suscripción / registro indicado.
+    """
+    primera = PrimeraCompra.objects.filter(
+        usuario_id=usuario_id,
+        servicio_id=servicio_id
+    ).values_list('suscripcion_id', 'registro_compra_id').first()
+    if primera is None:
+        return True
+    return (
+        (suscripcion_id is not None and primera[0] == suscripcion_id)
+        or (registro_compra_id is not None and primera[1] == registro_compra_id)
+    )
+
+
+def registrar_compras(suscripciones=(), registros=()):
+    """
+    Marca como confirmadas las compras indicadas. Solo la primera de cada par
+    (usuario, servicio) queda guardada; las demás se ignoran por la
+    restricción única. Debe llamarse dentro de la transacción que confirma la compra.
+    """
+    filas = [
+        PrimeraCompra(usuario_id=s.usuario_id, servicio_id=s.plan.servicio_id, suscripcion_id=s.pk)
+        for s in suscripciones
+    ] + [
+        PrimeraCompra(usuario_id=r.usuario_id, servicio_id=r.servicio_id, registro_compra_id=r.pk)
+        for r in registros
+    ]
+    if filas:
+        PrimeraCompra.objects.bulk_create(filas, ignore_conflicts=True)
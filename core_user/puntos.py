@@ -0,0 +1,426 @@
+# ============================================
+# core_user/puntos.py
+# Libro mayor (ledger) de puntos
+# ============================================
+"""
+Primitivas atómicas para mover el saldo de puntos de un PerfilUsuario.
+
+Cada movimiento se aplica con un único UPDATE condicional sobre la fila del
+perfil (sin leerla antes) y registra su TransaccionPuntos en la misma
+transacción. Así dos abonos concurrentes nunca se pisan y un débito nunca
+deja el saldo en negativo.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import (
+    F, Q, Sum, Max, Count, OuterRef, Subquery, Value, Case, When, IntegerField
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+from .models import PerfilUsuario, TransaccionPuntos, CheckpointPuntos
+
+
+Saldo = namedtuple('Saldo', ['puntos_totales', 'puntos_disponibles'])
+
+# Las transacciones más recientes que este margen no entran en un checkpoint:
+# un INSERT con ID menor aún sin confirmar quedaría fuera para siempre.
+MARGEN_CHECKPOINT = timedelta(minutes=1)
+# Rangos (perfil, id) por consulta en crear_checkpoints: cada uno es un OR en
+# el WHERE y SQLite limita la profundidad de las expresiones
+LOTE_RANGOS = 300
+
+
+def _soporta_returning(connection):
+    """UPDATE ... RETURNING existe en PostgreSQL y en SQLite >= 3.35"""
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def _aplicar_movimiento(perfil_id, delta_totales, delta_disponibles, minimo_disponible, using):
+    """
+    Ejecuta el UPDATE condicional y retorna el nuevo Saldo,
+    o None si el perfil no existe o no tiene saldo suficiente.
+    """
+    connection = connections[using]
+
+    if _soporta_returning(connection):
+        qn = connection.ops.quote_name
+        sql = (
+            f"UPDATE {qn(PerfilUsuario._meta.db_table)} "
+            f"SET {qn('puntos_totales')} = {qn('puntos_totales')} + %s, "
+            f"{qn('puntos_disponibles')} = {qn('puntos_disponibles')} + %s "
+            f"WHERE {qn('id')} = %s AND {qn('puntos_disponibles')} >= %s "
+            f"RETURNING {qn('puntos_totales')}, {qn('puntos_disponibles')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [delta_totales, delta_disponibles, perfil_id, minimo_disponible])
+            fila = cursor.fetchone()
+        return Saldo(*fila) if fila else None
+
+    # Motores sin RETURNING en UPDATE: la lectura ocurre dentro de la misma
+    # transacción y después del UPDATE, por lo que ve la fila ya bloqueada.
+    actualizados = PerfilUsuario.objects.using(using).filter(
+        id=perfil_id,
+        puntos_disponibles__gte=minimo_disponible,
+    ).update(
+        puntos_totales=F('puntos_totales') + delta_totales,
+        puntos_disponibles=F('puntos_disponibles') + delta_disponibles,
+    )
+    if not actualizados:
+        return None
+    fila = PerfilUsuario.objects.using(using).filter(id=perfil_id).values_list(
+        'puntos_totales', 'puntos_disponibles'
+    ).get()
+    return Saldo(*fila)
+
+
+def acreditar_puntos(perfil_id, cantidad, descripcion=""):
+    """
+    Suma puntos al perfil (totales y disponibles) y registra la transacción.
+    Retorna el nuevo Saldo.
+    """
+    if cantidad < 0:
+        raise ValueError("La cantidad de puntos no puede ser negativa")
+
+    using = router.db_for_write(PerfilUsuario)
+    with transaction.atomic(using=using):
+        saldo = _aplicar_movimiento(perfil_id, cantidad, cantidad, 0, using)
+        if saldo is None:
+            raise PerfilUsuario.DoesNotExist(f"No existe el perfil {perfil_id}")
+        TransaccionPuntos.objects.using(using).create(
+            perfil_id=perfil_id,
+            tipo='ganado',
+            cantidad=cantidad,
+            descripcion=descripcion
+        )
+    return saldo
+
+
+def debitar_puntos(perfil_id, cantidad, descripcion=""):
+    """
+    Resta puntos disponibles solo si el saldo alcanza y registra la transacción.
+    Retorna el nuevo Saldo, o None si no hay puntos suficientes.
+    """
+    if cantidad < 0:
+        raise ValueError("La cantidad de puntos no puede ser negativa")
+
+    using = router.db_for_write(PerfilUsuario)
+    with transaction.atomic(using=using):
+        saldo = _aplicar_movimiento(perfil_id, 0, -cantidad, cantidad, using)
+        if saldo is None:
+            return None
+        TransaccionPuntos.objects.using(using).create(
+            perfil_id=perfil_id,
+            tipo='canjeado',
+            cantidad=cantidad,
+            descripcion=descripcion
+        )
+    return saldo
+
+
+# ============================================
+# Checkpoints y reconstrucción de saldos
+# ============================================
+
+def _sumas_por_tipo():
+    """Agregados comunes para reconstruir un saldo desde el ledger"""
+    return {
+        'ganado': Coalesce(Sum('cantidad', filter=Q(tipo='ganado')), Value(0)),
+        'canjeado': Coalesce(Sum('cantidad', filter=Q(tipo='canjeado')), Value(0)),
+    }
+
+
+def _saldo_desde(checkpoint, transacciones):
+    """Aplica las transacciones posteriores al checkpoint (o a cero si no hay)"""
+    base = Saldo(checkpoint.puntos_totales, checkpoint.puntos_disponibles) if checkpoint else Saldo(0, 0)
+    if checkpoint:
+        transacciones = transacciones.filter(id__gt=checkpoint.ultima_transaccion_id)
+    sumas = transacciones.aggregate(**_sumas_por_tipo())
+    return Saldo(
+        base.puntos_totales + sumas['ganado'],
+        base.puntos_disponibles + sumas['ganado'] - sumas['canjeado'],
+    )
+
+
+def recalcular_saldo(perfil_id):
+    """
+    Saldo actual según el ledger, leyendo solo las transacciones
+    posteriores al último checkpoint del perfil.
+    """
+    checkpoint = CheckpointPuntos.objects.filter(perfil_id=perfil_id).first()
+    return _saldo_desde(checkpoint, TransaccionPuntos.objects.filter(perfil_id=perfil_id))
+
+
+def saldo_a_fecha(perfil_id, fecha):
+    """Saldo que tenía el perfil en `fecha` según el ledger"""
+    checkpoint = CheckpointPuntos.objects.filter(
+        perfil_id=perfil_id,
+        fecha__lte=fecha
+    ).order_by('-fecha', '-ultima_transaccion_id').first()
+    return _saldo_desde(
+        checkpoint,
+        TransaccionPuntos.objects.filter(perfil_id=perfil_id, fecha__lte=fecha)
+    )
+
+
+def crear_checkpoints(perfil_ids, minimo_transacciones=1, hasta=None):
+    """
+    Crea un checkpoint para cada perfil de `perfil_ids` que acumule al menos
+    `minimo_transacciones` nuevas desde su último checkpoint.
+    Usa un único agregado agrupado por cada LOTE_RANGOS perfiles. Retorna cuántos creó.
+    """
+    if hasta is None:
+        hasta = timezone.now() - MARGEN_CHECKPOINT
+
+    ultimo_checkpoint = CheckpointPuntos.objects.filter(
+        perfil_id=OuterRef('perfil_id')
+    ).order_by('-ultima_transaccion_id')
+
+    checkpoints_previos = {
+        cp.perfil_id: cp
+        for cp in CheckpointPuntos.objects.filter(
+            perfil_id__in=perfil_ids,
+            id=Subquery(ultimo_checkpoint.values('id')[:1])
+        )
+    }
+
+    # Cada perfil se filtra por su propio rango (perfil, id > último del
+    # checkpoint) para que la consulta use el índice (perfil, id) en lugar de
+    # recorrer todo el ledger del perfil comparando contra una subconsulta
+    sin_checkpoint = [perfil_id for perfil_id in perfil_ids if perfil_id not in checkpoints_previos]
+    rangos = [
+        Q(perfil_id=perfil_id, id__gt=previo.ultima_transaccion_id)
+        for perfil_id, previo in checkpoints_previos.items()
+    ]
+    if sin_checkpoint:
+        rangos.append(Q(perfil_id__in=sin_checkpoint))
+
+    deltas = []
+    for inicio in range(0, len(rangos), LOTE_RANGOS):
+        condicion = Q()
+        for rango in rangos[inicio:inicio + LOTE_RANGOS]:
+            condicion |= rango
+        deltas += TransaccionPuntos.objects.filter(
+            condicion,
+            fecha__lte=hasta,
+        ).order_by().values('perfil_id').annotate(
+            nuevas=Count('id'),
+            ultima_id=Max('id'),
+            ultima_fecha=Max('fecha'),
+            **_sumas_por_tipo()
+        ).filter(nuevas__gte=minimo_transacciones)
+
+    nuevos = []
+    for delta in deltas:
+        previo = checkpoints_previos.get(delta['perfil_id'])
+        base = Saldo(previo.puntos_totales, previo.puntos_disponibles) if previo else Saldo(0, 0)
+        nuevos.append(CheckpointPuntos(
+            perfil_id=delta['perfil_id'],
+            puntos_totales=base.puntos_totales + delta['ganado'],
+            puntos_disponibles=base.puntos_disponibles + delta['ganado'] - delta['canjeado'],
+            ultima_transaccion_id=delta['ultima_id'],
+            fecha=delta['ultima_fecha'],
+        ))
+
+    CheckpointPuntos.objects.bulk_create(nuevos)
+    return len(nuevos)
+
+
+# ============================================
+# Conciliación de contadores contra el ledger
+# ============================================
+
+Diferencia = namedtuple('Diferencia', [
+    'perfil_id', 'username',
+    'puntos_totales', 'totales_ledger',
+    'puntos_disponibles', 'disponibles_ledger',
+])
+
+
+def _suma_ledger(tipo):
+    """Subconsulta correlacionada con la suma de un tipo de transacción del perfil"""
+    suma = TransaccionPuntos.objects.filter(
+        perfil_id=OuterRef('pk'),
+        tipo=tipo
+    ).order_by().values('perfil_id').annotate(total=Sum('cantidad')).values('total')
+    return Coalesce(Subquery(suma), Value(0))
+
+
+def diferencias_en_rango(desde_id, hasta_id):
+    """
+    Perfiles con id en [desde_id, hasta_id) cuyos contadores no coinciden
+    con las sumas de su ledger. Un único agregado agrupado para todo el rango.
+    """
+    filas = PerfilUsuario.objects.filter(
+        id__gte=desde_id,
+        id__lt=hasta_id
+    ).annotate(
+        ledger_ganado=Coalesce(Sum('transacciones__cantidad', filter=Q(transacciones__tipo='ganado')), Value(0)),
+        ledger_canjeado=Coalesce(Sum('transacciones__cantidad', filter=Q(transacciones__tipo='canjeado')), Value(0)),
+    ).order_by('id').values_list(
+        'id', 'user__username', 'puntos_totales', 'puntos_disponibles',
+        'ledger_ganado', 'ledger_canjeado'
+    )
+
+    diferencias = []
+    for perfil_id, username, totales, disponibles, ganado, canjeado in filas:
+        if totales != ganado or disponibles != ganado - canjeado:
+            diferencias.append(Diferencia(
+                perfil_id, username, totales, ganado, disponibles, ganado - canjeado
+            ))
+    return diferencias
+
+
+def corregir_saldos(perfil_ids):
+    """
+    Reescribe los contadores de los perfiles indicados con las sumas del ledger
+    en un único UPDATE. Retorna cuántos perfiles actualizó.
+    """
+    if not perfil_ids:
+        return 0
+    return PerfilUsuario.objects.filter(id__in=perfil_ids).update(
+        puntos_totales=_suma_ledger('ganado'),
+        puntos_disponibles=_suma_ledger('ganado') - _suma_ledger('canjeado'),
+    )
+
+
+def acreditar_puntos_lote(perfil_ids, cantidad, descripcion=""):
+    """
+    Suma la misma cantidad de puntos a muchos perfiles con un único UPDATE
+    y un bulk_create de sus transacciones. Retorna cuántos perfiles acreditó.
+    """
+    if cantidad < 0:
+        raise ValueError("La cantidad de puntos no puede ser negativa")
+    if not perfil_ids:
+        return 0
+
+    using = router.db_for_write(PerfilUsuario)
+    with transaction.atomic(using=using):
+        actualizados = PerfilUsuario.objects.using(using).filter(id__in=perfil_ids).update(
+            puntos_totales=F('puntos_totales') + cantidad,
+            puntos_disponibles=F('puntos_disponibles') + cantidad,
+        )
+        TransaccionPuntos.objects.using(using).bulk_create([
+            TransaccionPuntos(
+                perfil_id=perfil_id,
+                tipo='ganado',
+                cantidad=cantidad,
+                descripcion=descripcion
+            )
+            for perfil_id in perfil_ids
+        ])
+    return actualizados
+
+
+# ============================================
+# Historial paginado por cursor (keyset)
+# ============================================
+
+def _codificar_cursor(transaccion):
+    valor = f'{transaccion.fecha.isoformat()}|{transaccion.pk}'
+    return urlsafe_base64_encode(valor.encode())
+
+
+def _decodificar_cursor(cursor):
+    """Retorna (fecha, id) del cursor o lanza ValueError si es inválido"""
+    try:
+        fecha_iso, pk = urlsafe_base64_decode(cursor).decode().split('|')
+        fecha = datetime.fromisoformat(fecha_iso)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor de paginación inválido")
+    if timezone.is_naive(fecha):
+        raise ValueError("Cursor de paginación inválido")
+    return fecha, pk
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def pagina_historial(perfil_id, cursor=None, tipo=None, desde=None, hasta=None, limite=20):
+    """
+    Una página del historial de puntos, de la más reciente a la más antigua.
+    Usa paginación por cursor sobre (fecha, id) apoyada en el índice
+    (perfil, -fecha, -id): la página 1000 cuesta lo mismo que la primera.
+    Retorna (transacciones, cursor_siguiente) donde el cursor es None al final.
+    """
+    transacciones = TransaccionPuntos.objects.filter(perfil_id=perfil_id)
+
+    if tipo:
+        transacciones = transacciones.filter(tipo=tipo)
+    if desde:
+        transacciones = transacciones.filter(fecha__gte=_inicio_del_dia(desde))
+    if hasta:
+        transacciones = transacciones.filter(fecha__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+    if cursor:
+        fecha, pk = _decodificar_cursor(cursor)
+        transacciones = transacciones.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=pk))
+
+    # Se pide un elemento extra para saber si existe una página siguiente
+    pagina = list(transacciones.order_by('-fecha', '-id')[:limite + 1])
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        return pagina, _codificar_cursor(pagina[-1])
+    return pagina, None
+
+
+def acreditar_movimientos(movimientos):
+    """
+    Acredita varios movimientos (perfil_id, cantidad, descripcion) a la vez.
+    Los montos se agregan por perfil y se aplican con un único UPDATE;
+    cada movimiento queda como una TransaccionPuntos en un bulk_create.
+    """
+    movimientos = [m for m in movimientos if m[1] > 0]
+    if not movimientos:
+        return
+
+    incrementos = defaultdict(int)
+    for perfil_id, cantidad, _ in movimientos:
+        incrementos[perfil_id] += cantidad
+
+    incremento = Case(
+        *[When(id=perfil_id, then=Value(cantidad)) for perfil_id, cantidad in incrementos.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+    using = router.db_for_write(PerfilUsuario)
+    with transaction.atomic(using=using):
+        PerfilUsuario.objects.using(using).filter(id__in=incrementos).update(
+            puntos_totales=F('puntos_totales') + incremento,
+            puntos_disponibles=F('puntos_disponibles') + incremento,
+        )
+        TransaccionPuntos.objects.using(using).bulk_create([
+            TransaccionPuntos(perfil_id=perfil_id, tipo='ganado', cantidad=cantidad, descripcion=descripcion)
+            for perfil_id, cantidad, descripcion in movimientos
+        ])
+
+
+def aplicar_transacciones(perfil_id, transacciones):
+    """
+    Aplica varias TransaccionPuntos (sin guardar) de un mismo perfil con un
+    único UPDATE condicional por el efecto neto y un bulk_create del ledger.
+    Pensada para usarse dentro de una transacción mayor (p. ej. un checkout).
+    Retorna el nuevo Saldo, o None si los canjes superan el saldo disponible.
+    """
+    ganado = sum(t.cantidad for t in transacciones if t.tipo == 'ganado')
+    canjeado = sum(t.cantidad for t in transacciones if t.tipo == 'canjeado')
+    if ganado < 0 or canjeado < 0:
+        raise ValueError("La cantidad de puntos no puede ser negativa")
+
+    using = router.db_for_write(PerfilUsuario)
+    with transaction.atomic(using=using, savepoint=False):
+        saldo = _aplicar_movimiento(perfil_id, ganado, ganado - canjeado, canjeado, using)
+        if saldo is None:
+            return None
+        for t in transacciones:
+            t.perfil_id = perfil_id
+        TransaccionPuntos.objects.using(using).bulk_create(transacciones)
+    return saldo
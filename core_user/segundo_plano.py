@@ -0,0 +1,76 @@
+# ============================================
+# core_user/segundo_plano.py
+# Pool de procesos compartido para trabajo en segundo plano
+# ============================================
+"""
+Trabajo que no debe cargar la petición (PDF de facturas, miniaturas de
+comprobantes, campañas de puntos) se encola con `encolar` y se ejecuta en
+un único pool de procesos compartido cuando la transacción actual confirma.
+
+El pool tiene SEGUNDO_PLANO_WORKERS procesos, se crea al primer uso con
+'spawn' y se cierra al terminar el proceso. Con el ajuste en 0 el trabajo
+corre en el mismo proceso (desarrollo y tests).
+"""
+import atexit
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def inicializar_worker():
+    """Prepara Django en procesos creados con 'spawn' (Windows, macOS y el pool de este módulo)"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        # 'spawn' evita heredar hilos y conexiones del servidor web
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.SEGUNDO_PLANO_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=inicializar_worker,
+        )
+    return _pool
+
+
+def _registrar_error(descripcion, futuro):
+    if futuro.exception():
+        logger.error('Error %s', descripcion, exc_info=futuro.exception())
+
+
+def _enviar(descripcion, funcion, args):
+    if settings.SEGUNDO_PLANO_WORKERS <= 0:
+        funcion(*args)
+        return
+    futuro = _obtener_pool().submit(funcion, *args)
+    futuro.add_done_callback(partial(_registrar_error, descripcion))
+
+
+def encolar(descripcion, funcion, *args):
+    """
+    Ejecuta `funcion(*args)` en el pool compartido cuando la transacción
+    actual confirme. `funcion` debe poder importarse desde el worker (nivel
+    de módulo) y `descripcion` completa el mensaje de error del log.
+    """
+    transaction.on_commit(lambda: _enviar(descripcion, funcion, args))
+
+
+@atexit.register
+def cerrar_pool():
+    """Espera el trabajo ya encolado y cierra el pool"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -1,10 +1,10 @@
 # ============================================
 # core_user/signals.py
 # ============================================
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import PerfilUsuario
+from .models import PerfilUsuario, RegistroCompra, ComprobanteAlmacenado
 
 
 @receiver(post_save, sender=User)
@@ -18,5 +18,13 @@ def crear_perfil_usuario(sender, instance, created, **kwargs):
 def guardar_perfil_usuario(sender, instance, **kwargs):
     """Guardar el perfil cuando se guarda el usuario"""
     if hasattr(instance, 'perfil'):
-        instance.perfil.save()
+        # Los contadores de puntos solo se modifican desde core_user.puntos;
+        # guardarlos aquí podría pisar un saldo actualizado por otra petición
+        instance.perfil.save(update_fields=['telefono'])
 
+
+@receiver(post_delete, sender=RegistroCompra)
+def liberar_comprobante(sender, instance, **kwargs):
+    """El archivo del comprobante queda con una referencia menos"""
+    if instance.comprobante_almacenado_id:
+        ComprobanteAlmacenado.liberar(instance.comprobante_almacenado_id)
@@ -0,0 +1,201 @@
+# ============================================
+# core_user/suscripciones.py
+# Tareas masivas sobre suscripciones
+# ============================================
+"""
+Operaciones por lotes sobre Suscripcion que se ejecutan desde comandos
+programados (cron) en lugar de hacerse fila por fila en las vistas.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, IntegerField, Value, When
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Suscripcion, CambioEstadoSuscripcion, RecordatorioRenovacion, PerfilUsuario
+from .puntos import acreditar_movimientos
+from .primeras_compras import pares_con_compra, registrar_compras
+
+
+def vencer_suscripciones(hoy=None, tamano_lote=1000, progreso=None):
+    """
+    Pasa a 'vencida' las suscripciones activas cuya fecha de vencimiento ya
+    pasó. Cada lote es un UPDATE sobre IDs tomados del índice
+    (estado, fecha_vencimiento) más un bulk_create de su auditoría, todo en la
+    misma transacción. `progreso(total)` se invoca tras cada lote.
+    Retorna cuántas suscripciones venció.
+    """
+    if hoy is None:
+        hoy = timezone.now().date()
+
+    vencidas = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Suscripcion.objects.select_for_update()
+                .filter(estado='activa', fecha_vencimiento__lt=hoy)
+                .order_by('fecha_vencimiento', 'id')
+                .values_list('id', flat=True)[:tamano_lote]
+            )
+            if not ids:
+                break
+
+            Suscripcion.objects.filter(id__in=ids).update(estado='vencida')
+            CambioEstadoSuscripcion.objects.bulk_create([
+                CambioEstadoSuscripcion(
+                    suscripcion_id=suscripcion_id,
+                    estado_anterior='activa',
+                    estado_nuevo='vencida',
+                    motivo='Vencimiento automático'
+                )
+                for suscripcion_id in ids
+            ])
+
+        vencidas += len(ids)
+        if progreso:
+            progreso(vencidas)
+
+    return vencidas
+
+
+def enviar_recordatorios_renovacion(dias=3, tamano_lote=100, hoy=None, progreso=None):
+    """
+    Envía un recordatorio a cada suscripción activa que vence dentro de los
+    próximos `dias` días y aún no lo ha recibido. Los correos salen por lotes
+    sobre una sola conexión SMTP y cada lote enviado queda marcado en
+    RecordatorioRenovacion, así una nueva ejecución no repite envíos.
+    Retorna cuántos recordatorios envió.
+    """
+    if hoy is None:
+        hoy = timezone.now().date()
+
+    plantilla = get_template('user/emails/recordatorio_renovacion.txt')
+    pendientes = Suscripcion.objects.filter(
+        estado='activa',
+        fecha_vencimiento__gte=hoy,
+        fecha_vencimiento__lte=hoy + timedelta(days=dias),
+        recordatorio_renovacion__isnull=True,
+    ).select_related('usuario', 'plan__servicio').order_by('fecha_vencimiento', 'id')
+
+    enviados = 0
+    lote = []
+
+    def enviar_lote(conexion):
+        nonlocal enviados
+        conexion.send_messages([mensaje for _, mensaje in lote])
+        RecordatorioRenovacion.objects.bulk_create(
+            [RecordatorioRenovacion(suscripcion_id=suscripcion_id) for suscripcion_id, _ in lote],
+            ignore_conflicts=True
+        )
+        enviados += len(lote)
+        lote.clear()
+        if progreso:
+            progreso(enviados)
+
+    with get_connection() as conexion:
+        for suscripcion in pendientes.iterator(chunk_size=tamano_lote):
+            destinatario = suscripcion.usuario.email or suscripcion.email_servicio
+            cuerpo = plantilla.render({
+                'suscripcion': suscripcion,
+                'usuario': suscripcion.usuario,
+                'plan': suscripcion.plan,
+                'dias_restantes': (suscripcion.fecha_vencimiento - hoy).days,
+                'url_renovacion': settings.SITE_URL + reverse('user:renovar_suscripcion', args=[suscripcion.pk]),
+            })
+            lote.append((suscripcion.pk, EmailMessage(
+                f'Tu suscripción a {suscripcion.plan.servicio.nombre} está por vencer',
+                cuerpo,
+                settings.DEFAULT_FROM_EMAIL,
+                [destinatario],
+                connection=conexion,
+            )))
+            if len(lote) >= tamano_lote:
+                enviar_lote(conexion)
+
+        if lote:
+            enviar_lote(conexion)
+
+    return enviados
+
+
+def validar_suscripciones_lote(suscripcion_ids):
+    """
+    Aprueba de una vez todas las suscripciones no validadas de `suscripcion_ids`.
+
+    Primera compra y cashback se calculan para toda la selección con una
+    consulta al índice PrimeraCompra, los estados se actualizan con un solo UPDATE y los
+    puntos se acreditan agregados por usuario, todo en una transacción.
+    Retorna cuántas suscripciones validó.
+    """
+    with transaction.atomic():
+        suscripciones = list(
+            Suscripcion.objects.select_for_update(of=('self',))
+            .filter(id__in=suscripcion_ids, validada=False)
+            .select_related('plan__servicio')
+            .order_by('fecha_creacion', 'id')
+        )
+        if not suscripciones:
+            return 0
+
+        usuario_ids = {s.usuario_id for s in suscripciones}
+        # Pares (usuario, servicio) que ya tienen una compra confirmada, con la
+        # suscripción que la originó (el checkout la registra antes de validarla)
+        primera_por_par = pares_con_compra(
+            (s.usuario_id, s.plan.servicio_id) for s in suscripciones
+        )
+        perfiles = dict(
+            PerfilUsuario.objects.filter(user_id__in=usuario_ids).values_list('user_id', 'id')
+        )
+        faltantes = usuario_ids - perfiles.keys()
+        if faltantes:
+            PerfilUsuario.objects.bulk_create([PerfilUsuario(user_id=u) for u in faltantes])
+            perfiles.update(
+                PerfilUsuario.objects.filter(user_id__in=faltantes).values_list('user_id', 'id')
+            )
+
+        primeras = []
+        puntos_por_suscripcion = {}
+        movimientos = []
+        for suscripcion in suscripciones:
+            par = (suscripcion.usuario_id, suscripcion.plan.servicio_id)
+            # Mismo criterio que es_primera_compra(..., suscripcion_id=...)
+            es_primera = primera_por_par.setdefault(par, suscripcion.id) == suscripcion.id
+            if es_primera:
+                primeras.append(suscripcion.id)
+
+            if suscripcion.puntos_otorgados == 0 and suscripcion.metodo_pago != 'puntos':
+                plan = suscripcion.plan
+                puntos = plan.puntos_primera_compra if es_primera else plan.puntos_renovacion
+                puntos_por_suscripcion[suscripcion.id] = puntos
+                movimientos.append((
+                    perfiles[suscripcion.usuario_id],
+                    puntos,
+                    f"Cashback por {plan.servicio.nombre} - {plan.nombre}"
+                ))
+
+        cambios = {
+            'validada': True,
+            'fecha_validacion': timezone.now(),
+            'estado': 'activa',
+            'es_primera_compra': Case(
+                When(id__in=primeras, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            ),
+        }
+        if puntos_por_suscripcion:
+            cambios['puntos_otorgados'] = Case(
+                *[When(id=pk, then=Value(puntos)) for pk, puntos in puntos_por_suscripcion.items()],
+                default=F('puntos_otorgados'),
+                output_field=IntegerField()
+            )
+        Suscripcion.objects.filter(id__in=[s.id for s in suscripciones]).update(**cambios)
+        registrar_compras(suscripciones=suscripciones)
+
+        acreditar_movimientos(movimientos)
+
+    return len(suscripciones)
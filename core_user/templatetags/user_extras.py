@@ -3,11 +3,20 @@
 # Template tags y filtros personalizados para usuarios
 # ============================================
 from django import template
+from django.contrib.auth.models import User
 from core_user.models import PerfilUsuario
 
 register = template.Library()
 
 
+def _perfil(user):
+    """Perfil ya cargado por la vista (user.perfil) o, si no lo hay, desde la base"""
+    if User.perfil.is_cached(user):
+        return user.perfil
+    perfil, created = PerfilUsuario.objects.get_or_create(user=user)
+    return perfil
+
+
 @register.simple_tag
 def get_perfil(user):
     """
@@ -17,8 +26,7 @@ def get_perfil(user):
     if not user.is_authenticated:
         return None
     
-    perfil, created = PerfilUsuario.objects.get_or_create(user=user)
-    return perfil
+    return _perfil(user)
 
 
 @register.filter
@@ -30,8 +38,7 @@ def puntos_disponibles(user):
     if not user.is_authenticated:
         return 0
     
-    perfil, created = PerfilUsuario.objects.get_or_create(user=user)
-    return perfil.puntos_disponibles
+    return _perfil(user).puntos_disponibles
 
 
 @register.filter
@@ -1,3 +1,1280 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import mock
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from core_public.models import CategoriaStreaming, ServicioStreaming, PlanSuscripcion, ConfiguracionRecompensa
+from .models import (
+    PerfilUsuario, TransaccionPuntos, CheckpointPuntos, Suscripcion, CambioEstadoSuscripcion,
+    RegistroCompra, PrimeraCompra, Factura, ClaveIdempotencia, CorreoPendiente,
+    ComprobanteAlmacenado, validate_file_size_and_content
+)
+from .comprobantes import ValidadorComprobante, ComprobanteInvalido, MAX_COLA, MENSAJE_TAMANO
+from .miniaturas import renderizar, SinVistaPrevia
+from . import segundo_plano
+from .almacenamiento import almacenamiento_comprobantes
+from .suscripciones import validar_suscripciones_lote
+from .pagos import procesar_pago, PagoRechazado
+from .correos import encolar_correo, enviar_pendientes
+from . import numeracion
+from .numeracion import siguiente_numero, siguiente_numero_factura, descartar_bloques
+from .facturas_pdf import generar_pdf, ruta_pdf
+from .primeras_compras import pares_con_compra, es_primera_compra, registrar_compras
+from .puntos import (
+    acreditar_puntos, debitar_puntos, crear_checkpoints, recalcular_saldo, saldo_a_fecha,
+    pagina_historial
+)
+
+
+class LedgerPuntosTests(TestCase):
+    """Primitivas atómicas de core_user.puntos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='x')
+        self.perfil = self.user.perfil
+
+    def test_acreditar_retorna_saldo_y_registra_transaccion(self):
+        saldo = acreditar_puntos(self.perfil.pk, 150, 'Bono')
+        self.assertEqual(saldo, (150, 150))
+        self.assertEqual(
+            list(self.perfil.transacciones.values_list('tipo', 'cantidad')),
+            [('ganado', 150)]
+        )
+
+    def test_debitar_sin_saldo_no_modifica_nada(self):
+        acreditar_puntos(self.perfil.pk, 40)
+        self.assertIsNone(debitar_puntos(self.perfil.pk, 50))
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_disponibles, 40)
+        self.assertFalse(self.perfil.transacciones.filter(tipo='canjeado').exists())
+
+    def test_metodos_del_modelo_actualizan_la_instancia(self):
+        self.perfil.agregar_puntos(100, 'Cashback')
+        self.assertTrue(self.perfil.canjear_puntos(30, 'Pago'))
+        self.assertFalse(self.perfil.canjear_puntos(500, 'Pago'))
+        self.assertEqual(self.perfil.puntos_totales, 100)
+        self.assertEqual(self.perfil.puntos_disponibles, 70)
+
+    def test_guardar_usuario_no_pisa_el_saldo(self):
+        obsoleto = PerfilUsuario.objects.get(pk=self.perfil.pk)
+        acreditar_puntos(self.perfil.pk, 80)
+        self.user.perfil = obsoleto
+        self.user.save()
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_disponibles, 80)
+
+
+class CheckpointPuntosTests(TestCase):
+    """Checkpoints y reconstrucción de saldos desde el ledger"""
+
+    def setUp(self):
+        self.perfil = User.objects.create_user('carla', password='x').perfil
+        self.futuro = timezone.now() + timedelta(minutes=5)
+
+    def _mover_a(self, fecha):
+        """Fecha la última transacción del perfil (auto_now_add no se puede fijar al crear)"""
+        ultima = self.perfil.transacciones.order_by('-id').first()
+        TransaccionPuntos.objects.filter(pk=ultima.pk).update(fecha=fecha)
+
+    def test_recalcular_usa_el_checkpoint_y_solo_lee_el_delta(self):
+        acreditar_puntos(self.perfil.pk, 300)
+        debitar_puntos(self.perfil.pk, 100)
+        self.assertEqual(crear_checkpoints([self.perfil.pk], hasta=self.futuro), 1)
+
+        acreditar_puntos(self.perfil.pk, 50)
+        self.assertEqual(recalcular_saldo(self.perfil.pk), (350, 250))
+
+        checkpoint = self.perfil.checkpoints.get()
+        self.assertEqual((checkpoint.puntos_totales, checkpoint.puntos_disponibles), (300, 200))
+
+    def test_checkpoints_incrementales(self):
+        acreditar_puntos(self.perfil.pk, 10)
+        crear_checkpoints([self.perfil.pk], hasta=self.futuro)
+        self.assertEqual(crear_checkpoints([self.perfil.pk], hasta=self.futuro), 0)
+
+        acreditar_puntos(self.perfil.pk, 20)
+        crear_checkpoints([self.perfil.pk], hasta=self.futuro)
+        ultimo = self.perfil.checkpoints.first()
+        self.assertEqual(ultimo.puntos_disponibles, 30)
+        self.assertEqual(self.perfil.checkpoints.count(), 2)
+
+    def test_lote_con_y_sin_checkpoint_previo(self):
+        otro = User.objects.create_user('dario', password='x').perfil
+        tercero = User.objects.create_user('elsa', password='x').perfil
+        acreditar_puntos(self.perfil.pk, 10)
+        acreditar_puntos(otro.pk, 20)
+        crear_checkpoints([self.perfil.pk, otro.pk], hasta=self.futuro)
+        acreditar_puntos(self.perfil.pk, 5)
+        acreditar_puntos(tercero.pk, 8)
+
+        # Con un rango por consulta se recorren igual todos los perfiles
+        with mock.patch('core_user.puntos.LOTE_RANGOS', 1):
+            creados = crear_checkpoints([self.perfil.pk, otro.pk, tercero.pk], hasta=self.futuro)
+        self.assertEqual(creados, 2)
+        self.assertEqual(self.perfil.checkpoints.first().puntos_disponibles, 15)
+        self.assertEqual(tercero.checkpoints.get().puntos_disponibles, 8)
+        self.assertEqual(otro.checkpoints.count(), 1)
+
+    def test_saldo_a_fecha(self):
+        ahora = timezone.now()
+        acreditar_puntos(self.perfil.pk, 100)
+        self._mover_a(ahora - timedelta(days=10))
+        debitar_puntos(self.perfil.pk, 40)
+        self._mover_a(ahora - timedelta(days=5))
+        crear_checkpoints([self.perfil.pk], hasta=self.futuro)
+        acreditar_puntos(self.perfil.pk, 70)
+
+        self.assertEqual(saldo_a_fecha(self.perfil.pk, ahora - timedelta(days=20)), (0, 0))
+        self.assertEqual(saldo_a_fecha(self.perfil.pk, ahora - timedelta(days=7)), (100, 100))
+        self.assertEqual(saldo_a_fecha(self.perfil.pk, ahora - timedelta(days=1)), (100, 60))
+        self.assertEqual(saldo_a_fecha(self.perfil.pk, self.futuro), (170, 130))
+
+    def test_comando_recorre_todos_los_perfiles(self):
+        otro = User.objects.create_user('dario', password='x').perfil
+        acreditar_puntos(self.perfil.pk, 5)
+        acreditar_puntos(otro.pk, 7)
+        TransaccionPuntos.objects.update(fecha=timezone.now() - timedelta(hours=1))
+
+        call_command('crear_checkpoints_puntos', lote=1, stdout=StringIO())
+        self.assertEqual(CheckpointPuntos.objects.count(), 2)
+
+
+class ReconciliarPuntosTests(TestCase):
+    """Comando reconciliar_puntos"""
+
+    def setUp(self):
+        self.sano = User.objects.create_user('elena', password='x').perfil
+        self.roto = User.objects.create_user('fabio', password='x').perfil
+        acreditar_puntos(self.sano.pk, 100)
+        acreditar_puntos(self.roto.pk, 100)
+        debitar_puntos(self.roto.pk, 30)
+        PerfilUsuario.objects.filter(pk=self.roto.pk).update(puntos_totales=999, puntos_disponibles=5)
+
+    def test_reporta_sin_corregir(self):
+        salida = StringIO()
+        call_command('reconciliar_puntos', workers=1, rango=1, stdout=salida)
+        self.assertIn(f'#{self.roto.pk} fabio: totales 999 -> 100, disponibles 5 -> 70', salida.getvalue())
+        self.assertNotIn(f'#{self.sano.pk} ', salida.getvalue())
+        self.roto.refresh_from_db()
+        self.assertEqual(self.roto.puntos_disponibles, 5)
+
+    def test_fix_corrige_con_el_ledger(self):
+        call_command('reconciliar_puntos', workers=1, fix=True, stdout=StringIO())
+        self.roto.refresh_from_db()
+        self.assertEqual((self.roto.puntos_totales, self.roto.puntos_disponibles), (100, 70))
+
+
+class ReconciliarPuntosParaleloTests(TransactionTestCase):
+    """reconciliar_puntos repartiendo los rangos en un pool de procesos"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos en archivo o PostgreSQL')
+
+    def test_fix_con_varios_workers(self):
+        perfiles = [User.objects.create_user(f'u{i}', password='x').perfil for i in range(6)]
+        for perfil in perfiles:
+            acreditar_puntos(perfil.pk, 50)
+        PerfilUsuario.objects.update(puntos_disponibles=0)
+
+        salida = StringIO()
+        call_command('reconciliar_puntos', workers=2, rango=2, fix=True, stdout=salida)
+
+        self.assertIn('Perfiles corregidos: 6', salida.getvalue())
+        self.assertEqual(PerfilUsuario.objects.filter(puntos_disponibles=50).count(), 6)
+
+
+class HistorialPuntosTests(TestCase):
+    """Historial de puntos paginado por cursor"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('gina', password='x')
+        self.perfil = self.user.perfil
+        for i in range(5):
+            acreditar_puntos(self.perfil.pk, 10 + i, f'Abono {i}')
+        debitar_puntos(self.perfil.pk, 5, 'Canje')
+        # Misma fecha para todas: el desempate por id debe mantener el orden
+        TransaccionPuntos.objects.update(fecha=timezone.now())
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        vistos, cursor = [], None
+        while True:
+            pagina, cursor = pagina_historial(self.perfil.pk, cursor=cursor, limite=2)
+            vistos.extend(t.pk for t in pagina)
+            if not cursor:
+                break
+        esperados = list(self.perfil.transacciones.order_by('-fecha', '-id').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperados)
+
+    def test_filtro_por_tipo(self):
+        pagina, cursor = pagina_historial(self.perfil.pk, tipo='canjeado')
+        self.assertEqual([t.descripcion for t in pagina], ['Canje'])
+        self.assertIsNone(cursor)
+
+    def test_endpoint_json(self):
+        self.client.force_login(self.user)
+        respuesta = self.client.get('/user/api/puntos/historial/', {'limite': 4, 'tipo': 'ganado'})
+        datos = respuesta.json()
+        self.assertEqual(len(datos['resultados']), 4)
+
+        siguiente = self.client.get('/user/api/puntos/historial/', {'limite': 4, 'tipo': 'ganado', 'cursor': datos['siguiente']})
+        self.assertEqual([r['descripcion'] for r in siguiente.json()['resultados']], ['Abono 0'])
+        self.assertIsNone(siguiente.json()['siguiente'])
+
+        self.assertEqual(self.client.get('/user/api/puntos/historial/', {'cursor': 'basura'}).status_code, 400)
+
+    def test_pagina_html(self):
+        self.client.force_login(self.user)
+        respuesta = self.client.get('/user/puntos/historial/', {'desde': '2000-01-01'})
+        self.assertContains(respuesta, 'Abono 4')
+
+
+def crear_plan(nombre_servicio='Netflix', precio=20000):
+    categoria, _ = CategoriaStreaming.objects.get_or_create(nombre='Películas y Series')
+    servicio = ServicioStreaming.objects.create(
+        nombre=nombre_servicio, categoria=categoria, descripcion='Streaming', sitio_web='https://example.com'
+    )
+    return PlanSuscripcion.objects.create(servicio=servicio, nombre='Estándar', precio=precio)
+
+
+class VencerSuscripcionesTests(TestCase):
+    """Barrido de suscripciones vencidas"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('hugo', password='x')
+        self.plan = crear_plan()
+        self.hoy = timezone.now().date()
+
+    def _suscripcion(self, inicio, estado='activa'):
+        return Suscripcion.objects.create(
+            usuario=self.user, plan=self.plan, fecha_inicio=inicio, estado=estado,
+            metodo_pago='tarjeta', monto_pagado=20000, email_servicio='h@x.co'
+        )
+
+    def test_vence_solo_las_expiradas_y_audita(self):
+        expiradas = [self._suscripcion(self.hoy - timedelta(days=40 + i)) for i in range(3)]
+        vigente = self._suscripcion(self.hoy - timedelta(days=10))
+        cancelada = self._suscripcion(self.hoy - timedelta(days=60), estado='cancelada')
+
+        salida = StringIO()
+        call_command('vencer_suscripciones', lote=2, stdout=salida)
+
+        self.assertIn('Suscripciones marcadas como vencidas: 3', salida.getvalue())
+        self.assertEqual(Suscripcion.objects.filter(estado='activa').count(), 1)
+        self.assertEqual(
+            set(Suscripcion.objects.filter(estado='vencida').values_list('pk', flat=True)),
+            {s.pk for s in expiradas}
+        )
+        self.assertEqual(CambioEstadoSuscripcion.objects.filter(estado_nuevo='vencida').count(), 3)
+        vigente.refresh_from_db()
+        cancelada.refresh_from_db()
+        self.assertEqual((vigente.estado, cancelada.estado), ('activa', 'cancelada'))
+
+
+class RecordatoriosRenovacionTests(TestCase):
+    """Recordatorios de renovación por lotes (backend locmem en pruebas)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ines', email='ines@x.co', password='x')
+        self.plan = crear_plan()
+        hoy = timezone.now().date()
+        # Mensual (30 días): vencen en 2, 5 y -1 días respectivamente
+        for inicio in (hoy - timedelta(days=28), hoy - timedelta(days=25), hoy - timedelta(days=31)):
+            Suscripcion.objects.create(
+                usuario=self.user, plan=self.plan, fecha_inicio=inicio, estado='activa',
+                metodo_pago='tarjeta', monto_pagado=20000, email_servicio='i@x.co'
+            )
+
+    def test_envia_una_sola_vez(self):
+        call_command('enviar_recordatorios_renovacion', dias=3, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ines@x.co'])
+        self.assertIn('en 2 días', mail.outbox[0].body)
+        self.assertIn('/user/renovar/', mail.outbox[0].body)
+
+        call_command('enviar_recordatorios_renovacion', dias=3, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+        call_command('enviar_recordatorios_renovacion', dias=7, lote=1, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class ValidarSuscripcionesLoteTests(TestCase):
+    """Aprobación masiva de suscripciones"""
+
+    def setUp(self):
+        self.netflix = crear_plan('Netflix')
+        self.netflix.puntos_primera_compra, self.netflix.puntos_renovacion = 100, 50
+        self.netflix.save()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.beto = User.objects.create_user('beto', password='x')
+
+    def _pendiente(self, usuario, metodo_pago='tarjeta', validada=False):
+        return Suscripcion.objects.create(
+            usuario=usuario, plan=self.netflix, fecha_inicio=timezone.now().date(),
+            metodo_pago=metodo_pago, monto_pagado=20000, email_servicio='x@x.co', validada=validada
+        )
+
+    def test_calcula_primera_compra_y_cashback_por_usuario(self):
+        previa = self._pendiente(self.beto, validada=True)  # compra previa de beto (otorga 50)
+        registrar_compras(suscripciones=[previa])
+        primera_ana = self._pendiente(self.ana)
+        renovacion_ana = self._pendiente(self.ana)
+        renovacion_beto = self._pendiente(self.beto)
+        con_puntos = self._pendiente(self.beto, metodo_pago='puntos')
+
+        ids = [primera_ana.pk, renovacion_ana.pk, renovacion_beto.pk, con_puntos.pk]
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(validar_suscripciones_lote(ids), 4)
+        self.assertLessEqual(len(consultas), 12)
+
+        esperado = {
+            primera_ana.pk: (True, 100),
+            renovacion_ana.pk: (False, 50),
+            renovacion_beto.pk: (False, 50),
+            con_puntos.pk: (False, 0),
+        }
+        for suscripcion in Suscripcion.objects.filter(pk__in=ids):
+            self.assertEqual(suscripcion.estado, 'activa')
+            self.assertTrue(suscripcion.validada)
+            self.assertEqual((suscripcion.es_primera_compra, suscripcion.puntos_otorgados), esperado[suscripcion.pk])
+
+        self.ana.perfil.refresh_from_db()
+        self.beto.perfil.refresh_from_db()
+        self.assertEqual(self.ana.perfil.puntos_disponibles, 150)
+        self.assertEqual(self.beto.perfil.puntos_disponibles, 50 + 50)
+        self.assertEqual(self.ana.perfil.transacciones.count(), 2)
+
+        # Una segunda pasada no vuelve a otorgar nada
+        self.assertEqual(validar_suscripciones_lote(ids), 0)
+
+    def test_checkout_y_luego_validacion_masiva(self):
+        # El checkout registra la primera compra antes de que el admin valide
+        self.netflix.puntos_primera_compra = 0  # sin cashback en el checkout
+        self.netflix.save()
+        primera = self._pendiente(self.ana)
+        registrar_compras(suscripciones=[primera])
+        self.netflix.puntos_primera_compra = 100
+        self.netflix.save()
+        renovacion = self._pendiente(self.ana)
+
+        self.assertEqual(validar_suscripciones_lote([primera.pk, renovacion.pk]), 2)
+
+        primera.refresh_from_db()
+        renovacion.refresh_from_db()
+        self.assertEqual((primera.es_primera_compra, primera.puntos_otorgados), (True, 100))
+        self.assertEqual((renovacion.es_primera_compra, renovacion.puntos_otorgados), (False, 50))
+
+
+class PrimerasComprasTests(TestCase):
+    """Índice de primeras compras por (usuario, servicio)"""
+
+    def setUp(self):
+        self.plan = crear_plan('Disney+')
+        self.servicio = self.plan.servicio
+        self.user = User.objects.create_user('julia', password='x')
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+
+    def _registro(self):
+        return RegistroCompra.objects.create(
+            usuario=self.user, nombre_completo='Julia', correo='j@x.co', nombre_usuario_app='julia',
+            servicio=self.servicio, plan=self.plan, monto_pagado=20000, fecha_compra=timezone.now().date()
+        )
+
+    def test_aprobar_registro_alimenta_el_indice(self):
+        primero = self._registro()
+        self.assertTrue(primero.es_primera_compra)
+        primero.aprobar(self.admin, puntos=100)
+
+        segundo = self._registro()
+        self.assertFalse(segundo.es_primera_compra)
+        self.assertTrue(es_primera_compra(self.user.id, self.servicio.id, registro_compra_id=primero.pk))
+
+        segundo.aprobar(self.admin, puntos=50)
+        self.assertEqual(PrimeraCompra.objects.get().registro_compra_id, primero.pk)
+
+    def test_consulta_de_muchos_pares_en_una_sola_consulta(self):
+        otro = crear_plan('Max').servicio
+        registrar_compras(registros=[self._registro()])
+        with self.assertNumQueries(1):
+            pares = pares_con_compra([(self.user.id, self.servicio.id), (self.user.id, otro.id)])
+        self.assertEqual(pares, {(self.user.id, self.servicio.id): None})
+
+    def test_pares_exactos_y_no_producto_cruzado(self):
+        otro_plan = crear_plan('Max')
+        otro_usuario = User.objects.create_user('kim', password='x')
+        registrar_compras(registros=[self._registro()])
+        # kim en Disney+ y julia en Max no tienen compras aunque sus ids aparezcan en otros pares
+        otra = Suscripcion.objects.create(
+            usuario=otro_usuario, plan=otro_plan, fecha_inicio=timezone.now().date(),
+            metodo_pago='tarjeta', monto_pagado=1, email_servicio='k@x.co'
+        )
+        registrar_compras(suscripciones=[otra])
+        pares = pares_con_compra([
+            (self.user.id, otro_plan.servicio_id), (otro_usuario.id, self.servicio.id),
+            (otro_usuario.id, otro_plan.servicio_id),
+        ])
+        self.assertEqual(pares, {(otro_usuario.id, otro_plan.servicio_id): otra.pk})
+
+
+class CheckoutPasarelaTests(TestCase):
+    """Checkout de la pasarela en una sola transacción"""
+
+    FACTURACION = {'nombre_completo': 'Karla', 'telefono': '300', 'direccion': 'Calle 1', 'correo': 'k@x.co'}
+
+    def setUp(self):
+        self.plan = crear_plan('Prime', precio=20000)
+        self.plan.puntos_primera_compra = 100
+        self.plan.save()
+        self.config = ConfiguracionRecompensa.objects.create(puntos_por_peso=10)
+        self.user = User.objects.create_user('karla', password='x')
+        self.perfil = self.user.perfil
+        acreditar_puntos(self.perfil.pk, 50000, 'Saldo inicial')
+        # Bloque de números de factura ya reservado, como en un proceso en marcha
+        descartar_bloques()
+        with self.captureOnCommitCallbacks(execute=True):
+            siguiente_numero_factura()
+
+    def _pagar(self, puntos_a_usar):
+        return procesar_pago(
+            self.user, self.perfil, self.plan, self.config, self.FACTURACION,
+            'tarjeta', puntos_a_usar, 'k@x.co'
+        )
+
+    def test_pago_mixto_con_presupuesto_fijo_de_consultas(self):
+        # primera compra, 2 INSERT, índice, UPDATE del saldo, ledger + SAVEPOINT/RELEASE
+        with self.assertNumQueries(8):
+            suscripcion, factura = self._pagar(50000)
+
+        self.assertEqual((suscripcion.metodo_pago, suscripcion.puntos_otorgados), ('mixto', 100))
+        self.assertEqual(factura.monto_pendiente, 15000)
+        self.assertEqual((self.perfil.puntos_totales, self.perfil.puntos_disponibles), (50100, 100))
+        self.assertEqual(
+            set(self.perfil.transacciones.values_list('tipo', 'cantidad')),
+            {('ganado', 50000), ('canjeado', 50000), ('ganado', 100)}
+        )
+        self.assertEqual(recalcular_saldo(self.perfil.pk), (50100, 100))
+        self.assertTrue(PrimeraCompra.objects.filter(suscripcion=suscripcion).exists())
+
+    def test_puntos_insuficientes_revierte_todo(self):
+        with self.assertRaises(PagoRechazado):
+            self._pagar(60000)
+        self.assertFalse(Suscripcion.objects.exists())
+        self.assertFalse(Factura.objects.exists())
+        self.assertFalse(PrimeraCompra.objects.exists())
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_disponibles, 50000)
+
+    def test_vista_pasarela(self):
+        self.client.force_login(self.user)
+        sesion = self.client.session
+        sesion['plan_id'], sesion['email_servicio'] = self.plan.pk, 'k@x.co'
+        sesion.save()
+        respuesta = self.client.post('/user/pasarela-pago/', dict(
+            self.FACTURACION, metodo_pago='tarjeta', usar_puntos='on', puntos_a_usar='200000'
+        ))
+        self.assertRedirects(respuesta, '/user/pasarela-pago/', fetch_redirect_response=False)
+        self.assertFalse(Suscripcion.objects.exists())
+
+        respuesta = self.client.post('/user/pasarela-pago/', dict(self.FACTURACION, metodo_pago='tarjeta'))
+        self.assertRedirects(respuesta, '/user/dashboard/', fetch_redirect_response=False)
+        self.assertEqual(Suscripcion.objects.get().puntos_otorgados, 100)
+        # La confirmación queda en la bandeja de salida, no se envía en la petición
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(CorreoPendiente.objects.get().destinatarios, ['k@x.co'])
+
+
+class IdempotenciaComprasTests(TestCase):
+    """Un doble envío del formulario de compra se procesa una sola vez"""
+
+    def setUp(self):
+        self.plan = crear_plan('Paramount', precio=1000)
+        ConfiguracionRecompensa.objects.create(puntos_por_peso=10)
+        self.user = User.objects.create_user('luis', password='x')
+        acreditar_puntos(self.user.perfil.pk, 15000, 'Saldo inicial')
+        self.client.force_login(self.user)
+
+    def test_doble_envio_pasarela(self):
+        sesion = self.client.session
+        sesion['plan_id'], sesion['email_servicio'] = self.plan.pk, 'l@x.co'
+        sesion.save()
+        datos = {
+            'nombre_completo': 'Luis', 'telefono': '300', 'direccion': 'Calle 2', 'correo': 'l@x.co',
+            'metodo_pago': 'tarjeta', 'usar_puntos': 'on', 'puntos_a_usar': '4000',
+            'clave_idempotencia': 'abc123',
+        }
+        primera = self.client.post('/user/pasarela-pago/', datos)
+        # La sesión ya se limpió: la repetición solo lee la respuesta guardada
+        with self.assertNumQueries(3):  # sesión, usuario y la clave
+            segunda = self.client.post('/user/pasarela-pago/', datos)
+
+        self.assertRedirects(primera, '/user/dashboard/', fetch_redirect_response=False)
+        self.assertRedirects(segunda, '/user/dashboard/', fetch_redirect_response=False)
+        self.assertEqual(Suscripcion.objects.count(), 1)
+        self.assertEqual(Factura.objects.count(), 1)
+        self.assertEqual(TransaccionPuntos.objects.filter(tipo='canjeado').count(), 1)
+        self.assertEqual(ClaveIdempotencia.objects.get().estado, 'completada')
+
+    def test_doble_envio_pago_con_puntos(self):
+        datos = {
+            'pagar_con_puntos': 'true', 'nombre_completo': 'Luis', 'correo': 'l@x.co',
+            'nombre_usuario_app': 'luis', 'telefono': '3001234567', 'servicio': self.plan.servicio_id,
+            'plan': self.plan.pk, 'monto_pagado': '1000', 'clave_idempotencia': 'xyz789',
+        }
+        for _ in range(2):
+            respuesta = self.client.post('/user/registrar-compra/', datos)
+            self.assertRedirects(respuesta, '/user/dashboard/', fetch_redirect_response=False)
+
+        self.assertEqual(RegistroCompra.objects.count(), 1)
+        self.assertEqual(Suscripcion.objects.count(), 1)
+        self.user.perfil.refresh_from_db()
+        self.assertEqual(self.user.perfil.puntos_disponibles, 5000)
+
+    def test_pago_rechazado_no_consume_la_clave(self):
+        datos = {
+            'pagar_con_puntos': 'true', 'nombre_completo': 'Luis', 'correo': 'l@x.co',
+            'nombre_usuario_app': 'luis', 'telefono': '3001234567', 'servicio': self.plan.servicio_id,
+            'plan': self.plan.pk, 'monto_pagado': '5000', 'clave_idempotencia': 'sin-saldo',
+        }
+        respuesta = self.client.post('/user/registrar-compra/', datos)
+        self.assertRedirects(respuesta, '/user/registrar-compra/', fetch_redirect_response=False)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+
+class BackendSMTPCaido(BaseEmailBackend):
+    """Servidor SMTP de prueba que nunca acepta conexiones"""
+
+    def open(self):
+        raise SMTPServerDisconnected('Conexión rechazada')
+
+    def send_messages(self, email_messages):
+        raise SMTPServerDisconnected('Conexión rechazada')
+
+
+class BackendRechazaRebote(LocmemEmailBackend):
+    """Servidor SMTP de prueba que rechaza un destinatario concreto"""
+
+    def send_messages(self, messages):
+        for mensaje in messages:
+            if 'rebote@x.co' in mensaje.to:
+                raise SMTPRecipientsRefused({'rebote@x.co': (550, b'No existe')})
+        return super().send_messages(messages)
+
+
+class CorreosPendientesTests(TestCase):
+    """Bandeja de salida y worker enviar_correos"""
+
+    def test_envia_y_marca_como_enviado(self):
+        for i in range(3):
+            encolar_correo(f'Asunto {i}', 'Cuerpo', [f'u{i}@x.co'])
+
+        salida = StringIO()
+        call_command('enviar_correos', lote=2, stdout=salida)
+
+        self.assertIn('Correos enviados: 3', salida.getvalue())
+        self.assertEqual(sorted(m.subject for m in mail.outbox), ['Asunto 0', 'Asunto 1', 'Asunto 2'])
+        self.assertFalse(CorreoPendiente.objects.exclude(estado='enviado').exists())
+
+        call_command('enviar_correos', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(EMAIL_BACKEND='core_user.tests.BackendRechazaRebote')
+    def test_un_destinatario_rechazado_no_frena_el_lote(self):
+        encolar_correo('Malo', 'Cuerpo', ['rebote@x.co'])
+        encolar_correo('Bueno', 'Cuerpo', ['ok@x.co'])
+
+        self.assertEqual(enviar_pendientes(), (1, 1, 0))
+        self.assertEqual([m.subject for m in mail.outbox], ['Bueno'])
+        malo = CorreoPendiente.objects.get(asunto='Malo')
+        self.assertEqual((malo.estado, malo.intentos), ('pendiente', 1))
+        self.assertIn('SMTPRecipientsRefused', malo.ultimo_error)
+
+    @override_settings(EMAIL_BACKEND='core_user.tests.BackendSMTPCaido')
+    def test_reintentos_con_espera_y_dead_letter(self):
+        correo = encolar_correo('Asunto', 'Cuerpo', ['u@x.co'])
+
+        self.assertEqual(enviar_pendientes(max_intentos=2), (0, 1, 0))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('pendiente', 1))
+        self.assertGreater(correo.proximo_intento, timezone.now())
+
+        # Mientras corre la espera, el worker no lo vuelve a tomar
+        self.assertEqual(enviar_pendientes(max_intentos=2), (0, 0, 0))
+
+        CorreoPendiente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now())
+        self.assertEqual(enviar_pendientes(max_intentos=2), (0, 0, 1))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('fallido', 2))
+
+    @override_settings(EMAIL_BACKEND='core_user.tests.BackendSMTPCaido')
+    def test_checkout_no_depende_del_servidor_de_correo(self):
+        plan = crear_plan('Crunchyroll')
+        user = User.objects.create_user('marta', password='x')
+        self.client.force_login(user)
+        sesion = self.client.session
+        sesion['plan_id'], sesion['email_servicio'] = plan.pk, 'm@x.co'
+        sesion.save()
+        respuesta = self.client.post('/user/pasarela-pago/', {
+            'nombre_completo': 'Marta', 'telefono': '300', 'direccion': 'Calle 3', 'correo': 'm@x.co',
+            'metodo_pago': 'pse',
+        })
+        self.assertRedirects(respuesta, '/user/dashboard/', fetch_redirect_response=False)
+        self.assertEqual(CorreoPendiente.objects.get().estado, 'pendiente')
+
+
+class CorreosPendientesConcurrenciaTests(TransactionTestCase):
+    """Varios workers en paralelo nunca envían dos veces el mismo correo"""
+
+    def test_workers_concurrentes(self):
+        for i in range(30):
+            encolar_correo(f'Asunto {i}', 'Cuerpo', [f'u{i}@x.co'])
+
+        resultado = enviar_pendientes(tamano_lote=4, concurrencia=3)
+
+        self.assertEqual(resultado, (30, 0, 0))
+        self.assertEqual(sorted(m.subject for m in mail.outbox), sorted(f'Asunto {i}' for i in range(30)))
+        self.assertEqual(CorreoPendiente.objects.filter(estado='enviado').count(), 30)
+
+
+class NumeracionFacturasTests(TestCase):
+    """Numeración de facturas por bloques reservados en la tabla Secuencia"""
+
+    def setUp(self):
+        descartar_bloques()
+
+    def test_bloque_sin_consultas_y_monotono(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            primero = siguiente_numero('prueba', tamano_bloque=5)
+        with self.assertNumQueries(0):
+            siguientes = [siguiente_numero('prueba', tamano_bloque=5) for _ in range(4)]
+        self.assertEqual(siguientes, list(range(primero + 1, primero + 5)))
+        # Agotado el bloque se reserva el siguiente
+        self.assertEqual(siguiente_numero('prueba', tamano_bloque=5), primero + 5)
+
+    def test_bloques_reservados_a_la_vez_se_usan_todos_en_orden(self):
+        # Dos hilos agotaron la memoria y reservaron un bloque cada uno
+        clave, pid = ('default', 'prueba'), os.getpid()
+        numeracion._publicar(clave, numeracion.Bloque(pid, 12, 15))
+        numeracion._publicar(clave, numeracion.Bloque(pid, 7, 10))
+        with self.assertNumQueries(0):
+            numeros = [siguiente_numero('prueba', tamano_bloque=5) for _ in range(8)]
+        self.assertEqual(numeros, [7, 8, 9, 10, 12, 13, 14, 15])
+
+    def test_numeros_unicos_pero_no_siempre_crecientes(self):
+        # Un bloque menor confirmado después se entrega antes que el resto del mayor
+        clave, pid = ('default', 'prueba'), os.getpid()
+        numeracion._publicar(clave, numeracion.Bloque(pid, 12, 13))
+        primero = siguiente_numero('prueba', tamano_bloque=5)
+        numeracion._publicar(clave, numeracion.Bloque(pid, 7, 8))
+        numeros = [primero] + [siguiente_numero('prueba', tamano_bloque=5) for _ in range(3)]
+        self.assertEqual(numeros, [12, 7, 8, 13])
+
+    def test_bloque_de_transaccion_revertida_no_se_usa(self):
+        class Revertir(Exception):
+            pass
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(Revertir):
+                with transaction.atomic():
+                    perdido = siguiente_numero('prueba', tamano_bloque=5)
+                    raise Revertir
+        # La secuencia volvió atrás y el resto del bloque nunca se publicó
+        self.assertEqual(siguiente_numero('prueba', tamano_bloque=5), perdido)
+
+    def test_factura_recibe_numero_de_la_secuencia(self):
+        plan = crear_plan()
+        user = User.objects.create_user('nora', password='x')
+        suscripcion = Suscripcion.objects.create(
+            usuario=user, plan=plan, fecha_inicio=timezone.now().date(),
+            metodo_pago='tarjeta', monto_pagado=20000, email_servicio='n@x.co'
+        )
+        factura = Factura.objects.create(
+            suscripcion=suscripcion, nombre_completo='Nora', telefono='300', direccion='Calle 4',
+            correo='n@x.co', metodo_pago='tarjeta', monto_total=20000
+        )
+        self.assertRegex(factura.numero_factura, r'^FAC-\d{10}$')
+
+
+class NumeracionFacturasConcurrenciaTests(TransactionTestCase):
+    """Benchmark de numeración con varios procesos"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos en archivo o PostgreSQL')
+
+    def test_sin_colisiones_entre_procesos(self):
+        salida = StringIO()
+        call_command('benchmark_numeracion_facturas', procesos=3, numeros=40, bloque=7, stdout=salida)
+
+        self.assertIn('Números asignados: 120', salida.getvalue())
+        self.assertIn('Monótonos por proceso: sí', salida.getvalue())
+        self.assertIn('Colisiones: 0', salida.getvalue())
+
+
+def crear_factura(usuario, plan, **campos):
+    suscripcion = Suscripcion.objects.create(
+        usuario=usuario, plan=plan, fecha_inicio=timezone.now().date(), estado='activa',
+        metodo_pago='tarjeta', monto_pagado=plan.precio, email_servicio='f@x.co'
+    )
+    datos = dict(
+        nombre_completo='Olga', telefono='300', direccion='Calle 5', correo='o@x.co',
+        metodo_pago='tarjeta', monto_total=plan.precio, pagado=True, fecha_pago=timezone.now()
+    )
+    datos.update(campos)
+    return Factura.objects.create(suscripcion=suscripcion, **datos)
+
+
+class MediaTemporalMixin:
+    """Guarda los archivos generados en un directorio temporal"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+
+class FacturasPdfTests(MediaTemporalMixin, TestCase):
+    """PDF de facturas con caché por huella de contenido"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('olga', password='x')
+        self.factura = crear_factura(self.user, crear_plan())
+
+    def test_reutiliza_el_pdf_mientras_la_factura_no_cambie(self):
+        ruta, generado = generar_pdf(self.factura)
+        self.assertTrue(generado)
+        with default_storage.open(ruta, 'rb') as archivo:
+            self.assertEqual(archivo.read(4), b'%PDF')
+
+        factura = Factura.objects.get(pk=self.factura.pk)
+        self.assertEqual(generar_pdf(factura), (ruta, False))
+
+        factura.direccion = 'Calle 6'
+        factura.save()
+        nueva, generado = generar_pdf(factura)
+        self.assertTrue(generado)
+        self.assertNotEqual(nueva, ruta)
+        self.assertEqual(nueva, ruta_pdf(factura.pdf_huella))
+        self.assertFalse(default_storage.exists(ruta))
+
+    @override_settings(SEGUNDO_PLANO_WORKERS=0)
+    def test_checkout_programa_el_pdf(self):
+        plan = crear_plan('Vix')
+        with self.captureOnCommitCallbacks(execute=True):
+            _, factura = procesar_pago(
+                self.user, self.user.perfil, plan, None,
+                {'nombre_completo': 'Olga', 'telefono': '300', 'direccion': 'Calle 5', 'correo': 'o@x.co'},
+                'pse', 0, 'o@x.co'
+            )
+        factura.refresh_from_db()
+        self.assertTrue(default_storage.exists(factura.pdf.name))
+
+    def test_descarga(self):
+        self.client.force_login(self.user)
+        respuesta = self.client.get(f'/user/factura/{self.factura.pk}/pdf/')
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(respuesta.streaming_content)[:4], b'%PDF')
+
+        otro = User.objects.create_user('pablo', password='x')
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(f'/user/factura/{self.factura.pk}/pdf/').status_code, 404)
+
+
+class FacturasPdfBackfillTests(MediaTemporalMixin, TransactionTestCase):
+    """Generación masiva de PDF históricos con un pool de procesos"""
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos en archivo o PostgreSQL')
+
+    def test_backfill_en_paralelo(self):
+        user = User.objects.create_user('quique', password='x')
+        plan = crear_plan()
+        for _ in range(5):
+            crear_factura(user, plan)
+
+        salida = StringIO()
+        call_command('generar_facturas_pdf', workers=2, lote=2, stdout=salida)
+        self.assertIn('Facturas procesadas: 5/5', salida.getvalue())
+        self.assertIn('PDF generados: 5', salida.getvalue())
+        self.assertFalse(Factura.objects.filter(pdf_huella='').exists())
+
+        salida = StringIO()
+        call_command('generar_facturas_pdf', workers=1, stdout=salida)
+        self.assertIn('PDF reutilizados de la caché: 5', salida.getvalue())
+
+
+class LedgerPuntosConcurrenciaTests(TransactionTestCase):
+    """Estrés con hilos: ningún débito concurrente puede gastar dos veces"""
+
+    HILOS = 8
+    OPERACIONES = 40
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requiere una base de datos en archivo o PostgreSQL')
+        self.perfil = User.objects.create_user('beto', password='x').perfil
+        acreditar_puntos(self.perfil.pk, 100)
+
+    def _en_hilo(self, funcion, *args):
+        try:
+            return funcion(*args)
+        finally:
+            connections.close_all()
+
+    def test_debitos_concurrentes_sin_doble_gasto(self):
+        with ThreadPoolExecutor(max_workers=self.HILOS) as pool:
+            resultados = list(pool.map(
+                lambda _: self._en_hilo(debitar_puntos, self.perfil.pk, 10, 'Canje'),
+                range(self.OPERACIONES)
+            ))
+
+        exitosos = [r for r in resultados if r is not None]
+        self.assertEqual(len(exitosos), 10)
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_disponibles, 0)
+        self.assertEqual(
+            TransaccionPuntos.objects.filter(perfil=self.perfil, tipo='canjeado').count(), 10
+        )
+
+    def test_abonos_concurrentes_sin_actualizaciones_perdidas(self):
+        with ThreadPoolExecutor(max_workers=self.HILOS) as pool:
+            list(pool.map(
+                lambda _: self._en_hilo(acreditar_puntos, self.perfil.pk, 5, 'Bono'),
+                range(self.OPERACIONES)
+            ))
+
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos_totales, 100 + 5 * self.OPERACIONES)
+        self.assertEqual(self.perfil.puntos_disponibles, 100 + 5 * self.OPERACIONES)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dashboard'}})
+class DashboardPlanesAsequiblesTests(TestCase):
+    """El dashboard lista los planes pagables con el saldo, desde el índice en memoria"""
+
+    def setUp(self):
+        ConfiguracionRecompensa.objects.create(puntos_por_peso=10)
+        categoria = CategoriaStreaming.objects.create(nombre='Música')
+        servicio = ServicioStreaming.objects.create(
+            nombre='Spotify', categoria=categoria, descripcion='Música', sitio_web='https://spotify.com'
+        )
+        self.barato = PlanSuscripcion.objects.create(servicio=servicio, nombre='Individual', precio=100)
+        self.medio = PlanSuscripcion.objects.create(servicio=servicio, nombre='Duo', precio=200)
+        PlanSuscripcion.objects.create(servicio=servicio, nombre='Familiar', precio=900)
+        self.usuario = User.objects.create_user('ana', password='x')
+        PerfilUsuario.objects.filter(user=self.usuario).update(puntos_disponibles=2500)
+        self.client.force_login(self.usuario)
+
+    def test_planes_de_mayor_valor_primero(self):
+        respuesta = self.client.get('/user/dashboard/')
+        self.assertEqual([p.id for p in respuesta.context['planes_asequibles']], [self.medio.pk, self.barato.pk])
+        self.assertContains(respuesta, 'Spotify - Duo')
+        self.assertNotContains(respuesta, 'Spotify - Familiar')
+
+
+def _png_valido(ancho=32, alto=16):
+    buffer = BytesIO()
+    Image.new('RGB', (ancho, alto), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PDF_VALIDO = b'%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+
+
+class ValidadorComprobanteTests(TestCase):
+    """Validación incremental de comprobantes, bloque a bloque"""
+
+    def _validar(self, contenido, bloque=7):
+        validador = ValidadorComprobante()
+        for inicio in range(0, len(contenido), bloque):
+            validador.alimentar(contenido[inicio:inicio + bloque])
+        return validador.finalizar()
+
+    def _imagen(self, formato, **opciones):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), (10, 120, 200)).save(buffer, formato, **opciones)
+        return buffer.getvalue()
+
+    def test_formatos_validos_con_cualquier_tamano_de_bloque(self):
+        archivos = {
+            'PNG': _png_valido(),
+            'JPEG': self._imagen('JPEG', quality=80),
+            'WEBP': self._imagen('WEBP'),
+            'PDF': PDF_VALIDO,
+        }
+        for formato, contenido in archivos.items():
+            for bloque in (1, 7, 64 * 1024):
+                with self.subTest(formato=formato, bloque=bloque):
+                    self.assertEqual(self._validar(contenido, bloque), formato)
+
+    def test_rechaza_archivos_danados_o_maliciosos(self):
+        png = _png_valido()
+        jpeg = self._imagen('JPEG')
+        casos = {
+            'truncado': png[:-10],
+            'crc': png[:20] + bytes([png[20] ^ 0xFF]) + png[21:],
+            'poliglota': jpeg + b'PK\x03\x04' + b'\x00' * 64,
+            'ejecutable': b'MZ\x90\x00\x03\x00\x00\x00' + b'\x00' * 64,
+            'pdf_javascript': PDF_VALIDO.replace(b'/Catalog', b'/Catalog /OpenAction << /S /JavaScript /JS (x) >>'),
+            'pdf_javascript_escapado': PDF_VALIDO.replace(b'/Catalog', b'/Catalog /OpenAction << /S /J#61vaScript /J#53 (x) >>'),
+            'pdf_launch_escapado': PDF_VALIDO.replace(b'/Catalog', b'/Catalog /OpenAction << /S /#4c#61#75#6e#63#68 >>'),
+            'pdf_incompleto': PDF_VALIDO[:-7],
+        }
+        for nombre, contenido in casos.items():
+            with self.subTest(nombre):
+                with self.assertRaises(ComprobanteInvalido):
+                    self._validar(contenido)
+
+    def test_pdf_con_nombres_escapados_inofensivos(self):
+        contenido = PDF_VALIDO.replace(b'/Catalog', b'/Catalog /Lang (es) /Mi#20Nombre /J#61va')
+        for bloque in (1, 7, 64 * 1024):
+            with self.subTest(bloque=bloque):
+                self.assertEqual(self._validar(contenido, bloque), 'PDF')
+
+    def test_acepta_relleno_y_trailers_despues_del_fin(self):
+        jpeg = self._imagen('JPEG')
+        casos = {
+            'png_relleno': ('PNG', _png_valido() + b'\x00' * 300),
+            'jpeg_relleno': ('JPEG', jpeg + b'\x00' * 300),
+            'jpeg_trailer_fabricante': ('JPEG', jpeg + b'\x00\x00SEFH' + bytes(range(1, 200)) + b'SEFT'),
+        }
+        for nombre, (formato, contenido) in casos.items():
+            for bloque in (1, 7, 64 * 1024):
+                with self.subTest(nombre, bloque=bloque):
+                    self.assertEqual(self._validar(contenido, bloque), formato)
+
+    def test_rechaza_colas_peligrosas_o_grandes(self):
+        png = _png_valido()
+        jpeg = self._imagen('JPEG')
+        casos = {
+            'png_texto': png + b'\x00\x00hola',
+            'jpeg_ejecutable': jpeg + b'\x00' * 16 + b'MZ\x90\x00',
+            'jpeg_pdf': jpeg + b'trailer %PDF-1.4',
+            'jpeg_script': jpeg + b'<SCRIPT>alert(1)</SCRIPT>',
+            'jpeg_cola_grande': jpeg + b'\x01' * (MAX_COLA + 1),
+        }
+        for nombre, contenido in casos.items():
+            for bloque in (3, 64 * 1024):
+                with self.subTest(nombre, bloque=bloque):
+                    with self.assertRaisesMessage(ComprobanteInvalido, 'después del final'):
+                        self._validar(contenido, bloque)
+
+    def test_rechaza_dimensiones_gigantes_antes_de_los_datos(self):
+        ihdr = struct.pack('>IIBBBBB', 100000, 100000, 8, 2, 0, 0, 0)
+        inicio = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+        with self.assertRaisesMessage(ComprobanteInvalido, '100000x100000'):
+            ValidadorComprobante().alimentar(inicio)
+
+    def test_corta_en_cuanto_supera_el_tamano(self):
+        validador = ValidadorComprobante(tamano_maximo=1000)
+        validador.alimentar(PDF_VALIDO)
+        with self.assertRaisesMessage(ComprobanteInvalido, '5MB'):
+            validador.alimentar(b'0' * 1000)
+
+    def test_validador_del_modelo(self):
+        self.assertIsNotNone(validate_file_size_and_content(SimpleUploadedFile('r.pdf', PDF_VALIDO)))
+        with self.assertRaises(ValidationError):
+            validate_file_size_and_content(SimpleUploadedFile('r.pdf', b'%PDF-1.4\nsin fin'))
+
+
+class SubidaComprobanteTests(MediaTemporalMixin, TestCase):
+    """El handler descarta el comprobante inválido mientras se sube"""
+
+    def setUp(self):
+        super().setUp()
+        self.plan = crear_plan('Max', precio=20000)
+        self.user = User.objects.create_user('rosa', password='x')
+        self.client.force_login(self.user)
+
+    def _enviar(self, nombre, contenido):
+        return self.client.post('/user/registrar-compra/', {
+            'nombre_completo': 'Rosa', 'correo': 'r@x.co', 'nombre_usuario_app': 'rosa',
+            'telefono': '3001234567', 'servicio': self.plan.servicio_id, 'plan': self.plan.pk,
+            'monto_pagado': '20000', 'fecha_compra': '2025-01-10',
+            'comprobante': SimpleUploadedFile(nombre, contenido),
+        })
+
+    def test_comprobante_valido_se_guarda(self):
+        respuesta = self._enviar('recibo.png', _png_valido())
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertTrue(RegistroCompra.objects.get().comprobante)
+
+    def test_comprobante_validado_en_la_subida_no_se_vuelve_a_leer(self):
+        with mock.patch('core_user.models.validar_comprobante') as revalidar:
+            respuesta = self._enviar('recibo.png', _png_valido())
+        self.assertEqual(respuesta.status_code, 302)
+        revalidar.assert_not_called()
+
+    def test_gif_no_se_acepta(self):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, 'GIF')
+        respuesta = self._enviar('recibo.gif', buffer.getvalue())
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(RegistroCompra.objects.exists())
+
+    def test_comprobante_invalido_muestra_el_error(self):
+        respuesta = self._enviar('recibo.png', _png_valido() + b'<script>alert(1)</script>')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFormError(
+            respuesta.context['form'], 'comprobante',
+            'El archivo PNG está corrupto o no es válido: contiene datos después del final de la imagen'
+        )
+        self.assertFalse(RegistroCompra.objects.exists())
+
+    def test_comprobante_demasiado_grande_se_corta(self):
+        respuesta = self._enviar('recibo.pdf', PDF_VALIDO + b'0' * (5 * 1024 * 1024))
+        self.assertFormError(respuesta.context['form'], 'comprobante', MENSAJE_TAMANO)
+        self.assertEqual(os.listdir(self.media), [])
+
+    def test_csrf_sigue_activo(self):
+        cliente = Client(enforce_csrf_checks=True)
+        cliente.force_login(self.user)
+        respuesta = cliente.post('/user/registrar-compra/', {'comprobante': SimpleUploadedFile('r.pdf', PDF_VALIDO)})
+        self.assertEqual(respuesta.status_code, 403)
+
+
+class BenchmarkComprobantesTests(TestCase):
+
+    def test_benchmark_clasifica_el_corpus(self):
+        salida = StringIO()
+        call_command('benchmark_comprobantes', repeticiones=1, escala=1, stdout=salida)
+        self.assertIn('Resultados incorrectos del validador: 0', salida.getvalue())
+
+
+def crear_registro_compra(usuario, plan, contenido, nombre='recibo.png'):
+    return RegistroCompra.objects.create(
+        usuario=usuario, nombre_completo=usuario.username, correo='a@x.co', nombre_usuario_app='a',
+        servicio=plan.servicio, plan=plan, monto_pagado=20000, fecha_compra='2025-01-10',
+        comprobante=SimpleUploadedFile(nombre, contenido)
+    )
+
+
+class AlmacenamientoComprobantesTests(MediaTemporalMixin, TestCase):
+    """Comprobantes guardados una vez por contenido, con índice de referencias"""
+
+    def setUp(self):
+        super().setUp()
+        self.plan = crear_plan('Max', precio=20000)
+        self.png = _png_valido()
+
+    def _registro(self, usuario, contenido, nombre='recibo.png'):
+        return crear_registro_compra(usuario, self.plan, contenido, nombre)
+
+    def _archivos(self):
+        return sorted(
+            os.path.relpath(os.path.join(raiz, nombre), self.media)
+            for raiz, _, nombres in os.walk(self.media) for nombre in nombres
+        )
+
+    def test_mismo_contenido_se_guarda_una_vez(self):
+        ana = User.objects.create_user('ana', password='x')
+        beto = User.objects.create_user('beto', password='x')
+        primero = self._registro(ana, self.png, 'captura.png')
+        segundo = self._registro(beto, self.png, 'otro nombre.PNG')
+
+        huella = hashlib.sha256(self.png).hexdigest()
+        ruta = f'comprobantes/{huella[:2]}/{huella[2:4]}/{huella}.png'
+        self.assertEqual(primero.comprobante.name, ruta)
+        self.assertEqual(segundo.comprobante.name, ruta)
+        self.assertEqual(self._archivos(), [ruta])
+
+        almacenado = ComprobanteAlmacenado.objects.get()
+        self.assertEqual((almacenado.huella, almacenado.referencias, almacenado.tamano), (huella, 2, len(self.png)))
+        self.assertEqual([r.usuario.username for r in segundo.registros_mismo_comprobante()], ['ana'])
+
+    def test_guardar_sin_cambiar_el_archivo_no_consulta_el_indice(self):
+        registro = self._registro(User.objects.create_user('ana', password='x'), self.png)
+        with self.assertNumQueries(1):
+            registro.save(update_fields=['notas_admin'])
+        self.assertEqual(ComprobanteAlmacenado.objects.get().referencias, 1)
+
+    def test_borrar_libera_y_el_comando_purga(self):
+        usuario = User.objects.create_user('ana', password='x')
+        self._registro(usuario, self.png).delete()
+        self.assertEqual(ComprobanteAlmacenado.objects.get().referencias, 0)
+
+        call_command('deduplicar_comprobantes', stdout=StringIO())
+        self.assertEqual(len(self._archivos()), 1)  # aún dentro del período de gracia
+
+        call_command('deduplicar_comprobantes', horas=0, stdout=StringIO())
+        self.assertFalse(ComprobanteAlmacenado.objects.exists())
+        self.assertEqual(self._archivos(), [])
+
+    def test_purga_respeta_registros_y_subidas_en_curso(self):
+        usuario = User.objects.create_user('ana', password='x')
+        registro = self._registro(usuario, self.png)
+        ruta = registro.comprobante.name
+        hace_dos_dias = timezone.now() - timedelta(days=2)
+        ComprobanteAlmacenado.objects.update(referencias=0, fecha_actualizacion=hace_dos_dias)
+
+        # Contador desfasado: el registro todavía usa el archivo
+        call_command('deduplicar_comprobantes', stdout=StringIO())
+        self.assertTrue(ComprobanteAlmacenado.objects.exists())
+
+        # Subida del mismo contenido que descarta su copia antes de guardar el registro
+        registro.delete()
+        ComprobanteAlmacenado.objects.update(fecha_actualizacion=hace_dos_dias)
+        os.utime(almacenamiento_comprobantes.path(ruta), (hace_dos_dias.timestamp(),) * 2)
+        self.assertEqual(almacenamiento_comprobantes.save('recibo.png', ContentFile(self.png)), ruta)
+
+        call_command('deduplicar_comprobantes', stdout=StringIO())
+        self.assertEqual(self._archivos(), [ruta])
+        # La fila se conserva: vencido el plazo, una corrida posterior lo borra
+        self.assertTrue(ComprobanteAlmacenado.objects.exists())
+        os.utime(almacenamiento_comprobantes.path(ruta), (hace_dos_dias.timestamp(),) * 2)
+        call_command('deduplicar_comprobantes', stdout=StringIO())
+        self.assertEqual(self._archivos(), [])
+        self.assertFalse(ComprobanteAlmacenado.objects.exists())
+
+    def test_migra_comprobantes_antiguos(self):
+        usuario = User.objects.create_user('ana', password='x')
+        registro = self._registro(usuario, self.png)
+        nuevo = self._registro(usuario, self.png)
+        antiguo = 'comprobantes/2025/01/recibo.png'
+        default_storage.save(antiguo, ContentFile(self.png))
+        RegistroCompra.objects.filter(pk=registro.pk).update(comprobante=antiguo, comprobante_almacenado=None)
+        ComprobanteAlmacenado.objects.update(referencias=1)
+
+        salida = StringIO()
+        call_command('deduplicar_comprobantes', stdout=salida)
+
+        registro.refresh_from_db()
+        self.assertEqual(registro.comprobante.name, nuevo.comprobante.name)
+        self.assertEqual(ComprobanteAlmacenado.objects.get().referencias, 2)
+        self.assertEqual(self._archivos(), [nuevo.comprobante.name])
+        self.assertIn('Comprobantes antiguos migrados: 1', salida.getvalue())
+
+    def test_revision_avisa_comprobante_repetido(self):
+        self._registro(User.objects.create_user('ana', password='x'), self.png)
+        sospechoso = self._registro(User.objects.create_user('beto', password='x'), self.png)
+        admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_login(admin)
+
+        respuesta = self.client.get(f'/management/compra/{sospechoso.pk}/')
+        self.assertContains(respuesta, 'Este comprobante ya fue enviado antes')
+        self.assertContains(respuesta, '<strong>ana</strong>', html=True)
+        self.assertContains(self.client.get('/management/gestionar-compras/'), 'Comprobante repetido', count=2)
+
+
+@override_settings(SEGUNDO_PLANO_WORKERS=0)
+class MiniaturasComprobantesTests(MediaTemporalMixin, TestCase):
+    """Miniaturas WebP de los comprobantes para la revisión de compras"""
+
+    def setUp(self):
+        super().setUp()
+        self.plan = crear_plan('Max', precio=20000)
+        self.usuario = User.objects.create_user('ana', password='x')
+
+    def _imagen(self, formato, tamano=(2000, 1000), **opciones):
+        buffer = BytesIO()
+        Image.new('RGB', tamano, (30, 160, 90)).save(buffer, formato, **opciones)
+        return buffer.getvalue()
+
+    def test_miniatura_y_vista_previa_reducidas(self):
+        miniatura, vista = renderizar(self._imagen('JPEG', quality=95))
+        self.assertEqual(Image.open(BytesIO(miniatura)).size, (240, 120))
+        self.assertEqual(Image.open(BytesIO(vista)).format, 'WEBP')
+        self.assertEqual(Image.open(BytesIO(vista)).size, (1200, 600))
+
+    def test_respeta_la_orientacion_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # girada 90°
+        miniatura, _ = renderizar(self._imagen('JPEG', exif=exif))
+        self.assertEqual(Image.open(BytesIO(miniatura)).size, (120, 240))
+
+    @mock.patch('core_user.miniaturas.pypdfium2', None)
+    def test_pdf_usa_la_imagen_incrustada(self):
+        miniatura, _ = renderizar(self._imagen('PDF', resolution=100))
+        self.assertEqual(Image.open(BytesIO(miniatura)).size, (240, 120))
+        with self.assertRaises(SinVistaPrevia):
+            renderizar(PDF_VALIDO)
+
+    def test_se_generan_al_guardar_un_comprobante_nuevo(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            crear_registro_compra(self.usuario, self.plan, self._imagen('PNG'))
+        self.assertEqual(len(callbacks), 1)
+        almacenado = ComprobanteAlmacenado.objects.get()
+        self.assertTrue(almacenado.miniatura.endswith(f'{almacenado.huella}-miniatura.webp'))
+        self.assertTrue(default_storage.exists(almacenado.vista_previa))
+
+        # El mismo archivo en otra compra no se vuelve a procesar
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            crear_registro_compra(User.objects.create_user('beto', password='x'), self.plan, self._imagen('PNG'))
+        self.assertEqual(callbacks, [])
+
+    def test_revision_muestra_miniaturas_y_no_el_original(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compra = crear_registro_compra(self.usuario, self.plan, self._imagen('PNG'))
+        almacenado = ComprobanteAlmacenado.objects.get()
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+        listado = self.client.get('/management/gestionar-compras/')
+        self.assertContains(listado, f'src="{almacenado.url_miniatura}"')
+        self.assertNotContains(listado, compra.comprobante.url)
+
+        detalle = self.client.get(f'/management/compra/{compra.pk}/')
+        self.assertContains(detalle, f'src="{almacenado.url_vista_previa}"')
+        self.assertNotContains(detalle, f'src="{compra.comprobante.url}"')
+        self.assertContains(detalle, f'href="{compra.comprobante.url}"')
+
+    def test_comando_completa_las_faltantes(self):
+        crear_registro_compra(self.usuario, self.plan, self._imagen('PNG'))
+        crear_registro_compra(self.usuario, self.plan, PDF_VALIDO, 'recibo.pdf')
+        salida = StringIO()
+        call_command('generar_miniaturas_comprobantes', workers=1, stdout=salida)
+        self.assertIn('Miniaturas generadas: 1', salida.getvalue())
+        self.assertIn('Sin vista previa (PDF sin imágenes): 1', salida.getvalue())
+        self.assertFalse(ComprobanteAlmacenado.objects.filter(fecha_miniaturas__isnull=True).exists())
+
+
+class SegundoPlanoTests(TestCase):
+    """Encolado de trabajo en los pools de procesos"""
+
+    @override_settings(SEGUNDO_PLANO_WORKERS=0)
+    def test_sin_workers_corre_al_confirmar_en_el_mismo_proceso(self):
+        funcion = mock.Mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo_plano.encolar('probando', funcion, [1])
+            funcion.assert_not_called()
+        funcion.assert_called_once_with([1])
+
+    @override_settings(SEGUNDO_PLANO_WORKERS=2)
+    def test_con_workers_envia_al_pool_y_registra_errores(self):
+        futuro = Future()
+        pool = mock.Mock(submit=mock.Mock(return_value=futuro))
+        with mock.patch.object(segundo_plano, '_pool', pool):
+            with self.captureOnCommitCallbacks(execute=True):
+                segundo_plano.encolar('probando', print, 'x')
+            pool.submit.assert_called_once_with(print, 'x')
+            with self.assertLogs('core_user.segundo_plano', 'ERROR') as registro:
+                futuro.set_exception(RuntimeError('falló'))
+        self.assertIn('Error probando', registro.output[0])
@@ -13,11 +13,16 @@ urlpatterns = [
     # Dashboard
     path('dashboard/', views.dashboard, name='dashboard'),
     
+    # Historial de puntos
+    path('puntos/historial/', views.historial_puntos, name='historial_puntos'),
+    path('api/puntos/historial/', views.historial_puntos_json, name='historial_puntos_json'),
+    
     # Suscripciones
     path('suscribirse/<int:plan_id>/', views.iniciar_suscripcion, name='iniciar_suscripcion'),
     path('pasarela-pago/', views.pasarela_pago, name='pasarela_pago'),
     path('renovar/<int:suscripcion_id>/', views.renovar_suscripcion, name='renovar_suscripcion'),
     path('cancelar/<int:suscripcion_id>/', views.cancelar_suscripcion, name='cancelar_suscripcion'),
+    path('factura/<int:factura_id>/pdf/', views.descargar_factura, name='descargar_factura'),
     
     # Registro de compras
     path('registrar-compra/', views.registrar_compra, name='registrar_compra'),
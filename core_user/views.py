@@ -3,14 +3,26 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, logout
 from django.contrib import messages
+from django.http import JsonResponse, FileResponse
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import Suscripcion, PerfilUsuario, Factura, RegistroCompra
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from datetime import date, timedelta
+from .models import Suscripcion, PerfilUsuario, RegistroCompra, TransaccionPuntos, Factura
 from .forms import RegistroCompraForm
-from core_public.models import PlanSuscripcion, ConfiguracionRecompensa
+from .comprobantes import ComprobanteUploadHandler
+from . import idempotencia
+from .puntos import pagina_historial
+from .primeras_compras import registrar_compras
+from .pagos import procesar_pago, PagoRechazado
+from .correos import encolar_correo
+from .facturas_pdf import generar_pdf
+from core_public.models import PlanSuscripcion
+from core_public.configuracion import configuracion_activa
+from core_public.asequibles import indice_asequibles
+from core_public.manifiesto import url_manifiesto_planes
 from core_admin.models import CorreoVerificado
 import logging
 
@@ -61,25 +73,31 @@ def dashboard(request):
         if created:
             logger.info(f'Perfil creado para usuario: {request.user.username}')
             messages.info(request, 'Tu perfil ha sido creado exitosamente.')
+        request.user.perfil = perfil  # el menú reutiliza este perfil
         
         # Optimización: usar select_related para evitar N+1 queries
         suscripciones_activas = Suscripcion.objects.filter(
             usuario=request.user,
             estado='activa'
-        ).select_related('plan__servicio')
+        ).select_related('plan__servicio', 'factura')
         
         suscripciones_pendientes = Suscripcion.objects.filter(
             usuario=request.user,
             estado='pendiente'
         ).select_related('plan__servicio')
         
-        historial_puntos = perfil.transacciones.all()[:10]
+        historial_puntos, _ = pagina_historial(perfil.pk, limite=10)
+        
+        # Planes pagables con el saldo actual, los de mayor valor primero (sin consultas)
+        indice = indice_asequibles()
+        planes_asequibles = indice.asequibles(perfil.puntos_disponibles)[::-1][:6] if indice else []
         
         context = {
             'perfil': perfil,
             'suscripciones_activas': suscripciones_activas,
             'suscripciones_pendientes': suscripciones_pendientes,
             'historial_puntos': historial_puntos,
+            'planes_asequibles': planes_asequibles,
         }
         return render(request, 'user/dashboard.html', context)
     except Exception as e:
@@ -88,13 +106,88 @@ def dashboard(request):
         return redirect('public:index')
 
 
+def _filtros_historial(request):
+    """Lee tipo, desde y hasta del querystring. Lanza ValueError si son inválidos."""
+    tipo = request.GET.get('tipo') or None
+    if tipo and tipo not in dict(TransaccionPuntos.TIPO_CHOICES):
+        raise ValueError('Tipo de transacción inválido')
+    desde = request.GET.get('desde')
+    hasta = request.GET.get('hasta')
+    return {
+        'tipo': tipo,
+        'desde': date.fromisoformat(desde) if desde else None,
+        'hasta': date.fromisoformat(hasta) if hasta else None,
+    }
+
+
+@login_required
+def historial_puntos(request):
+    """Historial completo de puntos paginado por cursor"""
+    perfil, created = PerfilUsuario.objects.get_or_create(user=request.user)
+    
+    try:
+        filtros = _filtros_historial(request)
+        transacciones, cursor_siguiente = pagina_historial(
+            perfil.pk, cursor=request.GET.get('cursor'), **filtros
+        )
+    except ValueError:
+        messages.error(request, 'Los filtros del historial no son válidos.')
+        return redirect('user:historial_puntos')
+    
+    # Querystring sin el cursor para construir el enlace a la página siguiente
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    
+    context = {
+        'perfil': perfil,
+        'transacciones': transacciones,
+        'cursor_siguiente': cursor_siguiente,
+        'es_primera_pagina': not request.GET.get('cursor'),
+        'filtros': filtros,
+        'parametros': parametros.urlencode(),
+        'tipos': TransaccionPuntos.TIPO_CHOICES,
+    }
+    return render(request, 'user/historial_puntos.html', context)
+
+
+@login_required
+def historial_puntos_json(request):
+    """Historial de puntos en JSON paginado por cursor (?cursor=...&tipo=...&desde=...&hasta=...)"""
+    perfil, created = PerfilUsuario.objects.get_or_create(user=request.user)
+    
+    try:
+        limite = min(max(int(request.GET.get('limite', 20)), 1), 100)
+        transacciones, cursor_siguiente = pagina_historial(
+            perfil.pk,
+            cursor=request.GET.get('cursor'),
+            limite=limite,
+            **_filtros_historial(request)
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'resultados': [
+            {
+                'id': t.id,
+                'tipo': t.tipo,
+                'cantidad': t.cantidad,
+                'descripcion': t.descripcion,
+                'fecha': t.fecha.isoformat(),
+            }
+            for t in transacciones
+        ],
+        'siguiente': cursor_siguiente,
+    })
+
+
 @login_required
 def iniciar_suscripcion(request, plan_id):
     """
     PASO 1: Formulario inicial para seleccionar el plan
     Aquí el usuario ingresa su correo del servicio y nombre de usuario
     """
-    plan = get_object_or_404(PlanSuscripcion, id=plan_id, activo=True)
+    plan = get_object_or_404(PlanSuscripcion.objects.select_related('servicio__logo'), id=plan_id, activo=True)
     
     if request.method == 'POST':
         email_servicio = request.POST.get('email_servicio')
@@ -137,6 +230,13 @@ def pasarela_pago(request):
     PASO 2: Pasarela de pago
     Formulario para ingresar datos de facturación y seleccionar método de pago
     """
+    if request.method == 'POST':
+        # Repetición de un pago ya enviado (doble clic o reintento)
+        clave = request.POST.get(idempotencia.CAMPO_FORMULARIO, '')
+        previa = idempotencia.buscar(request.user, clave)
+        if previa:
+            return idempotencia.respuesta_guardada(request, previa, 'user:dashboard')
+    
     plan_id = request.session.get('plan_id')
     email_servicio = request.session.get('email_servicio')
     
@@ -144,9 +244,9 @@ def pasarela_pago(request):
         messages.error(request, 'Sesión expirada. Por favor, intenta nuevamente.')
         return redirect('public:catalogo')
     
-    plan = get_object_or_404(PlanSuscripcion, id=plan_id, activo=True)
+    plan = get_object_or_404(PlanSuscripcion.objects.select_related('servicio'), id=plan_id, activo=True)
     perfil = request.user.perfil
-    config = ConfiguracionRecompensa.objects.filter(activo=True).first()
+    config = configuracion_activa()
     
     # Calcular puntos necesarios para pagar el total
     puntos_necesarios_total = 0
@@ -170,102 +270,52 @@ def pasarela_pago(request):
             messages.error(request, 'Todos los campos son obligatorios.')
             return redirect('user:pasarela_pago')
         
-        # Calcular montos
-        monto_total = plan.precio
-        valor_puntos = Decimal('0')
-        puntos_usados = 0
-        monto_pendiente = monto_total
-        metodo_pago_final = metodo_pago
-        metodo_pago_secundario = None
+        if not (usar_puntos and config):
+            puntos_a_usar = 0
         
-        if usar_puntos and puntos_a_usar > 0:
-            # Verificar que tenga los puntos
-            if puntos_a_usar > perfil.puntos_disponibles:
-                messages.error(request, 'No tienes suficientes puntos disponibles.')
-                return redirect('user:pasarela_pago')
-            
-            # Calcular valor de los puntos
-            if config:
-                valor_puntos = Decimal(puntos_a_usar) / Decimal(config.puntos_por_peso)
-                puntos_usados = puntos_a_usar
-                monto_pendiente = max(Decimal('0'), monto_total - valor_puntos)
-                
-                if monto_pendiente > 0:
-                    # Pago mixto
-                    metodo_pago_final = 'mixto'
-                    metodo_pago_secundario = metodo_pago
-                else:
-                    # Pago solo con puntos
-                    metodo_pago_final = 'puntos'
-                    metodo_pago_secundario = None
+        previa = idempotencia.reclamar(request.user, clave, 'pasarela_pago')
+        if previa is not None:
+            return idempotencia.respuesta_guardada(request, previa, 'user:dashboard')
         
-        # Verificar si es primera compra
-        es_primera = not Suscripcion.objects.filter(
-            usuario=request.user,
-            plan__servicio=plan.servicio
-        ).exists()
-        
-        # Crear la suscripción
-        suscripcion = Suscripcion.objects.create(
-            usuario=request.user,
-            plan=plan,
-            fecha_inicio=timezone.now().date(),
-            metodo_pago=metodo_pago_final,
-            monto_pagado=monto_total,
-            email_servicio=email_servicio,
-            es_primera_compra=es_primera,
-            estado='activa'  # Ahora se activa directamente
-        )
-        
-        # Crear la factura
-        factura = Factura.objects.create(
-            suscripcion=suscripcion,
-            nombre_completo=nombre_completo,
-            telefono=telefono,
-            direccion=direccion,
-            correo=correo,
-            metodo_pago=metodo_pago_final,
-            monto_total=monto_total,
-            puntos_usados=puntos_usados,
-            valor_puntos=valor_puntos,
-            monto_pendiente=monto_pendiente,
-            metodo_pago_secundario=metodo_pago_secundario,
-            pagado=True,
-            fecha_pago=timezone.now()
+        mensaje_exito = (
+            f'¡Pago confirmado! Tu suscripción a {plan.servicio.nombre} está ahora activa. '
+            f'Revisa tu correo para más detalles.'
         )
         
-        # Descontar puntos si se usaron
-        if puntos_usados > 0:
-            perfil.canjear_puntos(
-                puntos_usados,
-                f"Pago de {plan.servicio.nombre} - {plan.nombre} (Factura #{factura.numero_factura})"
-            )
-        
-        # Otorgar puntos de cashback (solo si no pagó 100% con puntos)
-        if metodo_pago_final != 'puntos':
-            puntos_cashback = plan.puntos_primera_compra if es_primera else plan.puntos_renovacion
-            perfil.agregar_puntos(
-                puntos_cashback,
-                f"Cashback por {plan.servicio.nombre} - {plan.nombre}"
-            )
-            suscripcion.puntos_otorgados = puntos_cashback
-            suscripcion.save()
-        
-        # Enviar confirmación por correo
+        # Suscripción, factura, puntos y resultado de la clave en una sola transacción
         try:
-            enviar_confirmacion_pago(factura, suscripcion, request.user)
-        except Exception as e:
-            messages.warning(request, f'Pago procesado pero no se pudo enviar el correo: {str(e)}')
+            with transaction.atomic():
+                suscripcion, factura = procesar_pago(
+                    request.user,
+                    perfil,
+                    plan,
+                    config,
+                    {
+                        'nombre_completo': nombre_completo,
+                        'telefono': telefono,
+                        'direccion': direccion,
+                        'correo': correo,
+                    },
+                    metodo_pago,
+                    puntos_a_usar,
+                    email_servicio,
+                )
+                # El correo sale por la bandeja de salida, fuera de la petición
+                encolar_confirmacion_pago(factura, suscripcion)
+                idempotencia.completar(request.user, clave, reverse('user:dashboard'), mensaje_exito)
+        except PagoRechazado as e:
+            idempotencia.liberar(request.user, clave)
+            messages.error(request, str(e))
+            return redirect('user:pasarela_pago')
+        except Exception:
+            idempotencia.liberar(request.user, clave)
+            raise
         
         # Limpiar sesión
         del request.session['email_servicio']
         del request.session['plan_id']
         
-        messages.success(
-            request,
-            f'¡Pago confirmado! Tu suscripción a {plan.servicio.nombre} está ahora activa. '
-            f'Revisa tu correo para más detalles.'
-        )
+        messages.success(request, mensaje_exito)
         return redirect('user:dashboard')
     
     context = {
@@ -274,12 +324,13 @@ def pasarela_pago(request):
         'perfil': perfil,
         'config': config,
         'puntos_necesarios_total': puntos_necesarios_total,
+        'clave_idempotencia': idempotencia.nueva_clave(),
     }
     return render(request, 'user/pasarela_pago.html', context)
 
 
-def enviar_confirmacion_pago(factura, suscripcion, usuario):
-    """Enviar correo de confirmación de pago"""
+def encolar_confirmacion_pago(factura, suscripcion):
+    """Encolar el correo de confirmación de pago en la bandeja de salida"""
     asunto = f'Confirmación de Compra - {suscripcion.plan.servicio.nombre}'
     
     mensaje = f"""
@@ -316,12 +367,26 @@ def enviar_confirmacion_pago(factura, suscripcion, usuario):
     El equipo de StreamPoint
     """
     
-    send_mail(
-        asunto,
-        mensaje,
-        settings.DEFAULT_FROM_EMAIL,
-        [factura.correo],
-        fail_silently=False,
+    encolar_correo(asunto, mensaje, [factura.correo])
+
+
+@login_required
+def descargar_factura(request, factura_id):
+    """
+    Descarga el PDF de una factura del usuario. Normalmente ya fue generado en
+    segundo plano tras el checkout; si falta o la factura cambió, se genera ahora.
+    """
+    factura = get_object_or_404(
+        Factura.objects.select_related('suscripcion__plan__servicio'),
+        id=factura_id,
+        suscripcion__usuario=request.user
+    )
+    ruta, _ = generar_pdf(factura)
+    return FileResponse(
+        default_storage.open(ruta, 'rb'),
+        as_attachment=True,
+        filename=f'{factura.numero_factura}.pdf',
+        content_type='application/pdf'
     )
 
 
@@ -364,16 +429,37 @@ def cancelar_suscripcion(request, suscripcion_id):
 
 
 @login_required
+@csrf_exempt
 def registrar_compra(request):
     """
     Formulario para que los usuarios registren sus compras manualmente.
     El admin las revisa y aprueba para otorgar puntos.
     Si pagar_con_puntos=true, procesa el pago automáticamente con puntos.
     """
+    # El comprobante se valida mientras llega. El handler tiene que agregarse
+    # antes de que se lea request.POST, por eso el chequeo CSRF (que lo lee)
+    # va en _registrar_compra y no aquí.
+    request.upload_handlers.insert(0, ComprobanteUploadHandler(request))
+    return _registrar_compra(request)
+
+
+@csrf_protect
+def _registrar_compra(request):
     pagar_con_puntos = request.GET.get('pagar_con_puntos') == 'true' or request.POST.get('pagar_con_puntos') == 'true'
+    clave = request.POST.get(idempotencia.CAMPO_FORMULARIO, '')
+    
+    if request.method == 'POST' and pagar_con_puntos:
+        # Repetición de un pago con puntos ya enviado
+        previa = idempotencia.buscar(request.user, clave)
+        if previa:
+            return idempotencia.respuesta_guardada(request, previa, 'user:dashboard')
     
     if request.method == 'POST':
-        form = RegistroCompraForm(request.POST, request.FILES, user=request.user, pagar_con_puntos=pagar_con_puntos)
+        form = RegistroCompraForm(
+            request.POST, request.FILES, user=request.user, pagar_con_puntos=pagar_con_puntos,
+            errores_subida=getattr(request, 'errores_subida', None),
+            comprobantes_validados=getattr(request, 'comprobantes_validados', None)
+        )
         
         if form.is_valid():
             registro = form.save(commit=False)
@@ -389,7 +475,7 @@ def registrar_compra(request):
                 try:
                     # Verificar que el usuario tenga puntos suficientes
                     perfil = PerfilUsuario.objects.get(user=request.user)
-                    config = ConfiguracionRecompensa.objects.filter(activo=True).first()
+                    config = configuracion_activa()
                     
                     if not config:
                         messages.error(request, 'Error en la configuración del sistema de puntos.')
@@ -404,45 +490,57 @@ def registrar_compra(request):
                         )
                         return redirect('user:registrar_compra')
                     
-                    # Descontar puntos
-                    perfil.usar_puntos(
-                        puntos_necesarios,
-                        f"Pago con puntos - {registro.servicio.nombre} - {registro.plan.nombre if registro.plan else 'Plan personalizado'}"
-                    )
+                    previa = idempotencia.reclamar(request.user, clave, 'pagar_con_puntos')
+                    if previa is not None:
+                        return idempotencia.respuesta_guardada(request, previa, 'user:dashboard')
                     
-                    # Marcar como aprobada automáticamente
-                    registro.estado = 'aprobada'
-                    registro.puntos_otorgados = 0  # No otorga puntos adicionales porque pagó con puntos
-                    registro.notas_admin = 'Pago procesado automáticamente con puntos.'
-                    registro.save()
+                    mensaje_exito = f'¡Pago exitoso! Se descontaron {puntos_necesarios} puntos. Tu suscripción está activa.'
                     
-                    # Crear la suscripción activa
-                    if registro.plan:
-                        from datetime import timedelta
-                        from django.utils import timezone
-                        
-                        # El modelo Suscripcion calcula automáticamente fecha_vencimiento en save()
-                        Suscripcion.objects.create(
-                            usuario=request.user,
-                            plan=registro.plan,
-                            fecha_inicio=timezone.now().date(),
-                            estado='activa',
-                            validada=True,
-                            metodo_pago='puntos',
-                            monto_pagado=registro.monto_pagado,
-                            email_servicio=registro.correo,
-                            usuario_servicio=registro.nombre_usuario_app,
-                            puntos_otorgados=0,
-                            es_primera_compra=registro.es_primera_compra,
-                            notas=f'Pago procesado automáticamente con {puntos_necesarios} puntos.'
-                        )
+                    try:
+                        with transaction.atomic():
+                            # Descontar puntos (falla si otra petición ya los gastó)
+                            if not perfil.usar_puntos(
+                                puntos_necesarios,
+                                f"Pago con puntos - {registro.servicio.nombre} - {registro.plan.nombre if registro.plan else 'Plan personalizado'}"
+                            ):
+                                raise PagoRechazado(f'No tienes suficientes puntos. Necesitas {puntos_necesarios} puntos.')
+                            
+                            # Marcar como aprobada automáticamente
+                            registro.estado = 'aprobada'
+                            registro.puntos_otorgados = 0  # No otorga puntos adicionales porque pagó con puntos
+                            registro.notas_admin = 'Pago procesado automáticamente con puntos.'
+                            registro.save()
+                            
+                            # Crear la suscripción activa
+                            suscripciones = []
+                            if registro.plan:
+                                # El modelo Suscripcion calcula automáticamente fecha_vencimiento en save()
+                                suscripciones.append(Suscripcion.objects.create(
+                                    usuario=request.user,
+                                    plan=registro.plan,
+                                    fecha_inicio=timezone.now().date(),
+                                    estado='activa',
+                                    validada=True,
+                                    metodo_pago='puntos',
+                                    monto_pagado=registro.monto_pagado,
+                                    email_servicio=registro.correo,
+                                    usuario_servicio=registro.nombre_usuario_app,
+                                    puntos_otorgados=0,
+                                    es_primera_compra=registro.es_primera_compra,
+                                    notas=f'Pago procesado automáticamente con {puntos_necesarios} puntos.'
+                                ))
+                            registrar_compras(suscripciones=suscripciones, registros=[registro])
+                            idempotencia.completar(request.user, clave, reverse('user:dashboard'), mensaje_exito)
+                    except Exception:
+                        idempotencia.liberar(request.user, clave)
+                        raise
                     
-                    messages.success(
-                        request,
-                        f'¡Pago exitoso! Se descontaron {puntos_necesarios} puntos. Tu suscripción está activa.'
-                    )
+                    messages.success(request, mensaje_exito)
                     return redirect('user:dashboard')
                     
+                except PagoRechazado as e:
+                    messages.error(request, str(e))
+                    return redirect('user:registrar_compra')
                 except PerfilUsuario.DoesNotExist:
                     messages.error(request, 'Error al procesar el pago. Perfil no encontrado.')
                     return redirect('user:registrar_compra')
@@ -489,25 +587,13 @@ def registrar_compra(request):
         
         form = RegistroCompraForm(initial=initial_data, user=request.user, pagar_con_puntos=pagar_con_puntos)
     
-    # Obtener todos los planes agrupados por servicio para JavaScript
-    from core_public.models import PlanSuscripcion
-    import json
-    planes_data = {}
-    for plan in PlanSuscripcion.objects.filter(activo=True).select_related('servicio'):
-        servicio_id = str(plan.servicio.id)
-        if servicio_id not in planes_data:
-            planes_data[servicio_id] = []
-        planes_data[servicio_id].append({
-            'id': plan.id,
-            'nombre': plan.nombre,
-            'precio': float(plan.precio)
-        })
-    
     context = {
         'form': form,
         'titulo': 'Pagar con Puntos' if pagar_con_puntos else 'Registrar Compra',
         'pagar_con_puntos': pagar_con_puntos,
-        'planes_data_json': json.dumps(planes_data),
+        # Planes por servicio: JSON aparte, cacheable por el navegador
+        'url_manifiesto_planes': url_manifiesto_planes(),
+        'clave_idempotencia': idempotencia.nueva_clave(),
     }
     return render(request, 'user/registrar_compra.html', context)
 
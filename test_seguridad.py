@@ -98,7 +98,7 @@ def test_validacion_contenido_archivos():
         # Test 3.1: PDF válido
         pdf_valido = SimpleUploadedFile(
             "test.pdf",
-            b"%PDF-1.4\n" + b"test content",
+            b"%PDF-1.4\n" + b"test content\n%%EOF\n",
             content_type="application/pdf"
         )
         